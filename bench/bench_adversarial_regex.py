@@ -0,0 +1,111 @@
+"""
+Worst case time of GH_REGEX and of [BLOCK] rules on crafted messages.
+
+GH_REGEX is compared with the previous pattern on fuzzed messages of growing
+length, keeping the slowest input per length. Then for rules that backtrack
+catastrophically, the time to match them inline is measured on growing
+inputs (stopping once it passes a second) and compared with matching them
+in the isolated worker, which gives up after its time budget. The overhead
+of isolation on an ordinary message is reported last.
+
+Usage: python bench/bench_adversarial_regex.py [--fuzz N] [--timeout SECONDS]
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import safe_regex
+import utils
+
+OLD_GH_REGEX = re.compile(r"(\\)?(([a-zA-Z\d]{1}[-a-zA-Z\d]+)/)?([\-\w]+)?#(\d+)")
+LENGTHS = [500, 1000, 2000, 4000]
+# Rule, and the repeated unit and suffix of an input that makes it backtrack
+PATHOLOGICAL = [
+    (r"(a+)+$", "a", "!"),
+    (r"(a|a?)+!", "a", ""),
+    (r"(.*,){5}x", ",", ""),
+    (r".*a.*b.*c", "ab", ""),
+    (r"(?:.{1,10}){1,10}x", "a", ""),
+]
+INLINE_LIMIT = 1.0
+
+
+def _adversarial(rng: random.Random, length: int) -> str:
+    alphabet = rng.choice(["a", "a-", "ab", "a/", "a#", "1,", " a", "x"]) + rng.choice(["", "#", "!", "/", "\\"])
+    text = "".join(rng.choice(alphabet) for _ in range(length))
+    return text + rng.choice(["", "!", "#", "#x", "#1"])
+
+
+def _time(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def _gh_regex(fuzz: int):
+    rng = random.Random(0)
+    print(f"{'GH_REGEX length':>16} {'old worst ms':>13} {'new worst ms':>13}")
+    for length in LENGTHS:
+        inputs = [_adversarial(rng, length) for _ in range(fuzz)] + ["a" * (length - 2) + "#x"]
+        old = max(_time(lambda: OLD_GH_REGEX.findall(text)) for text in inputs)
+        new = max(_time(lambda: utils.GH_REGEX.findall(text)) for text in inputs)
+        print(f"{length:>16} {old * 1000:>13.2f} {new * 1000:>13.2f}")
+
+
+async def _block_rules(timeout: float):
+    print(f"\n{'[BLOCK] rule':<20} {'risk':<56} {'inline':>22} {'isolated ms':>12}")
+    for regex, unit, suffix in PATHOLOGICAL:
+        pattern = re.compile(regex)
+        # Grow slowly, an exponential rule takes twice as long per character
+        repeat = 4
+        while True:
+            text = unit * repeat + suffix
+            elapsed = _time(lambda: pattern.match(text))
+            if elapsed > INLINE_LIMIT or repeat >= 2000:
+                inline = f"{elapsed * 1000:.0f} ms at {len(text)} chars"
+                break
+            repeat += max(1, repeat // 16)
+
+        matcher = utils.BlockMatcher([("rule", regex)], "isolate", timeout)
+        await matcher.match_isolated("warm up")
+        start = time.perf_counter()
+        try:
+            await matcher.match_isolated(unit * 2000 + suffix)
+        except asyncio.TimeoutError:
+            pass
+        isolated = time.perf_counter() - start
+        await matcher.close()
+        print(f"{regex:<20} {safe_regex.risk(regex) or '':<56} {inline:>22} {isolated * 1000:>12.1f}")
+
+
+async def _overhead(timeout: float):
+    text = "has anyone tried the new sky model? my render keeps crashing at 80%"
+    matcher = utils.BlockMatcher([("rule", r"(a+)+$")], "isolate", timeout)
+    await matcher.match_isolated(text)
+    count = 2000
+    start = time.perf_counter()
+    for _ in range(count):
+        await matcher.match_isolated(text)
+    elapsed = time.perf_counter() - start
+    await matcher.close()
+    print(f"\nIsolated rules cost {elapsed / count * 1e6:.0f} us per ordinary message")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fuzz", type=int, default=200, help="Fuzzed messages per length.")
+    parser.add_argument("--timeout", type=float, default=0.05, help="Time budget of the isolated worker.")
+    args = parser.parse_args()
+
+    _gh_regex(args.fuzz)
+    asyncio.run(_block_rules(args.timeout))
+    asyncio.run(_overhead(args.timeout))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Throughput of BlockMatcher against matching the [BLOCK] regexes one at a time.
+
+Usage: python bench/bench_block_regex.py
+"""
+import os
+import random
+import re
+import string
+import sys
+import timeit
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import utils
+
+RULE_COUNTS = [10, 100, 1000]
+MESSAGES = 500
+
+
+def _word(rng: random.Random, length: int) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=length))
+
+
+def _rules(rng: random.Random, count: int):
+    """ Rules in the shapes moderators write: anchored phrases, scam domains and catch-alls. """
+    rules = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            rules.append((f"phrase{i}", rf"{_word(rng, 6)} {_word(rng, 5)}"))
+        elif kind == 1:
+            rules.append((f"domain{i}", rf"https?://(www\.)?{_word(rng, 8)}\.(com|gift|ru)"))
+        else:
+            rules.append((f"anywhere{i}", rf".*{_word(rng, 10)}"))
+    return rules
+
+
+def _messages(rng: random.Random):
+    messages = []
+    for _ in range(MESSAGES):
+        words = [_word(rng, rng.randint(2, 9)) for _ in range(rng.randint(3, 40))]
+        messages.append(" ".join(words))
+    return messages
+
+
+def _sequential_match(rules, text: str):
+    """ The matcher before BlockMatcher. """
+    for name, regex in rules:
+        if regex.match(text):
+            return name
+    return None
+
+
+def main():
+    rng = random.Random(0)
+    messages = _messages(rng)
+    print(f"{'rules':>6} {'loop msg/s':>12} {'combined msg/s':>15} {'speedup':>8}")
+    for count in RULE_COUNTS:
+        rules = _rules(rng, count)
+        compiled = [(name, re.compile(regex)) for name, regex in rules]
+        matcher = utils.BlockMatcher(rules)
+
+        # Include some hits so the result reporting is exercised
+        corpus = messages + [regex.replace(r"\.", ".").replace(".*", "")
+                             for _, regex in rules[::max(1, count // 10)] if "(" not in regex]
+        for text in corpus:
+            assert matcher.match(text) == _sequential_match(compiled, text)
+
+        sequential = min(timeit.repeat(lambda: [_sequential_match(compiled, t) for t in corpus],
+                                       number=1, repeat=3))
+        combined = min(timeit.repeat(lambda: [matcher.match(t) for t in corpus], number=1, repeat=3))
+        print(f"{count:>6} {len(corpus) / sequential:>12.0f} {len(corpus) / combined:>15.0f} "
+              f"{sequential / combined:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
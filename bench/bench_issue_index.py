@@ -0,0 +1,142 @@
+"""
+/gh autocomplete search time and issue lookups with and without the issue index.
+
+Titles are searched in indexes of growing size with typed prefixes of one to
+three words, Discord expects autocomplete answers within 3 seconds. Then an
+index of a repository on a stand-in GitHub with latency is synced from
+scratch, after some updates and without changes. Last, a stream of lookups
+of popular issues is answered by the cache alone and by the cache and index.
+
+Usage: python bench/bench_issue_index.py [--issues N] [--latency SECONDS]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import string
+import sys
+import time
+from typing import List
+
+import github
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+sys.path.insert(1, os.path.join(sys.path[0], '../test'))
+import issues
+from fake_servers import FakeGitHub
+
+SIZES = [1000, 10_000, 100_000]
+WORDS = ["render", "crash", "sky", "model", "chunk", "biome", "water", "light", "emitter", "texture", "resource",
+         "pack", "block", "entity", "memory", "octree", "launcher", "java", "fog", "cloud", "sprite", "scene",
+         "camera", "preview", "denoiser", "plugin", "shader", "glass", "leaves", "grass", "lava", "banner"]
+# Made up words make up the long tail of a title vocabulary
+RARE_WORDS = 20_000
+QUERIES = 200
+LOOKUPS = 500
+
+
+def _vocabulary(rng: random.Random) -> List[str]:
+    rare = {"".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))) for _ in range(RARE_WORDS)}
+    return WORDS + sorted(rare)
+
+
+def _title(rng: random.Random, vocabulary: List[str]) -> str:
+    # Common words are used in most titles, like in a real tracker
+    words = [rng.choice(WORDS) if rng.random() < 0.7 else rng.choice(vocabulary) for _ in range(rng.randint(3, 8))]
+    return " ".join(words).capitalize()
+
+
+def _query(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(1, 3))]
+    words[-1] = words[-1][:rng.randint(2, len(words[-1]))]
+    return " ".join(words)
+
+
+def _percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _search(rng: random.Random, vocabulary: List[str]):
+    print(f"{'indexed issues':>15} {'search p50 ms':>14} {'search p99 ms':>14}")
+    for size in SIZES:
+        index = issues.IssueIndex("org", "repo")
+        for number in range(1, size + 1):
+            index._add({"number": number, "html_url": f"https://github.com/org/repo/issues/{number}",
+                        "title": _title(rng, vocabulary), "state": "open", "user": None, "body": None,
+                        "updated_at": "2024-01-01T00:00:00Z"})
+        index._rebuild()
+        times = []
+        for _ in range(QUERIES):
+            query = _query(rng)
+            start = time.perf_counter()
+            index.search(query)
+            times.append(time.perf_counter() - start)
+        print(f"{size:>15} {statistics.median(times) * 1000:>14.2f} {_percentile(times, 0.99) * 1000:>14.2f}")
+
+
+async def _sync(fake: FakeGitHub, rng: random.Random, vocabulary: List[str], count: int) -> issues.IssueIndex:
+    index = issues.IssueIndex("org", "repo", "token", fake.url)
+    fetcher = issues.IssueFetcher(issues.IssueCache(github.Github(base_url=fake.url)), index=index)
+    session = fetcher._get_session()
+    print(f"\n{'sync':<24} {'updated':>8} {'requests':>9} {'ms':>8}")
+    for name, updates in (("from scratch", 0), (f"after {count // 100} updates", count // 100), ("unchanged", 0),
+                          ("unchanged, revalidated", 0)):
+        for number in rng.sample(range(1, count + 1), updates):
+            fake.add_issue("org", "repo", number, _title(rng, vocabulary))
+        before = fake.list_requests
+        start = time.perf_counter()
+        updated = await index.sync(session)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<24} {updated:>8} {fake.list_requests - before:>9} {elapsed * 1000:>8.1f}")
+    await fetcher.close()
+    return index
+
+
+async def _lookups(fake: FakeGitHub, index: issues.IssueIndex, rng: random.Random, count: int):
+    # Popular issues are asked for much more often than the rest
+    numbers = [min(count, int(rng.paretovariate(1.2))) for _ in range(LOOKUPS)]
+    print(f"\n{'lookups':<18} {'REST requests':>14} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, with_index in (("cache", None), ("cache + index", index)):
+        fetcher = issues.IssueFetcher(
+            issues.IssueCache(github.Github(login_or_token="token", base_url=fake.url), ttl=300, size=256),
+            index=with_index
+        )
+        before = fake.rest_requests
+        times = []
+        for number in numbers:
+            start = time.perf_counter()
+            await fetcher.get("org", "repo", number)
+            times.append(time.perf_counter() - start)
+        await fetcher.close()
+        print(f"{name:<18} {fake.rest_requests - before:>14} {statistics.median(times) * 1000:>8.2f} "
+              f"{_percentile(times, 0.99) * 1000:>8.2f}")
+
+
+async def _github(args, rng: random.Random, vocabulary: List[str]):
+    fake = FakeGitHub(latency=args.latency)
+    for number in range(1, args.issues + 1):
+        fake.add_issue("org", "repo", number, _title(rng, vocabulary), body="Steps to reproduce " * 20)
+    await fake.start()
+    try:
+        index = await _sync(fake, rng, vocabulary, args.issues)
+        await _lookups(fake, index, rng, args.issues)
+    finally:
+        await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--issues", type=int, default=5000, help="Issues in the stand-in repository.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stand-in GitHub latency in seconds.")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = _vocabulary(rng)
+    _search(rng, vocabulary)
+    asyncio.run(_github(args, rng, vocabulary))
+
+
+if __name__ == '__main__':
+    main()
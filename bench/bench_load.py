@@ -0,0 +1,285 @@
+"""
+End-to-end load test: the bot, the /gh slash command and the log channel
+together, against local stand-ins for the Discord gateway and REST API, the
+spam lists and GitHub.
+
+A stream of messages is generated (or replayed with --replay, in the format
+--record writes) and sent through the gateway at --rate messages a second:
+chatter, GitHub references, posts in an image only channel, phishing links
+and /gh commands. At --raid-at seconds a raid of --raid-size messages from
+--raid-accounts accounts arrives at once, phishing links and the same text
+posted to every channel. Discord REST calls take --rest-latency seconds and
+every --rate-limit-every th one is rate limited, GitHub answers after
+--github-latency seconds.
+
+The bot runs in a child process so the servers don't compete with it for
+the event loop. It reports the time from sending each message to the end of
+its `on_message` (p50 / p99), the throughput, and how late the event loop
+wakes up under load. /gh commands are timed until they are answered.
+
+Usage: python bench/bench_load.py [--rate N] [--duration SECONDS] [--raid-size N] ...
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(1, os.path.join(sys.path[0], '../test'))
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+from fake_servers import guild_payload, interaction_payload, message_payload, user_payload
+
+GUILD_ID = 1
+IMAGE_CHANNEL = 100
+LOG_CHANNEL = 199
+ISSUES = 500
+PHISHING = [f"free-nitro-{i}.gift" for i in range(1000)]
+CHATTER = [
+    "has anyone tried the new sky model?",
+    "my render keeps crashing at 80% any ideas",
+    "what's the best sample count for caustics",
+    "thanks, that fixed it!",
+    "which java version do I need for the launcher",
+]
+LAG_INTERVAL = 0.01
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if len(values) == 0:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+
+def _config(spam_url: str, github_url: str, channels: int) -> str:
+    return (f"[LOGGING]\n{LOG_CHANNEL} = 1\n\n"
+            f"[IMAGE_ONLY]\n{IMAGE_CHANNEL} = Images only!\n\n"
+            f"[CLIENT]\nguild_ready_timeout = 1\nintents = guilds, guild_messages, guild_reactions\n"
+            f"member_cache = none\nmax_messages = 0\n\n"
+            f"[GITHUB]\norganization = chunky-dev\nrepository = chunky\napi_url = {github_url}\n"
+            f"graphql_url = {github_url}/graphql\ndedup_window = 60\n\n"
+            f"[SPAM]\nblock = {spam_url}/list.json\nsuspicious = {spam_url}/list.json\nupdate = 86400\n"
+            f"enabled = true\n\n"
+            f"[DUPLICATES]\nchannels = 3\nwindow = 30\n\n"
+            f"[BLOCK]\ninvite = discord\\.gg/[a-z0-9]+ .*@everyone\n")
+
+
+def generate(args) -> List[dict]:
+    """ Events as {"at": seconds, "event": gateway event, "d": payload}, ids are filled in when sent. """
+    rng = random.Random(args.seed)
+    channels = [101 + i for i in range(args.channels)]
+    events = []
+    for i in range(int(args.rate * args.duration)):
+        at = i / args.rate
+        author = user_payload(10_000 + rng.randrange(args.authors))
+        kind = rng.random()
+        if kind < args.slash_share:
+            events.append({"at": at, "event": "INTERACTION_CREATE", "d": interaction_payload(
+                0, GUILD_ID, rng.choice(channels), author, "gh", {"number": str(rng.randint(1, ISSUES))})})
+            continue
+        channel = rng.choice(channels)
+        if kind < 0.15:
+            content = f"see #{rng.randint(1, ISSUES)}"
+            if rng.random() < 0.3:
+                content += f" and #{rng.randint(1, ISSUES)}"
+        elif kind < 0.20:
+            channel = IMAGE_CHANNEL
+            content = "https://i.imgur.com/render.png" if rng.random() < 0.5 else "look at my render"
+        elif kind < 0.22:
+            content = f"free nitro https://{rng.choice(PHISHING)}/claim"
+        else:
+            content = rng.choice(CHATTER)
+        events.append({"at": at, "event": "MESSAGE_CREATE",
+                       "d": message_payload(0, channel, author, content, GUILD_ID)})
+
+    raiders = [user_payload(90_000 + i) for i in range(args.raid_accounts)]
+    # Every account posts once per round, each round in the next channel
+    for i in range(args.raid_size):
+        account = i % len(raiders)
+        if account % 2 == 0:
+            content = f"@everyone free nitro for 3 months https://{rng.choice(PHISHING)}/gift"
+        else:
+            content = f"Join the giveaway, everyone wins!! ({raiders[account]['id']})"
+        channel = channels[(i // len(raiders)) % len(channels)]
+        events.append({"at": args.raid_at, "event": "MESSAGE_CREATE",
+                       "d": message_payload(0, channel, raiders[account], content, GUILD_ID)})
+
+    events.sort(key=lambda e: e["at"])
+    return events
+
+
+async def _child(args):
+    import main
+    from fake_servers import install_routes
+
+    install_routes(args.url)
+    latencies: List[float] = []
+    lags: List[float] = []
+    done = asyncio.Event()
+    last = [0.0]
+
+    bot = main.create_bot(argparse.Namespace(config=args.child, github="token", debug_guild=None))
+    on_message = bot.on_message
+
+    async def timed_on_message(message):
+        try:
+            await on_message(message)
+        finally:
+            if message.nonce is not None:
+                last[0] = time.time()
+                latencies.append(last[0] - float(message.nonce))
+                if len(latencies) == args.expected:
+                    done.set()
+
+    # discord.py looks the handler up on the instance for every event
+    bot.on_message = timed_on_message
+
+    async def lag():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            lags.append(time.perf_counter() - start - LAG_INTERVAL)
+
+    task = asyncio.get_running_loop().create_task(bot.start("token"))
+    await bot.wait_until_ready()
+    while len(main.BLOCK_LIST) == 0:
+        await asyncio.sleep(0.01)
+    monitor = asyncio.get_running_loop().create_task(lag())
+    print("ready", flush=True)
+
+    try:
+        await asyncio.wait_for(done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    monitor.cancel()
+    print(json.dumps({
+        "handled": len(latencies),
+        "last": last[0],
+        "latency": [_percentile(latencies, 0.5), _percentile(latencies, 0.99), max(latencies, default=0.0)],
+        "lag": [_percentile(lags, 0.5), _percentile(lags, 0.99), max(lags, default=0.0)],
+        "moderated": {" ".join(filter(None, labels)): value
+                      for labels, value in main.MODERATED_MESSAGES._values.items()},
+        "dropped_logs": main.BOT_LOG.dropped,
+    }), flush=True)
+    await bot.close()
+    await task
+
+
+async def _parent(args):
+    from fake_servers import FakeDiscord, FakeGitHub, FakeSpamList
+
+    if args.replay:
+        with open(args.replay) as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    else:
+        events = generate(args)
+    if args.record:
+        with open(args.record, "w") as f:
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+
+    channels = [LOG_CHANNEL, IMAGE_CHANNEL] + [101 + i for i in range(args.channels)]
+    discord_server = FakeDiscord([guild_payload(GUILD_ID, channels)], latency=args.rest_latency,
+                                 rate_limit_every=args.rate_limit_every, retry_after=args.retry_after)
+    spam_server = FakeSpamList(PHISHING)
+    github_server = FakeGitHub(latency=args.github_latency)
+    for number in range(1, ISSUES + 1):
+        github_server.add_issue("chunky-dev", "chunky", number, f"Issue {number}")
+    for server in (discord_server, spam_server, github_server):
+        await server.start()
+
+    sent: Dict[str, float] = {}
+    answered: Dict[str, float] = {}
+    discord_server.on_interaction_response = lambda i: answered.setdefault(i, time.time() - sent[i])
+
+    messages = sum(1 for e in events if e["event"] == "MESSAGE_CREATE")
+    with tempfile.NamedTemporaryFile("w", suffix=".ini", delete=False) as config:
+        config.write(_config(spam_server.url, github_server.url, args.channels))
+    try:
+        child = await asyncio.create_subprocess_exec(
+            sys.executable, sys.argv[0], "--child", config.name, "--url", discord_server.url,
+            "--expected", str(messages), "--timeout", str(args.timeout), stdout=asyncio.subprocess.PIPE
+        )
+        line = await child.stdout.readline()
+        if line.strip() != b"ready":
+            raise RuntimeError("The bot failed to start")
+
+        # Ids are snowflakes, so the bot sees sensible creation times
+        next_id = int((time.time() * 1000 - 1420070400000)) << 22
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first = time.time()
+        for sequence, event in enumerate(events):
+            delay = start + event["at"] - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_id += 1
+            data = dict(event["d"], id=str(next_id))
+            if event["event"] == "MESSAGE_CREATE":
+                data["nonce"] = repr(time.time())
+            else:
+                data["token"] = f"token{next_id}"
+                sent[data["id"]] = time.time()
+            await discord_server.dispatch(event["event"], data, 10 + sequence)
+        dispatched = time.time() - first
+
+        result = json.loads(await child.stdout.readline())
+        await child.wait()
+    finally:
+        os.unlink(config.name)
+        for server in (discord_server, spam_server, github_server):
+            await server.stop()
+
+    elapsed = result["last"] - first
+    slash = list(answered.values())
+    source = f"replayed from {args.replay}" if args.replay else f"raid of {args.raid_size} at {args.raid_at}s"
+    print(f"{len(events)} events ({messages} messages, {len(sent)} /gh) sent in {dispatched:.2f}s, {source}")
+    print(f"handled:         {result['handled']} messages in {elapsed:.2f}s ({result['handled'] / elapsed:.0f}/s)")
+    print(f"latency (ms):    p50 {result['latency'][0] * 1000:.1f}  p99 {result['latency'][1] * 1000:.1f}  "
+          f"max {result['latency'][2] * 1000:.1f}")
+    print(f"/gh (ms):        p50 {_percentile(slash, 0.5) * 1000:.1f}  p99 {_percentile(slash, 0.99) * 1000:.1f}  "
+          f"({len(slash)}/{len(sent)} answered)")
+    print(f"loop lag (ms):   p50 {result['lag'][0] * 1000:.1f}  p99 {result['lag'][1] * 1000:.1f}  "
+          f"max {result['lag'][2] * 1000:.1f}")
+    print(f"Discord REST:    {dict(discord_server.requests)}, {discord_server.rate_limited} rate limited")
+    print(f"GitHub:          {github_server.rest_requests} REST, {github_server.graphql_requests} GraphQL")
+    print(f"moderated:       {result['moderated']}, {result['dropped_logs']} log embeds dropped")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=100, help="Messages a second outside the raid.")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--authors", type=int, default=500)
+    parser.add_argument("--slash-share", type=float, default=0.02, help="Share of events that are /gh commands.")
+    parser.add_argument("--raid-at", type=float, default=5)
+    parser.add_argument("--raid-size", type=int, default=500)
+    parser.add_argument("--raid-accounts", type=int, default=25)
+    parser.add_argument("--rest-latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit-every", type=int, default=50)
+    parser.add_argument("--retry-after", type=float, default=0.25)
+    parser.add_argument("--github-latency", type=float, default=0.15)
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for the bot to catch up.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", help="Write the generated events to this file.")
+    parser.add_argument("--replay", help="Send the events of this file instead of generating them.")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    parser.add_argument("--expected", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    if args.child is not None:
+        asyncio.run(_child(args))
+    else:
+        asyncio.run(_parent(args))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,107 @@
+"""
+Per-message logging cost on the event loop thread, before and after moving
+logging to a queue drained by a background thread.
+
+Before: f-string messages written by the `logging.basicConfig` handler on
+the calling thread. After: %-style arguments queued as they are, then
+formatted as JSON and written by the listener thread. Each call logs a
+moderation decision with the full message content, at a level that is
+enabled and at one that is disabled, to a fast sink and to a slow one (a
+pipe whose reader lags, every write takes `--slow-write` seconds).
+
+Usage: python bench/bench_logging.py [--messages N] [--content-length N] [--slow-write SECONDS]
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import log
+
+
+class _Author:
+    name = "spammer"
+    discriminator = "0001"
+    id = 123456789012345678
+
+
+class _Message:
+    id = 987654321098765432
+    author = _Author()
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _SlowSink(io.TextIOBase):
+    def __init__(self, delay: float):
+        self._delay = delay
+
+    def write(self, text: str) -> int:
+        time.sleep(self._delay)
+        return len(text)
+
+
+def _before(logger: logging.Logger, message: _Message):
+    logger.info(f"Removing message {message.id} by "
+                f"{message.author.name} "
+                f"#{message.author.discriminator} "
+                f"({message.author.id}) for spam: "
+                f"{message.content}")
+
+
+def _after(logger: logging.Logger, message: _Message):
+    logger.info("Removing message %s by %s #%s (%s) for spam: %s", message.id, message.author.name,
+                message.author.discriminator, message.author.id, message.content,
+                extra={"message_id": message.id, "author_id": message.author.id, "action": "delete"})
+
+
+def _run(queued: bool, level: int, sink, message: _Message, count: int) -> float:
+    """ Microseconds per call on the calling thread. """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    listener = None
+    if queued:
+        listener = log.setup_logging(level, True, sink)
+    else:
+        logging.basicConfig(level=level, stream=sink)
+    logger = logging.getLogger("bot")
+    call = _after if queued else _before
+
+    start = time.perf_counter()
+    for _ in range(count):
+        call(logger, message)
+    elapsed = time.perf_counter() - start
+    if listener is not None:
+        listener.stop()
+    return elapsed / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--content-length", type=int, default=2000, help="Characters of message content.")
+    parser.add_argument("--slow-write", type=float, default=0.001, help="Seconds per write to the slow sink.")
+    args = parser.parse_args()
+
+    message = _Message(("free nitro https://discord-gift.example/claim " * 50)[:args.content_length])
+    devnull = open(os.devnull, "w")
+    # The slow sink makes every write wait, fewer messages keep the run short
+    slow_messages = max(1, min(args.messages, int(0.5 / args.slow_write)))
+
+    print(f"{'sink':<8} {'level':<9} {'before us/msg':>14} {'after us/msg':>13}")
+    for sink_name, sink, count in (("devnull", devnull, args.messages),
+                                   ("slow", _SlowSink(args.slow_write), slow_messages)):
+        for level_name, level in (("enabled", logging.INFO), ("disabled", logging.WARNING)):
+            before = _run(False, level, sink, message, count)
+            after = _run(True, level, sink, message, count)
+            print(f"{sink_name:<8} {level_name:<9} {before:>14.2f} {after:>13.2f}")
+    devnull.close()
+
+
+if __name__ == '__main__':
+    main()
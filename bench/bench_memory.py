@@ -0,0 +1,125 @@
+"""
+Resident memory of the client after joining a simulated large guild and
+receiving a stream of messages, for different [CLIENT] cache settings.
+
+Each setting runs in its own process against a FakeDiscord in this one,
+which sends one guild with --members members (a third of them online),
+--channels channels, then --messages messages. The child reports its RSS
+after importing everything and after the last message, the difference is
+what the client caches cost.
+
+Usage: python bench/bench_memory.py [--members N] [--channels N] [--messages N]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+
+sys.path.insert(1, os.path.join(sys.path[0], '../test'))
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+from fake_servers import guild_payload, message_payload, user_payload
+
+GUILD_ID = 1
+DONE = "bench done"
+SETTINGS = {
+    "all intents": "intents = all\nmember_cache = all\nmax_messages = 1000\n",
+    "discord.py defaults": "intents = default\nmember_cache = intents\nmax_messages = 1000\n",
+    "config.ini": "intents = guilds, guild_messages, guild_reactions\nmember_cache = none\nmax_messages = 0\n",
+}
+
+
+def _rss() -> int:
+    """ Current resident set size in bytes. """
+    gc.collect()
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak instead of current, good enough where /proc is missing
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _message(i: int, channels: int, members: int) -> dict:
+    return message_payload(1_000_000 + i, 100 + i % channels, user_payload(10_000 + i % members),
+                           f"message {i} with some chatter about renders and chunk generation", GUILD_ID)
+
+
+async def _child(url: str, setting: str):
+    import main
+    from fake_servers import install_routes
+
+    install_routes(url)
+    with tempfile.NamedTemporaryFile("w", suffix=".ini", delete=False) as config:
+        config.write(f"[CLIENT]\nguild_ready_timeout = 5\n{SETTINGS[setting]}\n"
+                     f"[GITHUB]\norganization = chunky-dev\nrepository = chunky\n\n[IMAGE_ONLY]\n")
+    try:
+        before = _rss()
+        bot = main.create_bot(argparse.Namespace(config=config.name, github=None, debug_guild=None))
+        task = asyncio.get_running_loop().create_task(bot.start("token"))
+        await bot.wait_until_ready()
+        done = asyncio.get_running_loop().create_task(bot.wait_for("message", check=lambda m: m.content == DONE))
+        await asyncio.sleep(0)
+        print("ready", flush=True)
+        await done
+        after = _rss()
+        print(json.dumps({"before": before, "after": after, "members": len(bot.get_guild(GUILD_ID).members),
+                          "messages": len(bot.cached_messages)}), flush=True)
+        await bot.close()
+        await task
+    finally:
+        os.unlink(config.name)
+
+
+async def _parent(args):
+    from fake_servers import FakeDiscord
+
+    server = FakeDiscord([guild_payload(GUILD_ID, [100 + i for i in range(args.channels)],
+                                        [10_000 + i for i in range(args.members)])])
+    await server.start()
+    messages = [_message(i, args.channels, args.members) for i in range(args.messages)]
+    done = {**_message(args.messages, args.channels, args.members), "content": DONE}
+
+    print(f"{args.members} members, {args.channels} channels, {args.messages} messages\n")
+    print(f"{'setting':<20} {'cached members':>15} {'cached msgs':>12} {'RSS MiB':>9} {'client MiB':>11}")
+    try:
+        for setting in SETTINGS:
+            child = await asyncio.create_subprocess_exec(
+                sys.executable, sys.argv[0], "--child", setting, "--url", server.url,
+                stdout=asyncio.subprocess.PIPE
+            )
+            line = await child.stdout.readline()
+            if line.strip() != b"ready":
+                raise RuntimeError(f"{setting}: child failed to start")
+            for sequence, message in enumerate(messages + [done]):
+                await server.dispatch("MESSAGE_CREATE", message, 10 + sequence)
+            result = json.loads(await child.stdout.readline())
+            await child.wait()
+            print(f"{setting:<20} {result['members']:>15} {result['messages']:>12} "
+                  f"{result['after'] / 2 ** 20:>9.1f} {(result['after'] - result['before']) / 2 ** 20:>11.1f}")
+    finally:
+        await server.stop()
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=50_000)
+    parser.add_argument("--channels", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=5_000)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        logging.basicConfig(level=logging.ERROR)
+        asyncio.run(_child(args.url, args.child))
+    else:
+        asyncio.run(_parent(args))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,92 @@
+"""
+Per-message cost of the content checks in on_message, parsing the content
+once with MessageAnalysis against rescanning it for each check.
+
+Each message runs through every check that reads the content (spam lists,
+@everyone, image link and GitHub references), as it would in an image only
+channel with spam detection on. Block regexes read the raw content either
+way and are left out. Most of the saving on messages without references
+comes from skipping the GH_REGEX scan when there is no `#`.
+
+Usage: python bench/bench_message_analysis.py
+"""
+import os
+import random
+import string
+import sys
+import timeit
+from typing import List
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import utils
+
+LENGTHS = [200, 2000, 4000]
+MESSAGES = 300
+OLD_GH_REGEX = utils.GH_REGEX
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+
+
+def _message(rng: random.Random, length: int, urls: int, refs: int) -> str:
+    words = []
+    while sum(len(w) + 1 for w in words) < length:
+        words.append(_word(rng))
+    words = " ".join(words)[:length].split(" ")
+    for _ in range(urls):
+        words.insert(rng.randrange(len(words)), f"https://{_word(rng)}.example.org/{_word(rng)}/{_word(rng)}.html")
+    for _ in range(refs):
+        words.insert(rng.randrange(len(words)), f"#{rng.randint(1, 2000)}")
+    return " ".join(words)
+
+
+def _before(content: str, block: utils.UrlListKeeper, sus: utils.UrlListKeeper):
+    for url in utils.get_urls(content):
+        if block.match(url):
+            break
+        sus.match(url)
+    _ = "@everyone" in content or "@here" in content
+    for url in utils.get_urls(content):
+        if utils._match_fname(url.path):
+            break
+    OLD_GH_REGEX.findall(content)
+
+
+def _after(content: str, block: utils.UrlListKeeper, sus: utils.UrlListKeeper):
+    analysis = utils.MessageAnalysis(content)
+    for host in analysis.hosts:
+        if block.match_host(host):
+            break
+        sus.match_host(host)
+    _ = analysis.mentions_everyone
+    for path in analysis.paths:
+        if path.endswith(utils._IMAGE_SUFFIXES):
+            break
+    _ = analysis.gh_refs
+
+
+def _time(check, messages: List[str], block, sus) -> float:
+    runs = 5
+    elapsed = min(timeit.repeat(lambda: [check(m, block, sus) for m in messages], number=1, repeat=runs))
+    return elapsed / len(messages) * 1e6
+
+
+def run():
+    rng = random.Random(0)
+    block = utils.UrlListKeeper("")
+    sus = utils.UrlListKeeper("")
+    block._lists = frozenset(f"{_word(rng)}{i}.gift" for i in range(30_000))
+    sus._lists = frozenset(f"{_word(rng)}{i}.ru" for i in range(3_000))
+
+    print(f"{'length':>6} {'urls':>5} {'refs':>5} {'before us':>10} {'after us':>10} {'saved':>7}")
+    for length in LENGTHS:
+        for urls, refs in ((0, 0), (3, 0), (3, 1)):
+            messages = [_message(rng, length, urls, refs) for _ in range(MESSAGES)]
+            before = _time(_before, messages, block, sus)
+            after = _time(_after, messages, block, sus)
+            print(f"{length:>6} {urls:>5} {refs:>5} {before:>10.2f} {after:>10.2f} {1 - after / before:>7.0%}")
+
+
+if __name__ == '__main__':
+    run()
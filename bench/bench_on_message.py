@@ -0,0 +1,149 @@
+"""
+Throughput of the Bot.on_message pipeline over synthetic message corpora.
+
+Discord and GitHub are replaced by the stand-ins from test/imposter.py, so
+only the bot's own work is measured. Reports messages per second for each
+kind of message, and the cost of each stage on the whole corpus so that
+regressions in get_urls, UrlListKeeper.match, GH_REGEX, BlockMatcher and
+is_image show up on their own.
+
+Usage: python bench/bench_on_message.py [--messages N] [--domains N]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import string
+import sys
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(1, os.path.join(sys.path[0], '../test'))
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import issues
+import main
+import utils
+
+from imposter import *
+
+BOT_ID = 1000
+IMAGE_CHANNEL = 20
+CHAT_CHANNEL = 10
+BLOCK_RULES = [
+    ("nitro", r".*free (discord )?nitro"),
+    ("gift", r".*discord\.gift/\w+"),
+    ("steam", r".*(steam|stearn)communlty"),
+]
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(_word(rng) for _ in range(words))
+
+
+def _corpus(rng: random.Random, count: int, spam_domains: List[str]) -> Dict[str, List[Callable[[], ImposterMessage]]]:
+    """ Message factories by kind, messages are mutated by the bot so each run needs fresh ones. """
+    chat = ImposterChannel(CHAT_CHANNEL)
+    images = ImposterChannel(IMAGE_CHANNEL)
+
+    def make(content: str, channel: ImposterChannel, attachments=()):
+        def factory():
+            message = ImposterMessage(content, ImposterUser(rng.randint(1, 500)), channel, rng.randint(1, 1 << 40))
+            message.attachments = [ImposterAttachment(a) for a in attachments]
+            return message
+        return factory
+
+    return {
+        "chat": [make(_sentence(rng, rng.randint(3, 60)), chat) for _ in range(count)],
+        "links": [make(f"{_sentence(rng, 5)} https://{_word(rng)}.example.org/{_word(rng)} {_sentence(rng, 5)}", chat)
+                  for _ in range(count)],
+        "spam url": [make(f"{_sentence(rng, 4)} https://www.{rng.choice(spam_domains)}/gift", chat)
+                     for _ in range(count)],
+        "@everyone": [make(f"@everyone {_sentence(rng, 8)}", chat) for _ in range(count)],
+        "block regex": [make(f"get free nitro {_sentence(rng, 6)}", chat) for _ in range(count)],
+        "image upload": [make(_sentence(rng, 3), images, [f"{_word(rng)}.png"]) for _ in range(count)],
+        "image link": [make(f"https://cdn.example.org/{_word(rng)}.jpg", images) for _ in range(count)],
+        "not image": [make(_sentence(rng, 10), images) for _ in range(count)],
+        "gh ref": [make(f"{_sentence(rng, 4)} see #{rng.randint(1, 50)}", chat) for _ in range(count)],
+        "gh refs": [make(" ".join(f"#{rng.randint(1, 50)}" for _ in range(5)), chat) for _ in range(count)],
+    }
+
+
+def _create_bot() -> main.Bot:
+    fetcher = issues.IssueFetcher(issues.IssueCache(ImposterGithub(), ttl=3600, size=256))
+    bot = main.Bot(fetcher, "chunky-dev", "chunky", [(IMAGE_CHANNEL, "Images only!")],
+                   utils.BlockMatcher(BLOCK_RULES), None)
+    bot._connection.user = ImposterUser(BOT_ID, "bot")
+    return bot
+
+
+async def _pipeline(bot: main.Bot, corpus: Dict[str, List[Callable[[], ImposterMessage]]]):
+    print(f"{'pipeline':<14} {'msg/s':>10} {'us/msg':>10}")
+    for kind, factories in corpus.items():
+        # Warm up caches (GitHub issues) before timing
+        for factory in factories[:50]:
+            await bot.on_message(factory())
+        messages = [factory() for factory in factories]
+
+        start = time.perf_counter()
+        for message in messages:
+            await bot.on_message(message)
+        elapsed = time.perf_counter() - start
+        print(f"{kind:<14} {len(messages) / elapsed:>10.0f} {elapsed / len(messages) * 1e6:>10.1f}")
+
+        # Keep the log queue from filling up between kinds
+        while main.BOT_LOG.queue_depth() > 0:
+            main.BOT_LOG._queue.get_nowait()
+
+
+def _stages(corpus: Dict[str, List[Callable[[], ImposterMessage]]]):
+    messages = [factory() for factories in corpus.values() for factory in factories]
+    urls = [url for message in messages for url in utils.get_urls(message.content)]
+    blocks = utils.BlockMatcher(BLOCK_RULES)
+
+    stages = {
+        "get_urls": lambda: [list(utils.get_urls(m.content)) for m in messages],
+        "list match": lambda: [main.BLOCK_LIST.match(url) for url in urls],
+        "GH_REGEX": lambda: [main.Bot.GH_REGEX.findall(m.content) for m in messages],
+        "BlockMatcher": lambda: [blocks.match(m.content) for m in messages],
+        "is_image": lambda: [utils.is_image(m) for m in messages],
+    }
+    print(f"\n{'stage':<14} {'us/msg':>10}   ({len(messages)} messages, {len(urls)} urls)")
+    for name, stage in stages.items():
+        start = time.perf_counter()
+        stage()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<14} {elapsed / len(messages) * 1e6:>10.2f}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000, help="Messages of each kind.")
+    parser.add_argument("--domains", type=int, default=30_000, help="Domains in the spam list.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    rng = random.Random(0)
+    spam_domains = [f"{_word(rng)}{i}.gift" for i in range(args.domains)]
+    main.BLOCK_LIST._lists = frozenset(spam_domains)
+    main.SUS_LIST._lists = frozenset()
+    main.DELETE_BLOCKED_MESSAGES.set(True)
+    corpus = _corpus(rng, args.messages, spam_domains)
+
+    async def pipeline():
+        bot = _create_bot()
+        try:
+            await _pipeline(bot, corpus)
+        finally:
+            await bot._gh.close()
+
+    asyncio.run(pipeline())
+    _stages(corpus)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,82 @@
+"""
+Startup time against local stand-in servers for Discord and the spam lists.
+
+Reports the time until the bot is created, connected to the gateway, ready,
+and until the spam lists are loaded. The spam list server is slow on purpose
+(see --delay) to show that it does not hold up connecting.
+
+Usage: python bench/bench_startup.py [--delay SECONDS] [--domains N]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(1, os.path.join(sys.path[0], '../test'))
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import main
+
+from fake_servers import FakeDiscord, FakeSpamList
+
+
+async def _startup(delay: float, domains: int, guild_ready_timeout: float):
+    discord_server = FakeDiscord()
+    await discord_server.start()
+    discord_server.install()
+    spam_server = FakeSpamList([f"spam{i}.com" for i in range(domains)], delay=delay)
+    await spam_server.start()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".ini", delete=False) as config:
+        config.write(f"[CLIENT]\nguild_ready_timeout = {guild_ready_timeout}\n\n"
+                     f"[GITHUB]\norganization = chunky-dev\nrepository = chunky\n\n"
+                     f"[SPAM]\nblock = {spam_server.url}/list.json\n"
+                     f"suspicious = {spam_server.url}/list.json\nupdate = 86400\nenabled = true\n")
+
+    try:
+        start = time.perf_counter()
+        bot = main.create_bot(argparse.Namespace(config=config.name, github=None, debug_guild=None))
+        created = time.perf_counter()
+
+        task = asyncio.get_running_loop().create_task(bot.start("token"))
+        connect = asyncio.get_running_loop().create_task(bot.wait_for("connect"))
+        await asyncio.wait([task, connect], return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            task.result()  # Startup failed, raise the error
+        connected = time.perf_counter()
+        await bot.wait_until_ready()
+        ready = time.perf_counter()
+        while len(main.BLOCK_LIST) == 0 or len(main.SUS_LIST) == 0:
+            await asyncio.sleep(0.005)
+        lists = time.perf_counter()
+
+        # Let slash command registration finish before disconnecting
+        await asyncio.sleep(0.2)
+        await bot.close()
+        await task
+    finally:
+        os.unlink(config.name)
+        await spam_server.stop()
+        await discord_server.stop()
+
+    print(f"created:         {(created - start) * 1000:8.1f} ms")
+    print(f"gateway connect: {(connected - start) * 1000:8.1f} ms")
+    print(f"ready:           {(ready - start) * 1000:8.1f} ms (guild_ready_timeout {guild_ready_timeout}s)")
+    print(f"spam lists:      {(lists - start) * 1000:8.1f} ms (server delay {delay}s, {domains} domains)")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=2.0, help="Spam list server delay in seconds.")
+    parser.add_argument("--domains", type=int, default=20_000, help="Domains in each spam list.")
+    parser.add_argument("--guild-ready-timeout", type=float, default=1.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.run(_startup(args.delay, args.domains, args.guild_ready_timeout))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,86 @@
+"""
+Time until a restarted bot can check messages against a 50k domain spam list,
+with and without the snapshot kept in [STATE] snapshot_dir.
+
+Without a snapshot the list is downloaded, parsed and built into a set (the
+download itself is not timed, it adds a round trip to GitHub). With one, the
+last list is mapped from disk and only revalidated in the background.
+
+Usage: python bench/bench_state.py [--domains N]
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import shared
+import utils
+
+TLDS = ["com", "net", "org", "gift", "ru", "xyz", "co.uk"]
+REPEAT = 20
+URL = "https://example.com/domain-list.json"
+
+
+def _random_domain(rng: random.Random) -> str:
+    label = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 14)))
+    return f"{label}.{rng.choice(TLDS)}"
+
+
+def _best(function) -> float:
+    """ Best of `REPEAT` runs, in milliseconds. """
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--domains", type=int, default=50_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    domains = sorted({_random_domain(rng) for _ in range(args.domains)})
+    body = json.dumps({"domains": domains}).encode("utf-8")
+    probe = f"cdn.{domains[len(domains) // 2]}"
+
+    def cold():
+        keeper = utils.UrlListKeeper(URL)
+        keeper._swap(frozenset(i.strip() for i in json.loads(body)["domains"]))
+        assert keeper.match_host(probe)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "block.idx")
+        writer = utils.UrlListKeeper(URL, path)
+
+        def write():
+            shared.DomainIndex.write(path, domains)
+            writer._save_meta()
+
+        def warm():
+            keeper = utils.UrlListKeeper(URL, path)
+            assert keeper.load_shared()
+            assert keeper.match_host(probe)
+            keeper.set_url("")
+
+        write_ms = _best(write)
+        cold_ms = _best(cold)
+        warm_ms = _best(warm)
+        size = os.path.getsize(path)
+
+    print(f"{len(domains)} domains, {len(body) / 2 ** 20:.1f} MiB as JSON, {size / 2 ** 20:.1f} MiB snapshot\n")
+    print(f"{'':<34} {'ms':>8}")
+    print(f"{'parse + build set (no snapshot)':<34} {cold_ms:>8.2f}")
+    print(f"{'map snapshot + first lookup':<34} {warm_ms:>8.2f}")
+    print(f"{'write snapshot (after a download)':<34} {write_ms:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Micro-benchmark of UrlListKeeper.match against the previous linear suffix scan,
+and of the same lookup in a memory-mapped shared.DomainIndex.
+
+Usage: python bench/bench_url_list.py
+"""
+import os
+import random
+import string
+import sys
+import tempfile
+import timeit
+import urllib.parse
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import shared
+import utils
+
+LIST_SIZES = [1_000, 10_000, 50_000]
+QUERIES = 1_000
+TLDS = ["com", "net", "org", "gift", "ru", "xyz", "co.uk"]
+
+
+def _random_domain(rng: random.Random) -> str:
+    label = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 14)))
+    return f"{label}.{rng.choice(TLDS)}"
+
+
+def _linear_match(domains: set, url: urllib.parse.ParseResult) -> bool:
+    """ The matcher before the label based lookup. """
+    loc = url.netloc.strip()
+    if len(loc) > 0:
+        if loc in domains:
+            return True
+        for domain in domains:
+            if loc.endswith("." + domain):
+                return True
+    return False
+
+
+def main():
+    rng = random.Random(0)
+    print(f"{'domains':>8} {'linear us/url':>14} {'labels us/url':>14} {'speedup':>8} {'mmap us/url':>12}")
+    for size in LIST_SIZES:
+        domains = {_random_domain(rng) for _ in range(size)}
+        keeper = utils.UrlListKeeper("")
+        keeper._lists = domains
+
+        # Mostly legitimate links with a few subdomains of listed hosts, like real traffic
+        listed = list(domains)
+        urls = []
+        for i in range(QUERIES):
+            if i % 20 == 0:
+                urls.append(urllib.parse.urlparse(f"https://cdn.{rng.choice(listed)}/gift"))
+            else:
+                urls.append(urllib.parse.urlparse(f"https://www.{_random_domain(rng)}/page"))
+
+        for url in urls:
+            assert keeper.match(url) == _linear_match(domains, url)
+
+        linear = timeit.timeit(lambda: [_linear_match(domains, u) for u in urls], number=1)
+        labels = min(timeit.repeat(lambda: [keeper.match(u) for u in urls], number=10, repeat=3)) / 10
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "block.idx")
+            shared.DomainIndex.write(path, domains)
+            mapped = utils.UrlListKeeper("", path)
+            mapped.load_shared()
+            for url in urls:
+                assert mapped.match(url) == keeper.match(url)
+            mmap = min(timeit.repeat(lambda: [mapped.match(u) for u in urls], number=10, repeat=3)) / 10
+            mapped.set_url("")
+
+        print(f"{size:>8} {linear / QUERIES * 1e6:>14.2f} {labels / QUERIES * 1e6:>14.2f} "
+              f"{linear / labels:>7.0f}x {mmap / QUERIES * 1e6:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,795 @@
+import asyncio
+import collections
+import concurrent.futures
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+import aiohttp
+import github
+import github.Issue
+import github.Repository
+
+import metrics
+
+IssueKey = Tuple[str, str, int]
+
+# Words of issue titles and autocomplete queries
+_WORD = re.compile(r"\w+")
+
+GITHUB_REQUESTS = metrics.Counter(
+    "bot_github_requests_total",
+    "GitHub API requests, by kind and result.",
+    ["kind", "result"]
+)
+GITHUB_RATE_LIMIT = metrics.Gauge(
+    "bot_github_rate_limit_remaining",
+    "GitHub API requests remaining in the current rate limit window."
+)
+GITHUB_RATE_LIMIT_RESET = metrics.Gauge(
+    "bot_github_rate_limit_reset_timestamp_seconds",
+    "Unix time at which the GitHub rate limit window resets."
+)
+GITHUB_COALESCED = metrics.Counter(
+    "bot_github_coalesced_total",
+    "Issue lookups that joined an identical request already in flight."
+)
+GITHUB_INDEX_LOOKUPS = metrics.Counter(
+    "bot_github_index_lookups_total",
+    "Issue lookups in the repository covered by the local issue index, by result.",
+    ["result"]
+)
+GITHUB_INDEX_SIZE = metrics.Gauge(
+    "bot_github_index_issues",
+    "Issues and pull requests in the local issue index."
+)
+
+
+def issue_key(org: str, repo: str, number: int) -> IssueKey:
+    return org.lower(), repo.lower(), int(number)
+
+
+class IssueInfo:
+    """ Snapshot of the GitHub issue / pull request fields used in embeds. """
+
+    __slots__ = ("html_url", "title", "author", "state", "body")
+
+    def __init__(self, html_url: str, title: Optional[str], author: Optional[str],
+                 state: Optional[str], body: Optional[str]):
+        self.html_url = html_url
+        self.title = title
+        self.author = author
+        self.state = state
+        self.body = body
+
+    @staticmethod
+    def from_issue(issue: github.Issue.Issue) -> "IssueInfo":
+        return IssueInfo(
+            issue.html_url,
+            issue.title,
+            issue.user.login if issue.user is not None else None,
+            issue.state,
+            issue.body
+        )
+
+    @staticmethod
+    def link(org: str, repo: str, number: int) -> "IssueInfo":
+        """ Placeholder with only a link, used when the rate limit budget is exhausted. """
+        return IssueInfo(f"https://github.com/{org}/{repo}/issues/{number}", None, None, None, None)
+
+    @property
+    def is_link(self) -> bool:
+        return self.state is None
+
+    @staticmethod
+    def from_graphql(node: dict) -> "IssueInfo":
+        # GraphQL states are OPEN, CLOSED and MERGED, the REST issue state of a merged PR is closed
+        state = node["state"].lower()
+        return IssueInfo(
+            node["url"],
+            node.get("title"),
+            (node.get("author") or {}).get("login"),
+            "closed" if state == "merged" else state,
+            node.get("body")
+        )
+
+
+class _CacheEntry:
+    __slots__ = ("issue", "info", "fetched")
+
+    def __init__(self, info: IssueInfo, fetched: float, issue: Optional[github.Issue.Issue] = None):
+        self.issue = issue
+        self.info = info
+        self.fetched = fetched
+
+
+class RateLimiter:
+    """
+    Token bucket for GitHub requests, refilled from the `X-RateLimit-*`
+    headers so that the remaining budget is spread evenly over the time left
+    until the window resets, with bursts of up to `burst` requests.
+
+    `reserve` requests (at most a tenth of the limit) are kept back for
+    commands and whatever else shares the token. Until the first response
+    has been seen every request is allowed.
+    """
+
+    # GitHub rate limit windows are an hour long
+    WINDOW = 3600.0
+
+    def __init__(self, burst: int = 10, reserve: int = 100, clock: Callable[[], float] = time.time):
+        self._burst = burst
+        self._reserve = reserve
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._known = False
+        self._tokens = float(burst)
+        self._rate = 0.0
+        self._limit = 0
+        self._reset = 0.0
+        self._last = clock()
+
+    def update(self, remaining: int, limit: int, reset: float):
+        """ Update the bucket from the rate limit reported with a response. """
+        now = self._clock()
+        budget = max(remaining - min(self._reserve, limit // 10), 0)
+        with self._lock:
+            self._known = True
+            self._limit = limit
+            self._reset = reset
+            self._rate = budget / max(reset - now, 1.0)
+            self._tokens = min(self._tokens, budget, self._burst)
+            self._last = now
+
+    def update_headers(self, headers: Mapping[str, str]):
+        """ Update the bucket from response headers, if they contain the rate limit. """
+        try:
+            self.update(int(headers["X-RateLimit-Remaining"]), int(headers["X-RateLimit-Limit"]),
+                        float(headers["X-RateLimit-Reset"]))
+        except (KeyError, ValueError):
+            pass
+
+    def exhaust(self):
+        """ Stop handing out tokens until more budget is reported, after GitHub refused a request. """
+        with self._lock:
+            self._tokens = 0.0
+            self._rate = 0.0
+
+    def acquire(self) -> bool:
+        """ Take a token, returns False if the budget is exhausted. """
+        now = self._clock()
+        with self._lock:
+            if not self._known:
+                return True
+            if now >= self._reset:
+                # New window, assume the full limit until a response says otherwise
+                self._tokens = float(self._burst)
+                self._rate = self._limit / self.WINDOW
+                self._reset = now + self.WINDOW
+            else:
+                self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class IssueCache:
+    """
+    Bounded LRU cache of GitHub repository handles and issues.
+
+    Entries younger than `ttl` seconds are served without touching the API.
+    Older entries are revalidated with a conditional request using the stored
+    ETag, which does not count against the rate limit when GitHub answers 304.
+    New lookups take a token from `limiter`, without one a link placeholder
+    is returned instead.
+    """
+
+    _LOGGER = logging.getLogger("issue_cache")
+
+    def __init__(self, gh: github.Github, ttl: float = 300.0, size: int = 256,
+                 limiter: Optional[RateLimiter] = None):
+        self._gh = gh
+        self._limiter = limiter
+        self._ttl = ttl
+        self._size = size
+        self._repos: "collections.OrderedDict[str, github.Repository.Repository]" = collections.OrderedDict()
+        self._issues: "collections.OrderedDict[IssueKey, _CacheEntry]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def _get_repo(self, org: str, repo: str) -> github.Repository.Repository:
+        name = f"{org}/{repo}"
+        with self._lock:
+            handle = self._repos.get(name)
+            if handle is not None:
+                self._repos.move_to_end(name)
+                return handle
+
+            # Lazy handles do not make a request, the first issue lookup validates the repo
+            handle = self._gh.get_repo(name, lazy=True)
+            self._repos[name] = handle
+            if len(self._repos) > self._size:
+                self._repos.popitem(last=False)
+            return handle
+
+    def get(self, org: str, repo: str, number: int) -> IssueInfo:
+        """
+        Get an issue / pull request. Raises `github.GithubException` on failure.
+        Once the rate limit is exhausted, stale entries are served as they are
+        and other lookups return `IssueInfo.link`.
+        """
+        key = issue_key(org, repo, number)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._issues.get(key)
+            if entry is not None:
+                self._issues.move_to_end(key)
+                if now - entry.fetched < self._ttl:
+                    self.hits += 1
+                    return entry.info
+            if entry is not None and entry.issue is not None:
+                self.revalidations += 1
+            else:
+                # Entries from GraphQL have no ETag to revalidate with
+                entry = None
+                self.misses += 1
+
+        # Network requests are made without holding the lock
+        if entry is not None:
+            try:
+                modified = entry.issue.update()
+            except github.RateLimitExceededException:
+                GITHUB_REQUESTS.inc("revalidate", "rate_limited")
+                self._exhausted()
+                return entry.info
+            except github.GithubException:
+                GITHUB_REQUESTS.inc("revalidate", "error")
+                raise
+            self._record_rate_limit()
+            if modified:
+                GITHUB_REQUESTS.inc("revalidate", "modified")
+                entry.info = IssueInfo.from_issue(entry.issue)
+            else:
+                GITHUB_REQUESTS.inc("revalidate", "not_modified")
+                with self._lock:
+                    self.hits += 1
+            entry.fetched = now
+            return entry.info
+
+        if self._limiter is not None and not self._limiter.acquire():
+            GITHUB_REQUESTS.inc("issue", "rate_limited")
+            return IssueInfo.link(org, repo, number)
+        try:
+            issue = self._get_repo(org, repo).get_issue(int(number))
+        except github.RateLimitExceededException:
+            GITHUB_REQUESTS.inc("issue", "rate_limited")
+            self._exhausted()
+            return IssueInfo.link(org, repo, number)
+        except github.GithubException:
+            GITHUB_REQUESTS.inc("issue", "error")
+            raise
+        GITHUB_REQUESTS.inc("issue", "ok")
+        self._record_rate_limit()
+        entry = _CacheEntry(IssueInfo.from_issue(issue), now, issue)
+        self._store(key, entry)
+        return entry.info
+
+    def _store(self, key: IssueKey, entry: _CacheEntry):
+        with self._lock:
+            self._issues[key] = entry
+            self._issues.move_to_end(key)
+            if len(self._issues) > self._size:
+                self._issues.popitem(last=False)
+
+    def peek(self, org: str, repo: str, number: int) -> Optional[IssueInfo]:
+        """ Get an issue / pull request only if a fresh copy is cached. """
+        key = issue_key(org, repo, number)
+        with self._lock:
+            entry = self._issues.get(key)
+            if entry is None or time.monotonic() - entry.fetched >= self._ttl:
+                return None
+            self._issues.move_to_end(key)
+            self.hits += 1
+            return entry.info
+
+    def put(self, org: str, repo: str, number: int, info: IssueInfo):
+        """ Store an issue / pull request fetched some other way, counted as a miss. """
+        with self._lock:
+            self.misses += 1
+        self._store(issue_key(org, repo, number), _CacheEntry(info, time.monotonic()))
+
+    def _record_rate_limit(self):
+        # Only read after a request, before that PyGithub would fetch the rate limit itself
+        remaining, limit = self._gh.rate_limiting
+        reset = self._gh.rate_limiting_resettime
+        GITHUB_RATE_LIMIT.set(remaining)
+        GITHUB_RATE_LIMIT_RESET.set(reset)
+        if self._limiter is not None:
+            self._limiter.update(remaining, limit, reset)
+
+    def _exhausted(self):
+        self._LOGGER.warning("GitHub rate limit exceeded, serving links until it resets.")
+        if self._limiter is not None:
+            self._limiter.exhaust()
+
+    def stats(self) -> str:
+        return (f"{len(self._issues)} issues, {self.hits} hits, "
+                f"{self.misses} misses, {self.revalidations} revalidations")
+
+
+class GraphQLResolver:
+    """
+    Resolves several issue / pull request references with a single GraphQL
+    query, using one aliased `issueOrPullRequest` field per reference.
+    GraphQL has its own rate limit, tracked by `limiter`.
+    """
+
+    _FIELDS = "url title state body author { login }"
+
+    def __init__(self, token: str, url: str = "https://api.github.com/graphql",
+                 limiter: Optional[RateLimiter] = None):
+        self._token = token
+        self._url = url
+        self.limiter = limiter
+
+    def build_query(self, refs: List[IssueKey]) -> Tuple[str, Dict[str, object]]:
+        params = []
+        fields = []
+        variables: Dict[str, object] = {}
+        for i, (org, repo, number) in enumerate(refs):
+            params.append(f"$o{i}: String!, $r{i}: String!, $n{i}: Int!")
+            fields.append(f"i{i}: repository(owner: $o{i}, name: $r{i}) {{ "
+                          f"issueOrPullRequest(number: $n{i}) {{ "
+                          f"... on Issue {{ {self._FIELDS} }} ... on PullRequest {{ {self._FIELDS} }} }} }}")
+            variables[f"o{i}"] = org
+            variables[f"r{i}"] = repo
+            variables[f"n{i}"] = int(number)
+        return f"query({', '.join(params)}) {{ {' '.join(fields)} }}", variables
+
+    async def resolve(self, session: aiohttp.ClientSession, refs: List[IssueKey]) -> \
+            Dict[int, Optional[IssueInfo]]:
+        """
+        Resolve references, keyed by their index in `refs`. References that do
+        not exist map to None, references missing from the result could not be
+        resolved and should be retried some other way. Raises
+        `aiohttp.ClientError` if the request failed.
+        """
+        query, variables = self.build_query(refs)
+        async with session.post(self._url, json={"query": query, "variables": variables},
+                                headers={"Authorization": f"bearer {self._token}"}) as res:
+            if self.limiter is not None:
+                self.limiter.update_headers(res.headers)
+            res.raise_for_status()
+            body = await res.json()
+
+        data = body.get("data") or {}
+        not_found = {error["path"][0] for error in body.get("errors") or []
+                     if error.get("type") == "NOT_FOUND" and error.get("path")}
+        results: Dict[int, Optional[IssueInfo]] = {}
+        for i in range(len(refs)):
+            alias = f"i{i}"
+            node = (data.get(alias) or {}).get("issueOrPullRequest")
+            if node is not None:
+                results[i] = IssueInfo.from_graphql(node)
+            elif alias in not_found:
+                results[i] = None
+        return results
+
+
+class IssueIndex:
+    """
+    Local copy of the embed fields of every issue and pull request of one
+    repository, so lookups and `/gh` autocomplete need no requests.
+
+    Each sync lists the issues updated since the newest one seen, the first
+    sync pages through the whole repository. A sync without changes is a
+    conditional request, which GitHub does not count against the rate limit
+    when it answers 304. Lookups are only answered while the last successful
+    sync is younger than `max_age` seconds, the titles are searched in any
+    case. If a path is given the index is loaded from and saved to that JSON
+    file, so a restart only syncs what changed meanwhile.
+    """
+
+    _LOGGER = logging.getLogger("issue_index")
+
+    # Embeds show at most the first 200 characters of the body
+    BODY_LENGTH = 200
+    PER_PAGE = 100
+
+    def __init__(self, org: str, repo: str, token: Optional[str] = None, api_url: str = "https://api.github.com",
+                 path: Optional[str] = None, limiter: Optional[RateLimiter] = None, interval: float = 300.0,
+                 max_age: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.org = org
+        self.repo = repo
+        self._key = (org.lower(), repo.lower())
+        self._token = token
+        self._url = f"{api_url.rstrip('/')}/repos/{org}/{repo}/issues"
+        self._path = path
+        self._limiter = limiter
+        self.interval = interval
+        self._max_age = max_age if max_age is not None else 3 * interval
+        self._clock = clock
+        self._issues: Dict[int, IssueInfo] = {}
+        # (number, lower case title words), newest first, and the positions of the titles with each word
+        self._titles: List[Tuple[int, str]] = []
+        self._words: Dict[str, List[int]] = {}
+        self._since: Optional[str] = None
+        self._etag: Optional[str] = None
+        self._dirty = False
+        self.synced: Optional[float] = None
+        self.requests = 0
+
+    def __len__(self):
+        return len(self._issues)
+
+    def covers(self, org: str, repo: str) -> bool:
+        return (org.lower(), repo.lower()) == self._key
+
+    @property
+    def fresh(self) -> bool:
+        return self.synced is not None and self._clock() - self.synced < self._max_age
+
+    def get(self, org: str, repo: str, number: int) -> Optional[IssueInfo]:
+        """ Get an issue / pull request of the indexed repository, None if it is not indexed or the index is stale. """
+        if not self.covers(org, repo):
+            return None
+        if not self.fresh:
+            GITHUB_INDEX_LOOKUPS.inc("stale")
+            return None
+        info = self._issues.get(int(number))
+        GITHUB_INDEX_LOOKUPS.inc("miss" if info is None else "hit")
+        return info
+
+    def search(self, query: str, limit: int = 25) -> List[Tuple[int, str]]:
+        """
+        Numbers and titles of the issues matching a query, best first. Every
+        word of the query must start the number or be part of a title word.
+        Titles starting with the query rank first, then titles where every
+        word starts a title word, newer issues first within each rank.
+        """
+        words = _WORD.findall(query.lower())
+        if len(words) == 0:
+            return [(number, self._issues[number].title or "") for number, _ in self._titles[:limit]]
+
+        # Positions of the titles containing each query word, and of those where it starts a word
+        found: List[Set[int]] = []
+        starts: List[Set[int]] = []
+        for word in words:
+            anywhere: Set[int] = set()
+            start: Set[int] = set()
+            for title_word, positions in self._words.items():
+                if word in title_word:
+                    anywhere.update(positions)
+                    if title_word.startswith(word):
+                        start.update(positions)
+            if word.isdigit():
+                numbered = {position for position, (number, _) in enumerate(self._titles)
+                            if str(number).startswith(word)}
+                anywhere |= numbered
+                start |= numbered
+            found.append(anywhere)
+            starts.append(start)
+
+        phrase = " ".join(words)
+        ranked = []
+        for position in set.intersection(*found):
+            number, title = self._titles[position]
+            if title.startswith(phrase) or len(words) == 1 and str(number).startswith(words[0]):
+                rank = 0
+            elif all(position in start for start in starts):
+                rank = 1
+            else:
+                rank = 2
+            ranked.append((rank, position))
+        return [(self._titles[position][0], self._issues[self._titles[position][0]].title or "")
+                for _, position in heapq.nsmallest(limit, ranked)]
+
+    def _add(self, item: dict):
+        body = item.get("body")
+        self._issues[int(item["number"])] = IssueInfo(
+            item["html_url"],
+            item.get("title"),
+            (item.get("user") or {}).get("login"),
+            item.get("state"),
+            body[:self.BODY_LENGTH] if body is not None else None
+        )
+        # Timestamps are ISO 8601 in UTC, they sort as strings
+        if self._since is None or item["updated_at"] > self._since:
+            self._since = item["updated_at"]
+
+    def _build(self) -> Tuple[List[Tuple[int, str]], Dict[str, List[int]]]:
+        titles = []
+        words_positions: Dict[str, List[int]] = collections.defaultdict(list)
+        for position, number in enumerate(sorted(self._issues, reverse=True)):
+            words = _WORD.findall((self._issues[number].title or "").lower())
+            titles.append((number, " ".join(words)))
+            for word in set(words):
+                words_positions[word].append(position)
+        return titles, words_positions
+
+    def _rebuild(self):
+        self._titles, self._words = self._build()
+
+    async def sync(self, session: aiohttp.ClientSession) -> int:
+        """
+        Fetch the issues updated since the last sync, returns how many were
+        updated. Raises `aiohttp.ClientError` if a request failed, the pages
+        received until then are kept. Without rate limit budget the sync is
+        skipped and the index goes stale.
+        """
+        params = {"state": "all", "sort": "updated", "direction": "asc", "per_page": str(self.PER_PAGE)}
+        # `since` is inclusive, the newest issue is always listed again so unchanged pages keep their ETag
+        if self._since is not None:
+            params["since"] = self._since
+        headers = {"Accept": "application/vnd.github.v3+json"}
+        if self._token:
+            headers["Authorization"] = f"token {self._token}"
+
+        since = self._since
+        url: Optional[str] = self._url
+        updated = 0
+        first = True
+        try:
+            while url is not None:
+                if self._limiter is not None and not self._limiter.acquire():
+                    GITHUB_REQUESTS.inc("index", "rate_limited")
+                    return updated
+                page_headers = headers
+                if first and self._etag is not None:
+                    page_headers = {**headers, "If-None-Match": self._etag}
+                self.requests += 1
+                async with session.get(url, params=params if first else None, headers=page_headers) as res:
+                    if self._limiter is not None:
+                        self._limiter.update_headers(res.headers)
+                    if res.status == 304:
+                        GITHUB_REQUESTS.inc("index", "not_modified")
+                        break
+                    if res.status in (403, 429) and res.headers.get("X-RateLimit-Remaining") == "0":
+                        GITHUB_REQUESTS.inc("index", "rate_limited")
+                        if self._limiter is not None:
+                            self._limiter.exhaust()
+                        return updated
+                    res.raise_for_status()
+                    page = await res.json()
+                    if first:
+                        self._etag = res.headers.get("ETag")
+                    # Later pages are given as full URLs including the query
+                    url = res.links.get("next", {}).get("url")
+                    url = str(url) if url is not None else None
+                GITHUB_REQUESTS.inc("index", "ok")
+                for item in page:
+                    if since is None or item["updated_at"] > since:
+                        self._add(item)
+                        updated += 1
+                first = False
+        finally:
+            if updated > 0:
+                # Half a second for 100k titles, searches use the old titles meanwhile
+                self._titles, self._words = await asyncio.get_running_loop().run_in_executor(None, self._build)
+                self._dirty = True
+                # The ETag is of a page listed since an older issue, it will not match again
+                self._etag = None
+        self.synced = self._clock()
+        return updated
+
+    def load(self):
+        if self._path is None or not os.path.exists(self._path):
+            return
+        try:
+            with open(self._path, "r") as f:
+                data = json.load(f)
+            if data["repository"].lower() != f"{self.org}/{self.repo}".lower():
+                self._LOGGER.info(f"Ignoring the issue index of {data['repository']} in {self._path}.")
+                return
+            issues = {int(row[0]): IssueInfo(*row[1:]) for row in data["issues"]}
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            self._LOGGER.warning(f"Failed to load the issue index from {self._path}: {e!r}")
+            return
+        self._issues = issues
+        self._since = data.get("since")
+        self._etag = data.get("etag")
+        self._rebuild()
+        self._LOGGER.info(f"Loaded {len(self._issues)} issues of {self.org}/{self.repo}.")
+
+    def save(self):
+        if self._path is None or not self._dirty:
+            return
+        data = {
+            "repository": f"{self.org}/{self.repo}",
+            "since": self._since,
+            "etag": self._etag,
+            "issues": [[number, info.html_url, info.title, info.author, info.state, info.body]
+                       for number, info in self._issues.items()],
+        }
+        # Write to a temporary file first so a crash never leaves a partial index
+        tmp = f"{self._path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self._path)
+        self._dirty = False
+
+    async def run(self, session: aiohttp.ClientSession):
+        """ Sync every `interval` seconds until cancelled, saving the index when it changed. """
+        while True:
+            try:
+                updated = await self.sync(session)
+                if updated > 0:
+                    self._LOGGER.debug(f"Synced {updated} updated issues of {self.org}/{self.repo}.")
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+                GITHUB_REQUESTS.inc("index", "error")
+                self._LOGGER.warning(f"Failed to sync the issue index of {self.org}/{self.repo}: {e!r}")
+            try:
+                # Nothing changes the index until the next sync, it can be written on another thread
+                await asyncio.get_running_loop().run_in_executor(None, self.save)
+            except OSError as e:
+                self._LOGGER.warning(f"Failed to save the issue index to {self._path}: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> str:
+        return f"{len(self._issues)} indexed{'' if self.fresh else ' (stale)'}, {self.requests} sync requests"
+
+
+def _settle_from(future: asyncio.Future, source: asyncio.Future):
+    """ Settle `future` with the outcome of `source` once it is done. """
+    def copy(done: asyncio.Future):
+        if future.done():
+            return
+        if done.cancelled():
+            future.cancel()
+        elif done.exception() is not None:
+            future.set_exception(done.exception())
+        else:
+            future.set_result(done.result())
+    source.add_done_callback(copy)
+
+
+class IssueFetcher:
+    """
+    Runs blocking `IssueCache` lookups on a bounded thread pool so that slow
+    GitHub responses never stall the discord event loop.
+
+    Concurrent lookups of the same issue share one request. With a
+    `GraphQLResolver`, uncached references from one message are fetched
+    together in a single query, falling back to REST per reference, and
+    lookups of them join that query while it runs. Issues
+    in an `IssueIndex` are answered from it without a request.
+    """
+
+    _LOGGER = logging.getLogger("github")
+
+    def __init__(self, cache: IssueCache, workers: int = 4, graphql: Optional[GraphQLResolver] = None,
+                 index: Optional[IssueIndex] = None):
+        self.cache = cache
+        self.index = index
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="github"
+        )
+        self._graphql = graphql
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._in_flight: Dict[IssueKey, asyncio.Future] = {}
+
+    def _peek(self, org: str, repo: str, number: int) -> Optional[IssueInfo]:
+        if self.index is not None:
+            info = self.index.get(org, repo, number)
+            if info is not None:
+                return info
+        return self.cache.peek(org, repo, number)
+
+    async def get(self, org: str, repo: str, number: int) -> IssueInfo:
+        """ Get an issue / pull request. Raises `github.GithubException` on failure. """
+        info = self._peek(org, repo, number)
+        if info is not None:
+            return info
+
+        key = issue_key(org, repo, number)
+        future = self._in_flight.get(key)
+        if future is None:
+            future = self._fetch_rest(org, repo, number)
+            self._register(key, future)
+        else:
+            GITHUB_COALESCED.inc()
+        # One caller giving up must not cancel the request for the others
+        return await asyncio.shield(future)
+
+    def _fetch_rest(self, org: str, repo: str, number: int) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(self._executor, self.cache.get, org, repo, number)
+
+    def _register(self, key: IssueKey, future: asyncio.Future):
+        self._in_flight[key] = future
+        future.add_done_callback(lambda f: self._landed(key, f))
+
+    def _landed(self, key: IssueKey, future: asyncio.Future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+
+    async def _get_logged(self, ref: IssueKey, future: Optional[asyncio.Future] = None) -> Optional[IssueInfo]:
+        try:
+            return await (self.get(*ref) if future is None else asyncio.shield(future))
+        except github.GithubException as e:
+            self._LOGGER.warning("Failed to fetch object number %s/%s. %s", ref[0], ref[1], e)
+            return None
+
+    async def _resolve_graphql(self, refs: List[IssueKey]) -> Dict[int, Optional[IssueInfo]]:
+        if self._graphql.limiter is not None and not self._graphql.limiter.acquire():
+            GITHUB_REQUESTS.inc("graphql", "rate_limited")
+            return {}
+        try:
+            results = await self._graphql.resolve(self._get_session(), refs)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            GITHUB_REQUESTS.inc("graphql", "error")
+            self._LOGGER.warning("GraphQL lookup of %s references failed, using REST. %s", len(refs), e)
+            return {}
+        GITHUB_REQUESTS.inc("graphql", "ok")
+        return results
+
+    async def _fetch_batch(self, batch: Dict[IssueKey, IssueKey], futures: Dict[IssueKey, asyncio.Future]):
+        """ Settle the futures of a batch from one GraphQL query, references it did not answer from REST. """
+        resolved: Dict[int, Optional[IssueInfo]] = {}
+        try:
+            resolved = await self._resolve_graphql(list(batch.values()))
+        finally:
+            # Even when cancelled, as other lookups may have joined the batch
+            for j, (key, ref) in enumerate(batch.items()):
+                future = futures[key]
+                if j not in resolved:
+                    _settle_from(future, self._fetch_rest(*ref))
+                elif resolved[j] is None:
+                    future.set_exception(github.UnknownObjectException(404, {"message": "Not Found"}, None))
+                else:
+                    self.cache.put(*ref, resolved[j])
+                    future.set_result(resolved[j])
+
+    async def get_many(self, refs: List[IssueKey]) -> List[Optional[IssueInfo]]:
+        """ Get several issues / pull requests. Failures are logged and returned as None. """
+        results = [self._peek(*ref) for ref in refs]
+        missing = [i for i, info in enumerate(results) if info is None]
+
+        # References nobody is fetching yet go in one query, registered as in flight so that
+        # concurrent lookups of them join it. References already in flight are joined instead.
+        futures: Dict[IssueKey, asyncio.Future] = {}
+        if self._graphql is not None:
+            batch: Dict[IssueKey, IssueKey] = {}
+            for i in missing:
+                key = issue_key(*refs[i])
+                if key not in self._in_flight:
+                    batch.setdefault(key, refs[i])
+            if len(batch) > 1:
+                loop = asyncio.get_running_loop()
+                for key in batch:
+                    futures[key] = loop.create_future()
+                    self._register(key, futures[key])
+                await self._fetch_batch(batch, futures)
+
+        fetched = await asyncio.gather(*[self._get_logged(refs[i], futures.get(issue_key(*refs[i])))
+                                         for i in missing])
+        for i, info in zip(missing, fetched):
+            results[i] = info
+        return results
+
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        return self._session
+
+    async def run_index(self):
+        """ Keep the issue index in sync until cancelled. """
+        await self.index.run(self._get_session())
+
+    async def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -1,16 +1,108 @@
+import asyncio
+import datetime
+import json
 import logging
-from typing import Optional, List, Callable
+import logging.handlers
+import queue
+import sys
+from typing import Optional, List, Callable, TextIO
 
 import discord
+import discord.http
+
+import metrics
+
+QUEUE_DEPTH = metrics.Gauge(
+    "bot_log_queue_depth",
+    "Embeds waiting to be sent to the log channels."
+)
+DROPPED = metrics.Counter(
+    "bot_log_dropped_total",
+    "Embeds dropped because the log queue was full."
+)
+
+# Attributes of every `logging.LogRecord`, anything else was passed with `extra`
+_RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """ Formats records as one JSON object per line, with any `extra` fields alongside the message. """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+                timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records as they are. `QueueHandler` formats the message before
+    queueing it, here that is left to the listener thread, so arguments
+    must not change after the call (ids, strings and numbers do not).
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: int, json_format: bool = True, stream: Optional[TextIO] = None) \
+        -> logging.handlers.QueueListener:
+    """
+    Send every log record through a queue to a handler on a background
+    thread, so logging never blocks the event loop on formatting or writes.
+    Records are formatted as JSON lines, or as text without `json_format`.
+    Stop the returned listener to flush the queue on exit.
+    """
+    handler = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    handler.setFormatter(JsonFormatter() if json_format else
+                         logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(_LazyQueueHandler(records))
+    root.setLevel(level)
+    listener.start()
+    return listener
 
 
 class DiscordLogger:
+    """
+    Logs embeds to the log channels from a background queue.
+
+    `log` never waits on Discord. Queued embeds are sent in batches of up to
+    `MAX_EMBEDS` per message, to every channel concurrently. When the queue
+    is full, new entries are dropped and the number of dropped entries is
+    reported once the queue has drained.
+    """
+
     _LOGGER = logging.getLogger("discord_logger")
 
-    def __init__(self, channels: List[int]):
+    MAX_EMBEDS = 10
+    MAX_EMBED_CHARACTERS = 6000
+
+    def __init__(self, channels: List[int], queue_size: int = 1000):
         self._client: Optional[discord.Client] = None
         self._raw_channels = channels
         self._channels = None
+        self._queue: "asyncio.Queue[Callable[[], discord.Embed]]" = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._dropped = 0
+        self.dropped = 0
 
     def set_channels(self, channels: List[int]):
         self._raw_channels = channels
@@ -18,22 +110,94 @@ class DiscordLogger:
     def get_channels(self) -> List[int]:
         return self._raw_channels
 
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
     async def register(self, client: discord.Client):
         c = []
-        for channel in self._raw_channels:
-            channel = client.get_channel(channel)
+        for channel_id in self._raw_channels:
+            channel = client.get_channel(channel_id)
+            if channel is None and isinstance(client, discord.AutoShardedClient):
+                # The channel may be in a guild on another process's shards, messages are sent by id
+                channel = discord.Object(channel_id)
             if channel is not None:
                 c.append(channel)
         self._LOGGER.info(f"Logging to {len(c)} channels.")
         self._channels = c
         self._client = client
+        QUEUE_DEPTH.set_function(self.queue_depth)
+        if self._task is None:
+            self._task = client.loop.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def log(self, embed_supplier: Callable[[], discord.Embed]):
+        """ Queue an embed to be logged. The supplier is called on the logging task. """
+        try:
+            self._queue.put_nowait(embed_supplier)
+        except asyncio.QueueFull:
+            self._dropped += 1
+            self.dropped += 1
+            DROPPED.inc()
 
-    async def log(self, embed_supplier: Callable[[], discord.Embed]):
-        if self._client is not None:
+    def _next_batch(self, first: Callable[[], discord.Embed]) -> List[discord.Embed]:
+        suppliers = [first]
+        while len(suppliers) < self.MAX_EMBEDS and not self._queue.empty():
+            suppliers.append(self._queue.get_nowait())
+
+        embeds = []
+        for supplier in suppliers:
             try:
-                embed = embed_supplier()
-                channel: discord.TextChannel
-                for channel in self._channels:
-                    await channel.send(embed=embed)
+                embeds.append(supplier())
             except Exception as e:
-                logging.getLogger("bot_logger").error("Failed to log message", e)
+                self._LOGGER.error(f"Failed to create log embed: {e!r}")
+        return embeds
+
+    def _split(self, embeds: List[discord.Embed]) -> List[List[discord.Embed]]:
+        """ Split embeds into messages within Discord's total embed size limit. """
+        messages = []
+        current = []
+        size = 0
+        for embed in embeds:
+            if len(current) > 0 and size + len(embed) > self.MAX_EMBED_CHARACTERS:
+                messages.append(current)
+                current = []
+                size = 0
+            current.append(embed)
+            size += len(embed)
+        if len(current) > 0:
+            messages.append(current)
+        return messages
+
+    async def _post(self, channel: discord.abc.Snowflake, payload: dict):
+        # Sent by id, so channels outside this process's cache work too
+        route = discord.http.Route("POST", "/channels/{channel_id}/messages", channel_id=channel.id)
+        await self._client.http.request(route, json=payload)
+
+    async def _send(self, channel: discord.abc.Snowflake, embeds: List[discord.Embed]):
+        await self._post(channel, {"embeds": [e.to_dict() for e in embeds]})
+
+    async def _send_all(self, channel: discord.abc.Snowflake, messages: List[List[discord.Embed]]):
+        # Messages to a channel stay in order, channels are sent to concurrently
+        for embeds in messages:
+            try:
+                await self._send(channel, embeds)
+            except Exception as e:
+                self._LOGGER.error(f"Failed to log message to {channel.id}: {e!r}")
+
+    async def _run(self):
+        while True:
+            embeds = self._next_batch(await self._queue.get())
+            messages = self._split(embeds)
+            if len(messages) > 0:
+                await asyncio.gather(*[self._send_all(channel, messages) for channel in self._channels])
+
+            if self._dropped > 0 and self._queue.empty():
+                dropped, self._dropped = self._dropped, 0
+                self._LOGGER.warning(f"Dropped {dropped} log messages, the queue was full.")
+                await asyncio.gather(*[self._post(channel, {"content": f"Dropped {dropped} log messages under load."})
+                                       for channel in self._channels], return_exceptions=True)
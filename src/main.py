@@ -1,16 +1,24 @@
 import argparse
+import asyncio
+import collections
 import configparser
 import logging
+import os
 import re
-import sched
-import threading
-from typing import List, Tuple
+import signal
+import time
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
 
+import aiohttp
 import discord
 import discord_slash
+import discord_slash.utils.manage_commands
 import github
 
+import issues
 import log
+import metrics
+import shared
 import utils
 
 REMOVE_EMOJI = discord.PartialEmoji(name="❌")
@@ -19,10 +27,43 @@ BOT_LOG = log.DiscordLogger([])
 
 COMMAND_REGEX = re.compile(r"!bot (?P<command>.*)")
 
-DELETE_BLOCKED_MESSAGES = [False]
+DELETE_BLOCKED_MESSAGES = shared.SharedFlag()
 BLOCK_LIST = utils.UrlListKeeper("")
 SUS_LIST = utils.UrlListKeeper("")
 
+ON_MESSAGE_SECONDS = metrics.Histogram(
+    "bot_on_message_seconds",
+    "Time to handle a message."
+)
+STAGE_SECONDS = metrics.Histogram(
+    "bot_on_message_stage_seconds",
+    "Time spent in each stage of handling a message.",
+    ["stage"]
+)
+ACTION_SECONDS = metrics.Histogram(
+    "bot_moderation_action_seconds",
+    "Time from receiving a message until a moderation action completed.",
+    ["action"]
+)
+MODERATED_MESSAGES = metrics.Counter(
+    "bot_moderated_messages_total",
+    "Messages deleted or flagged as suspicious, by reason and [BLOCK] rule.",
+    ["reason", "rule"]
+)
+DEDUPLICATED_REFS = metrics.Counter(
+    "bot_github_refs_deduplicated_total",
+    "GitHub references not embedded again because they were embedded in the channel recently."
+)
+SPAM_LIST_AGE = metrics.Gauge(
+    "bot_spam_list_age_seconds",
+    "Seconds since the spam list was last checked for updates.",
+    ["list"]
+)
+SPAM_LIST_SIZE = metrics.Gauge(
+    "bot_spam_list_domains",
+    "Domains in the spam list.",
+    ["list"]
+)
 LOG_LEVEL_MAP = {
     "ALL": logging.NOTSET,
     "DEBUG": logging.DEBUG,
@@ -32,6 +73,30 @@ LOG_LEVEL_MAP = {
     "FATAL": logging.FATAL
 }
 
+# Config sections applied by `!bot reload` and SIGHUP, the others need a restart
+RELOADABLE_SECTIONS = ("LOGGING", "IMAGE_ONLY", "SPAM", "DUPLICATES", "SAFE_REGEX", "BLOCK",)
+RELOAD_ERRORS = (configparser.Error, re.error, ValueError, KeyError,)
+
+
+class Rules(NamedTuple):
+    """ Moderation settings read from the reloadable config sections. """
+    image_only: List[Tuple[int, str]]
+    block_regex: utils.BlockMatcher
+    log_channels: Optional[List[int]]
+    spam_enabled: Optional[bool]
+    spam_urls: Optional[Tuple[str, str]]
+    spam_update: Optional[float]
+    duplicates: Optional[utils.DuplicateDetector]
+    delete_duplicates: bool
+    # Raw values of every section, to report what a reload changed
+    sections: Dict[str, Dict[str, str]]
+
+
+def _moderation_fields(message: discord.Message, action: str, reason: str, rule: str = "") -> Dict[str, object]:
+    """ Fields of a moderation log record, kept separate from the text in the JSON log format. """
+    return {"message_id": message.id, "author_id": message.author.id, "channel_id": message.channel.id,
+            "action": action, "reason": reason, "rule": rule}
+
 
 class Bot(discord.Client):
     """
@@ -39,12 +104,21 @@ class Bot(discord.Client):
     react-remove messages, and deleting non-images from image only channels.
     """
 
-    GH_REGEX = re.compile(r"(\\)?(([a-zA-Z\d]{1}[-a-zA-Z\d]+)/)?([\-\w]+)?#(\d+)")
+    GH_REGEX = utils.GH_REGEX
+
+    # Seconds between checks for a spam list index replaced by another process
+    SHARED_POLL = 5.0
 
-    def __init__(self, gh: github.Github, default_org: str, default_repo: str,
+    def __init__(self, gh: issues.IssueFetcher, default_org: str, default_repo: str,
                  image_only: List[Tuple[int, str]],
-                 block_regex: List[Tuple[str, re.Pattern]],
-                 *args, **kwargs):
+                 block_regex: utils.BlockMatcher,
+                 spam_update: Optional[float],
+                 *args, metrics_server: Optional[metrics.MetricsServer] = None,
+                 embed_owners: Optional[utils.EmbedOwnerIndex] = None,
+                 recent_embeds: Optional[utils.RecentEmbeds] = None, dedup_pointer: bool = False,
+                 image_verifier: Optional[utils.ImageVerifier] = None, spam_leader: bool = True,
+                 duplicates: Optional[utils.DuplicateDetector] = None, delete_duplicates: bool = True,
+                 config_path: Optional[str] = None, rules: Optional[Rules] = None, **kwargs):
         super().__init__(*args, **kwargs)
         self._gh = gh
         self._default_org = default_org
@@ -52,12 +126,96 @@ class Bot(discord.Client):
         self._image_only = image_only
         self._logger = logging.getLogger("bot")
         self._blocks = block_regex
+        self._spam_update = spam_update
+        self._metrics_server = metrics_server
+        self._owners = embed_owners or utils.EmbedOwnerIndex()
+        self._recent = recent_embeds
+        self._dedup_pointer = dedup_pointer
+        self._image_verifier = image_verifier
+        self._spam_leader = spam_leader
+        self._duplicates = duplicates
+        self._delete_duplicates = delete_duplicates
+        self._config_path = config_path
+        self._rules = rules
+        self._reload_listeners: List[Callable[[Rules], None]] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks: List[asyncio.Task] = []
+        self._spam_tasks: List[asyncio.Task] = []
+        self._started = False
+        self._timings: Dict[str, Deque[float]] = collections.defaultdict(lambda: collections.deque(maxlen=1000))
+
+    async def start(self, *args, **kwargs):
+        if self._metrics_server is not None:
+            await self._metrics_server.start()
+        self._owners.load()
+        self._tasks.append(self.loop.create_task(self._owners.run(60)))
+        if self._gh.index is not None:
+            self._gh.index.load()
+            self._tasks.append(self.loop.create_task(self._gh.run_index()))
+
+        # Spam lists are refreshed in the background on the client's event loop. In a sharded
+        # deployment one process downloads them and the others map the index it writes.
+        for spam_list in (BLOCK_LIST, SUS_LIST,):
+            try:
+                spam_list.load_shared()
+            except (OSError, ValueError) as e:
+                self._logger.warning("Failed to map shared spam list: %r", e)
+        self._start_spam_lists()
+        self._started = True
+
+        if self._config_path is not None and hasattr(signal, "SIGHUP"):
+            try:
+                self.loop.add_signal_handler(signal.SIGHUP, self._reload_on_signal)
+            except (NotImplementedError, RuntimeError):
+                pass  # Not on the main thread, `!bot reload` still works
+        await super().start(*args, **kwargs)
+
+    def _start_spam_lists(self):
+        if self._spam_update is not None and self._spam_leader:
+            if self._session is None:
+                self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+            for spam_list in (BLOCK_LIST, SUS_LIST,):
+                self._spam_tasks.append(self.loop.create_task(spam_list.run(self._session, self._spam_update)))
+        elif self._spam_update is not None:
+            for spam_list in (BLOCK_LIST, SUS_LIST,):
+                self._spam_tasks.append(self.loop.create_task(spam_list.follow(self.SHARED_POLL)))
+
+    async def close(self):
+        if self._config_path is not None and hasattr(signal, "SIGHUP"):
+            self.loop.remove_signal_handler(signal.SIGHUP)
+        tasks = self._tasks + self._spam_tasks
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._spam_tasks = []
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._owners.save()
+        if self._gh.index is not None:
+            self._gh.index.save()
+        await self._gh.close()
+        await self._blocks.close()
+        if self._image_verifier is not None:
+            await self._image_verifier.close()
+        await BOT_LOG.close()
+        if self._metrics_server is not None:
+            await self._metrics_server.close()
+        await super().close()
 
     async def on_ready(self):
         await BOT_LOG.register(self)
 
     async def on_message(self, message: discord.Message):
         """ On message callback. Find GitHub numbers, delete non-images. """
+        received = time.perf_counter()
+        try:
+            await self._on_message(message, received)
+        finally:
+            ON_MESSAGE_SECONDS.observe(time.perf_counter() - received)
+
+    async def _on_message(self, message: discord.Message, received: float):
 
         # Check if the message is from ourselves
         if message.author.id == self.user.id:
@@ -73,112 +231,179 @@ class Bot(discord.Client):
             if match is not None:
                 command = match.group("command")
                 if command == "help":
-                    self._logger.info(f"Help run by "
-                                      f"{message.author.name} "
-                                      f"#{message.author.discriminator} "
-                                      f"({message.author.id}")
+                    self._logger.info("Help run by %s #%s (%s)", message.author.name,
+                                      message.author.discriminator, message.author.id)
                     await message.reply(
                         content="Bot commands:\n"
                                 "  !bot spam on - enable spam detection\n"
-                                "  !bot spam off - disable spam detection",
+                                "  !bot spam off - disable spam detection\n"
+                                "  !bot cache - show GitHub cache statistics\n"
+                                "  !bot timings - show moderation action timings\n"
+                                "  !bot reload - reload the config without reconnecting",
+                        mention_author=False
+                    )
+                elif command == "timings":
+                    await message.reply(
+                        content=self._format_timings(),
+                        mention_author=False
+                    )
+                elif command == "cache":
+                    await message.reply(
+                        content=f"GitHub cache: {self._gh.cache.stats()}" + (
+                            f"\nGitHub index: {self._gh.index.stats()}" if self._gh.index is not None else ""),
+                        mention_author=False
+                    )
+                elif command == "reload":
+                    self._logger.info("Reload run by %s #%s (%s)", message.author.name,
+                                      message.author.discriminator, message.author.id)
+                    try:
+                        changes = self.reload()
+                    except RELOAD_ERRORS as e:
+                        self._logger.error("Failed to reload %s: %r", self._config_path, e)
+                        content = f"Reload failed, the current config is kept: {e}"
+                    else:
+                        content = "Config reloaded: " + ("\n" + "\n".join(changes) if changes else "no changes.")
+                    await message.reply(
+                        content=content[:2000],
                         mention_author=False
                     )
                 elif command == "spam off":
-                    DELETE_BLOCKED_MESSAGES[0] = False
-                    self._logger.info(f"Spam detection disabled by "
-                                      f"{message.author.name} "
-                                      f"#{message.author.discriminator} "
-                                      f"({message.author.id})")
+                    DELETE_BLOCKED_MESSAGES.set(False)
+                    self._logger.info("Spam detection disabled by %s #%s (%s)", message.author.name,
+                                      message.author.discriminator, message.author.id)
                     await message.reply(
                         content="Spam detection disabled.",
                         mention_author=False
                     )
                 elif command == "spam on":
-                    DELETE_BLOCKED_MESSAGES[0] = True
-                    self._logger.info(f"Spam detection enabled by "
-                                      f"{message.author.name} "
-                                      f"#{message.author.discriminator} "
-                                      f"({message.author.id})")
+                    DELETE_BLOCKED_MESSAGES.set(True)
+                    self._logger.info("Spam detection enabled by %s #%s (%s)", message.author.name,
+                                      message.author.discriminator, message.author.id)
                     await message.reply(
                         content="Spam detection enabled.",
                         mention_author=False
                     )
                 return
 
-        if DELETE_BLOCKED_MESSAGES[0]:
+        # The content is parsed once, on demand, for all the checks below
+        analysis = utils.MessageAnalysis(message.content)
+
+        if DELETE_BLOCKED_MESSAGES.get():
             # Check if it is spam
-            for url in utils.get_urls(message.content):
-                if BLOCK_LIST.match(url):
-                    self._logger.info(f"Removing message {message.id} by "
-                                      f"{message.author.name} "
-                                      f"#{message.author.discriminator} "
-                                      f"({message.author.id}) for spam: "
-                                      f"{message.content}")
-                    await BOT_LOG.log(lambda: self._log_spam(message, True))
-                    await message.delete()
-                    return
-                if SUS_LIST.match(url):
-                    self._logger.info(f"Suspicious message {message.id} by "
-                                      f"{message.author.name} "
-                                      f"#{message.author.discriminator} "
-                                      f"({message.author.id}):"
-                                      f"{message.content}")
-                    await BOT_LOG.log(lambda: self._log_spam(message, False))
+            with STAGE_SECONDS.time("spam_lists"):
+                blocked = False
+                suspicious = False
+                for host in analysis.hosts:
+                    if BLOCK_LIST.match_host(host):
+                        blocked = True
+                        break
+                    if SUS_LIST.match_host(host):
+                        suspicious = True
+            if blocked:
+                await self._delete(message, received, "blocklist")
+                self._logger.info("Removing message %s by %s #%s (%s) for spam: %s", message.id,
+                                  message.author.name, message.author.discriminator, message.author.id,
+                                  message.content, extra=_moderation_fields(message, "delete", "blocklist"))
+                BOT_LOG.log(lambda: self._log_spam(message, True))
+                return
+            if suspicious:
+                MODERATED_MESSAGES.inc("suspicious", "")
+                self._logger.info("Suspicious message %s by %s #%s (%s): %s", message.id,
+                                  message.author.name, message.author.discriminator, message.author.id,
+                                  message.content, extra=_moderation_fields(message, "flag", "suspicious"))
+                BOT_LOG.log(lambda: self._log_spam(message, False))
 
             # Check for @everyone (and failed)
-            if not message.mention_everyone and ("@everyone" in message.content or "@here" in message.content):
-                self._logger.info(f"Removing message {message.id} by "
-                                  f"{message.author.name} "
-                                  f"#{message.author.discriminator} "
-                                  f"({message.author.id}) for spam (@everyone/@here): "
-                                  f"{message.content}")
-                await BOT_LOG.log(lambda: self._log_spam(message, True))
-                await message.delete()
+            with STAGE_SECONDS.time("everyone"):
+                everyone = not message.mention_everyone and analysis.mentions_everyone
+            if everyone:
+                await self._delete(message, received, "everyone")
+                self._logger.info("Removing message %s by %s #%s (%s) for spam (@everyone/@here): %s", message.id,
+                                  message.author.name, message.author.discriminator, message.author.id,
+                                  message.content, extra=_moderation_fields(message, "delete", "everyone"))
+                BOT_LOG.log(lambda: self._log_spam(message, True))
                 return
 
             # Check any block regexes
-            for name, regex in self._blocks:
-                if regex.match(message.content):
-                    self._logger.info(f"Removing message {message.id} by "
-                                      f"{message.author.name} "
-                                      f"#{message.author.discriminator} "
-                                      f"({message.author.id}) for spam regex ({name}): "
-                                      f"{message.content}")
-                    await BOT_LOG.log(lambda: self._log_spam(message, True))
-                    await message.delete()
-                    return
+            with STAGE_SECONDS.time("block_regex"):
+                name = self._blocks.match(analysis.content)
+            if name is None and self._blocks.isolated:
+                with STAGE_SECONDS.time("block_regex_isolated"):
+                    try:
+                        name = await self._blocks.match_isolated(analysis.content)
+                    except (asyncio.TimeoutError, RuntimeError):
+                        # Likely crafted against a rule, flagged for the moderators to look at. A worker
+                        # that failed to start or exited is treated the same, it is restarted next time.
+                        MODERATED_MESSAGES.inc("suspicious", "regex_timeout")
+                        self._logger.info("Message %s by %s #%s (%s) took too long to check against "
+                                          "the [BLOCK] rules: %s", message.id, message.author.name,
+                                          message.author.discriminator, message.author.id, message.content,
+                                          extra=_moderation_fields(message, "flag", "regex_timeout"))
+                        BOT_LOG.log(lambda: self._log_spam(message, False))
+            if name is not None:
+                await self._delete(message, received, "regex", name)
+                self._logger.info("Removing message %s by %s #%s (%s) for spam regex (%s): %s", message.id,
+                                  message.author.name, message.author.discriminator, message.author.id, name,
+                                  message.content, extra=_moderation_fields(message, "delete", "regex", name))
+                BOT_LOG.log(lambda: self._log_spam(message, True))
+                return
+
+            # Check for the same text posted to several channels
+            if self._duplicates is not None:
+                with STAGE_SECONDS.time("duplicates"):
+                    copies = self._duplicates.add(message.author.id, message.channel.id, message.id, analysis.content)
+                if len(copies) > 0:
+                    await self._moderate_duplicates(message, received, copies)
+                    if self._delete_duplicates:
+                        return
 
             # Check if we are in the renderers channel
             for channel, warn in self._image_only:
                 if message.channel.id == channel:
-                    if not utils.is_image(message):
-                        self._logger.info(f"Removing message {message.id} in "
-                                          f"{message.channel.id} for not having "
-                                          f"an image: {message.content}")
-                        await BOT_LOG.log(lambda: self._log_renderers_delete(message))
-                        warning = await message.reply(
-                            content=warn,
-                            mention_author=True
+                    with STAGE_SECONDS.time("image_only"):
+                        if self._image_verifier is not None:
+                            image = await self._image_verifier.is_image(message, analysis)
+                        else:
+                            image = utils.is_image(message, analysis)
+                    if not image:
+                        # The warning cannot reply to the message as it is deleted at the same time
+                        _, warning = await asyncio.gather(
+                            self._delete(message, received, "image_only"),
+                            self._warn(message, warn, received)
                         )
-                        await message.delete()
-                        await warning.delete(delay=10)
+                        self._logger.info("Removing message %s in %s for not having an image: %s",
+                                          message.id, message.channel.id, message.content,
+                                          extra=_moderation_fields(message, "delete", "image_only"))
+                        BOT_LOG.log(lambda: self._log_renderers_delete(message))
+                        if warning is not None:
+                            await warning.delete(delay=10)
                     return
 
         # Look for GitHub issues / pull requests
-        issues = self.GH_REGEX.findall(message.content)
-        issues = [(match[2] or self._default_org, match[3] or self._default_repo, match[4],) for match in issues if match[0] != '\\']
+        with STAGE_SECONDS.time("github_refs"):
+            refs = [(match[2] or self._default_org, match[3] or self._default_repo, match[4],)
+                    for match in analysis.gh_refs if match[0] != '\\']
+        if len(refs) == 0:
+            return
+
+        # Skip references embedded in this channel within the dedup window
+        if self._recent is not None:
+            fresh = [ref for ref in refs if self._recent.get(message.channel.id, ref) is None]
+            DEDUPLICATED_REFS.inc(amount=len(refs) - len(fresh))
+            if len(fresh) == 0:
+                if self._dedup_pointer:
+                    await self._point_to_embed(message, self._recent.get(message.channel.id, refs[0]))
+                return
+            refs = fresh
 
         # Create the embed
-        embed = None
-        if len(issues) == 1:
-            self._logger.info(f"Message {message.id} with one GitHub issue.")
-            embed = utils.generate_gh_embed(issues[0], self._gh)
-        elif len(issues) > 1:
-            self._logger.info(f"Message {message.id} with {len(issues)} "
-                              f"GitHub issues.")
-            embed = discord.Embed(title="Issues / pull requests")
-            for issue in issues:
-                utils.generate_gh_embed_snippet(embed, issue, self._gh)
+        with STAGE_SECONDS.time("github_fetch"):
+            if len(refs) == 1:
+                self._logger.info("Message %s with one GitHub issue.", message.id)
+                embed = await utils.generate_gh_embed(refs[0], self._gh)
+            else:
+                self._logger.info("Message %s with %s GitHub issues.", message.id, len(refs))
+                embed = await utils.generate_gh_embed_multiple(refs, self._gh)
 
         # Send the message
         if embed is not None:
@@ -188,8 +413,161 @@ class Bot(discord.Client):
                 embed=embed,
                 mention_author=False
             )
+            self._owners.add(m.id, message.author.id)
+            if self._recent is not None:
+                self._recent.add(message.channel.id, refs, m.id)
             await m.add_reaction(REMOVE_EMOJI)
 
+    def add_reload_listener(self, listener: Callable[[Rules], None]):
+        """ Call `listener` with the new rules on every reload, in the same step as the bot swaps them. """
+        self._reload_listeners.append(listener)
+
+    def reload(self) -> List[str]:
+        """
+        Read the config again and swap in the rules of `RELOADABLE_SECTIONS`
+        without reconnecting. Returns the changes, one line per section.
+
+        Raises one of `RELOAD_ERRORS` on an invalid config, keeping the
+        current rules. The rules are swapped without yielding to the event
+        loop, so each message is checked entirely against the old or the new
+        rules.
+        """
+        if self._config_path is None:
+            raise ValueError("The bot was not created from a config file")
+        config = configparser.ConfigParser()
+        if len(config.read(self._config_path)) == 0:
+            raise ValueError(f"Cannot read {self._config_path}")
+        rules = read_rules(config)
+        old = self._rules
+        old_sections = old.sections if old is not None else {}
+        changes = _diff_sections(old_sections, rules.sections)
+        if any(old_sections.get(name) != rules.sections.get(name) for name in ("BLOCK", "SAFE_REGEX",)):
+            changes.extend(f"[BLOCK] {name} may backtrack catastrophically ({reason}), "
+                           f"handled with {rules.block_regex.pathological}"
+                           for name, reason in rules.block_regex.flagged)
+
+        self._image_only = rules.image_only
+        old_blocks, self._blocks = self._blocks, rules.block_regex
+        if old_blocks.isolated:
+            self.loop.create_task(old_blocks.close())
+        if old_sections.get("DUPLICATES") != rules.sections.get("DUPLICATES"):
+            # A new detector starts with an empty window
+            self._duplicates = rules.duplicates
+            self._delete_duplicates = rules.delete_duplicates
+
+        if old_sections.get("LOGGING") != rules.sections.get("LOGGING"):
+            BOT_LOG.set_channels(rules.log_channels or [])
+            if self.is_ready():
+                self.loop.create_task(BOT_LOG.register(self))
+
+        # The toggle only follows the config when the config changes, `!bot spam on/off` stays otherwise
+        if old is None or old.spam_enabled != rules.spam_enabled:
+            if rules.spam_enabled is not None:
+                DELETE_BLOCKED_MESSAGES.set_from_config(rules.spam_enabled)
+
+        if old is None or (old.spam_urls, old.spam_update) != (rules.spam_urls, rules.spam_update):
+            for task in self._spam_tasks:
+                task.cancel()
+            self._spam_tasks = []
+            urls = rules.spam_urls or ("", "")
+            for spam_list, url in zip((BLOCK_LIST, SUS_LIST,), urls):
+                if url != spam_list.url:
+                    spam_list.set_url(url, spam_list.index_path)
+            self._spam_update = rules.spam_update if rules.spam_urls is not None else None
+            if self._started:
+                self._start_spam_lists()
+
+        self._rules = rules
+        for listener in self._reload_listeners:
+            listener(rules)
+        return changes
+
+    def _reload_on_signal(self):
+        self._logger.info("SIGHUP received, reloading %s", self._config_path)
+        try:
+            changes = self.reload()
+        except RELOAD_ERRORS as e:
+            self._logger.error("Failed to reload %s: %r", self._config_path, e)
+            # `e` is unbound when the except block ends, before the logging task builds the embed
+            text = f"Reload failed, the current config is kept: {e}"
+            BOT_LOG.log(lambda: self._log_reload([text]))
+            return
+        for change in changes:
+            self._logger.info("Reloaded %s", change)
+        BOT_LOG.log(lambda: self._log_reload(changes or ["No changes."]))
+
+    async def _point_to_embed(self, message: discord.Message, embed_id: int):
+        """ Reply with a link to an earlier embed instead of embedding again. """
+        guild = message.guild.id if message.guild is not None else "@me"
+        await message.reply(
+            content=f"Linked above: https://discord.com/channels/{guild}/{message.channel.id}/{embed_id}",
+            mention_author=False
+        )
+
+    def _record_timing(self, action: str, start: float, received: float):
+        now = time.perf_counter()
+        self._timings[action].append(now - received)
+        ACTION_SECONDS.observe(now - received, action)
+        self._logger.debug("%s took %.1f ms, %.1f ms after receiving the message", action,
+                           (now - start) * 1000, (now - received) * 1000)
+
+    async def _delete(self, message: discord.Message, received: float, reason: str, rule: str = ""):
+        """ Delete a moderated message and record the time to delete. """
+        MODERATED_MESSAGES.inc(reason, rule)
+        start = time.perf_counter()
+        try:
+            await message.delete()
+        except discord.NotFound:
+            pass  # Already deleted
+        self._record_timing("delete", start, received)
+
+    async def _moderate_duplicates(self, message: discord.Message, received: float, copies: List[Tuple[int, int]]):
+        """ Delete or flag a message posted to several channels, deleting the earlier copies too. """
+        if not self._delete_duplicates:
+            MODERATED_MESSAGES.inc("suspicious", "duplicate")
+            self._logger.info("Duplicate message %s by %s #%s (%s) in %s channels: %s", message.id,
+                              message.author.name, message.author.discriminator, message.author.id, len(copies),
+                              message.content, extra=_moderation_fields(message, "flag", "duplicate"))
+            BOT_LOG.log(lambda: self._log_spam(message, False))
+            return
+
+        async def delete_copy(channel_id: int, message_id: int):
+            MODERATED_MESSAGES.inc("duplicate", "")
+            try:
+                await self.http.delete_message(channel_id, message_id)
+            except discord.NotFound:
+                pass  # Already deleted
+
+        await asyncio.gather(
+            self._delete(message, received, "duplicate"),
+            *[delete_copy(channel_id, message_id) for channel_id, message_id in copies if message_id != message.id]
+        )
+        self._logger.info("Removing message %s by %s #%s (%s) for spam (posted to %s channels): %s", message.id,
+                          message.author.name, message.author.discriminator, message.author.id, len(copies),
+                          message.content, extra=_moderation_fields(message, "delete", "duplicate"))
+        BOT_LOG.log(lambda: self._log_spam(message, True))
+
+    async def _warn(self, message: discord.Message, warn: str, received: float) -> Optional[discord.Message]:
+        start = time.perf_counter()
+        try:
+            warning = await message.channel.send(content=f"{message.author.mention} {warn}")
+        except discord.HTTPException as e:
+            self._logger.warning("Failed to warn %s: %s", message.author.id, e)
+            return None
+        self._record_timing("warn", start, received)
+        return warning
+
+    def _format_timings(self) -> str:
+        lines = ["Time after receiving the message (p50 / p99, ms):"]
+        for action, timings in self._timings.items():
+            if len(timings) == 0:
+                continue
+            ordered = sorted(timings)
+            p50 = ordered[len(ordered) // 2] * 1000
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+            lines.append(f"  {action}: {p50:.0f} / {p99:.0f} ({len(ordered)} samples)")
+        return "\n".join(lines)
+
     @staticmethod
     def _log_renderers_delete(message: discord.Message) -> discord.Embed:
         e = discord.Embed(
@@ -216,6 +594,15 @@ class Bot(discord.Client):
         e.timestamp = message.created_at
         return e
 
+    @staticmethod
+    def _log_reload(changes: List[str]) -> discord.Embed:
+        return discord.Embed(
+            title="Config reloaded",
+            color=discord.Color.from_rgb(0, 128, 255),
+            description="\n".join(changes)[:4096],
+            type="rich"
+        )
+
     @staticmethod
     def _log_spam(message: discord.Message, delete: bool) -> discord.Embed:
         e = discord.Embed(
@@ -252,153 +639,447 @@ class Bot(discord.Client):
         if payload.event_type != "REACTION_ADD":
             return  # Emoji was not added
 
-        # Get the channel
-        channel = self.get_channel(payload.channel_id)
-        message: discord.Message = await channel.fetch_message(payload.message_id)
-
-        if message.author.id != self.user.id:
-            return  # Original author was not us
-        if len(message.embeds) != 1:
-            return  # Original message had an incorrect number of embeds
-
-        # Try and get the user id from the embed
-        embed = message.embeds[0]
-        if not isinstance(embed.footer.text, str):
-            return  # Invalid embed
-        user = embed.footer.text.split("\n")[-1]
-        try:
-            user = int(user)
-        except ValueError:
-            return  # Invalid user id
+        # Look up who requested the embed, without fetching the message
+        user = self._owners.get(payload.message_id)
+        if user is None:
+            return  # Not one of our embeds
         if user != payload.user_id:
             return  # User does not have permission to remove this
 
-        self._logger.info(f"React-deleting our message {message.id}")
-        await message.delete()
+        self._logger.info("React-deleting our message %s", payload.message_id)
+        self._owners.remove(payload.message_id)
+        try:
+            await self.http.delete_message(payload.channel_id, payload.message_id)
+        except discord.NotFound:
+            pass  # Already deleted
+
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self._owners.remove(payload.message_id)
+        if self._recent is not None:
+            self._recent.forget(payload.message_id)
+
+
+class ShardedBot(Bot, discord.AutoShardedClient):
+    """
+    The bot on several shards in one process. Run one process per shard group
+    with `--shards`, they share the spam lists and toggle through [SHARDING]
+    shared_dir.
+    """
 
 
 class Slash(discord_slash.SlashCommand):
-    """ /gh Slash command. """
+    """
+    /gh Slash command.
 
-    def __init__(self, gh: github.Github, default_org: str, default_repo: str,
-                 image_only: List[Tuple[int, str]], *args, **kwargs):
+    With an issue index, the number option suggests issues by title as it
+    is typed and also accepts words from a title.
+    """
+
+    # discord_slash does not know autocomplete interactions, they are answered here
+    AUTOCOMPLETE_INTERACTION = 4
+    AUTOCOMPLETE_RESULT = 8
+    MAX_CHOICES = 25
+    MAX_CHOICE_LENGTH = 100
+
+    def __init__(self, gh: issues.IssueFetcher, default_org: str, default_repo: str,
+                 image_only: List[Tuple[int, str]], embed_owners: utils.EmbedOwnerIndex,
+                 *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._gh = gh
+        self._owners = embed_owners
         self._default_org = default_org
         self._default_repo = default_repo
         self._logger = logging.getLogger("bot-slash")
         self._image_only_channels = {i[0] for i in image_only}
 
+        options = [
+            discord_slash.utils.manage_commands.create_option(
+                "number", "Pull request / issue number, or words from its title.", str, True),
+            discord_slash.utils.manage_commands.create_option("org", "GitHub organization.", str, False),
+            discord_slash.utils.manage_commands.create_option("repo", "GitHub repository.", str, False),
+        ]
+        options[0]["autocomplete"] = gh.index is not None
         self.add_slash_command(
             self.gh,
             name="gh",
-            description="Get a Github pull request / issue from its number."
+            description="Get a Github pull request / issue from its number.",
+            options=options
         )
 
-    async def gh(self, ctx, number: int, org: str = "", repo: str = ""):
+    def set_rules(self, rules: Rules):
+        self._image_only_channels = {i[0] for i in rules.image_only}
+
+    def autocomplete(self, query: str, org: str = "", repo: str = "") -> List[dict]:
+        """ Choices for a partly typed number option, from the issue index. """
+        index = self._gh.index
+        if index is None or not index.covers(org or self._default_org, repo or self._default_repo):
+            return []
+        return [{"name": utils.clip_string_length(f"#{number} {title}", self.MAX_CHOICE_LENGTH), "value": str(number)}
+                for number, title in index.search(query, self.MAX_CHOICES)]
+
+    async def on_socket_response(self, msg):
+        if msg["t"] == "INTERACTION_CREATE" and msg["d"]["type"] == self.AUTOCOMPLETE_INTERACTION:
+            await self._on_autocomplete(msg["d"])
+            return
+        await super().on_socket_response(msg)
+
+    async def _on_autocomplete(self, interaction: dict):
+        values = {option["name"]: str(option.get("value", "")) for option in interaction["data"].get("options", [])}
+        focused = next((option["name"] for option in interaction["data"].get("options", [])
+                        if option.get("focused")), None)
+        choices = []
+        if focused == "number":
+            choices = self.autocomplete(values["number"], values.get("org", ""), values.get("repo", ""))
+        try:
+            await self.req.post_initial_response({"type": self.AUTOCOMPLETE_RESULT, "data": {"choices": choices}},
+                                                 interaction["id"], interaction["token"])
+        except discord.HTTPException as e:
+            self._logger.warning("Failed to answer /gh autocomplete: %s", e)
+
+    def _resolve_number(self, number: str, org: str, repo: str) -> Optional[int]:
+        """ The issue number typed or picked, or the best title match from the index. """
+        number = str(number).strip().lstrip("#")
+        if number.isdigit():
+            return int(number)
+        choices = self.autocomplete(number, org, repo)
+        return int(choices[0]["value"]) if choices else None
+
+    async def gh(self, ctx, number: str, org: str = "", repo: str = ""):
         """ /gh [number] command. """
 
         if ctx.channel_id in self._image_only_channels:
-            self._logger.info(f"Attempted slash command in protected channel "
-                              f"{ctx.channel_id}.")
+            self._logger.info("Attempted slash command in protected channel %s.", ctx.channel_id)
             await ctx.send(content="Cannot send text messages in this channel.",
                            hidden=True)
             return
 
-        embed = utils.generate_gh_embed((org or self._default_org, repo or self._default_repo, number,), self._gh)
+        resolved = self._resolve_number(number, org, repo)
+        if resolved is None:
+            self._logger.info("Slash command without a matching GitHub issue for %r.", number)
+            await ctx.send(content=f"No pull request / issue matches: {utils.clip_string_length(number, 100)}",
+                           hidden=True)
+            return
+        number = resolved
+
+        embed = await utils.generate_gh_embed((org or self._default_org, repo or self._default_repo, number,), self._gh)
         if embed is not None:
-            self._logger.info(f"Slash command with valid GitHub number #{number}.")
+            self._logger.info("Slash command with valid GitHub number #%s.", number)
             embed.set_footer(text=f"React with {REMOVE_EMOJI} to remove.\n"
                                   f"{ctx.author_id}")
             m = await ctx.send(embed=embed, hidden=False)
+            self._owners.add(m.id, ctx.author_id)
             await m.add_reaction(REMOVE_EMOJI)
         else:
-            self._logger.info(f"Slash command with invalid GitHub number #{number}.")
+            self._logger.info("Slash command with invalid GitHub number #%s.", number)
             await ctx.send(content=f"Invalid pull / issue number: #{number}",
                            hidden=True)
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Chunky Discord Bot")
-    parser.add_argument("discord", help="Discord API key.")
-    parser.add_argument("--github", help="Github API key.", default=None)
-    parser.add_argument("--log-level", help="Log level (default INFO).", default="INFO")
-    parser.add_argument("--config", help="Path to the config file.",
-                        default="config.ini")
-    parser.add_argument("--debug-guild", help="Debug guild id.", default=None)
-    args = parser.parse_args()
+def _parse_flags(flags_class, value: str, presets: Dict[str, object]):
+    """ Parse `discord.Intents` or `discord.MemberCacheFlags` from a preset name or comma separated flag names. """
+    value = value.strip().lower()
+    if value in presets:
+        return presets[value]
+    flags = flags_class.none()
+    for name in value.split(","):
+        name = name.strip()
+        if name not in flags_class.VALID_FLAGS:
+            raise ValueError(f"Unknown flag {name!r}, must be one of: {', '.join(flags_class.VALID_FLAGS)}")
+        setattr(flags, name, True)
+    return flags
 
-    # Setup logging
-    if args.log_level not in LOG_LEVEL_MAP.keys():
-        print("Log level must be one of: ALL, DEBUG, INFO, WARN, ERROR, FATAL")
-        return
-    logging.basicConfig(level=LOG_LEVEL_MAP.get(args.log_level))
 
-    # Load config
-    config = configparser.ConfigParser()
-    config.read(args.config)
+def read_rules(config: configparser.ConfigParser) -> Rules:
+    """ Read and compile the reloadable sections. Raises one of `RELOAD_ERRORS` if they are invalid. """
 
-    # Block regexes
-    block_regex = []
+    # Block regexes, the ones that may backtrack catastrophically are isolated by default
+    block_rules = []
     if "BLOCK" in config:
         for tag, regex in config["BLOCK"].items():
-            block_regex.append((tag, re.compile(regex),))
+            block_rules.append((tag, regex,))
+    pathological = "isolate"
+    timeout = 0.05
+    if "SAFE_REGEX" in config:
+        pathological = config["SAFE_REGEX"].get("pathological", pathological)
+        timeout = float(config["SAFE_REGEX"].get("timeout", "0.05"))
+    block_regex = utils.BlockMatcher(block_rules, pathological, timeout)
+
+    # Image only channels
+    image_only: List[Tuple[int, str]] = []
+    if "IMAGE_ONLY" in config:
+        for key, value in config["IMAGE_ONLY"].items():
+            try:
+                image_only.append((int(key), value,))
+            except ValueError:
+                logging.getLogger("bot").error("Invalid [IMAGE_ONLY] channel %s.", key)
+    else:
+        logging.getLogger("bot").warning("Config does not contain an [IMAGE_ONLY] "
+                                         "section. Bot will not filter any channels.")
+
+    # Logging channels
+    log_channels = None
+    if "LOGGING" in config:
+        log_channels = [int(channel) for channel, _ in config["LOGGING"].items()]
 
     # Spam lists
+    spam_enabled = None
+    spam_urls = None
+    spam_update = None
     if "SPAM" in config:
-        if config["SPAM"].get("enabled", "false").lower() == "true":
-            DELETE_BLOCKED_MESSAGES[0] = True  # noqa
+        spam_enabled = config["SPAM"].get("enabled", "false").lower() == "true"
+        spam_urls = (config["SPAM"]["block"], config["SPAM"]["suspicious"],)
+        spam_update = float(config["SPAM"]["update"])
+
+    # Same text posted to several channels by one author
+    duplicates = None
+    delete_duplicates = True
+    if "DUPLICATES" in config:
+        duplicates = utils.DuplicateDetector(
+            channels=int(config["DUPLICATES"].get("channels", "3")),
+            window=float(config["DUPLICATES"].get("window", "30")),
+            size=int(config["DUPLICATES"].get("size", "10000")),
+            min_length=int(config["DUPLICATES"].get("min_length", "8"))
+        )
+        delete_duplicates = config["DUPLICATES"].getboolean("delete", True)
+
+    return Rules(
+        image_only, block_regex, log_channels, spam_enabled, spam_urls, spam_update, duplicates, delete_duplicates,
+        {name: dict(config[name]) for name in config.sections()}
+    )
+
+
+def _diff_sections(old: Dict[str, Dict[str, str]], new: Dict[str, Dict[str, str]]) -> List[str]:
+    """ Describe the keys added, removed and changed in each section, one line per section. """
+    changes = []
+    for section in list(old) + [name for name in new if name not in old]:
+        before = old.get(section, {})
+        after = new.get(section, {})
+        if section in old and section in new and before == after:
+            continue
+        if section not in new:
+            parts = ["section removed"]
+        else:
+            parts = [] if section in old else ["section added"]
+            added = [key for key in after if key not in before]
+            removed = [key for key in before if key not in after]
+            changed = [key for key in after if key in before and before[key] != after[key]]
+            if added:
+                parts.append(f"added {', '.join(added)}")
+            if removed:
+                parts.append(f"removed {', '.join(removed)}")
+            if changed:
+                parts.append(f"changed {', '.join(changed)}")
+        note = "" if section in RELOADABLE_SECTIONS else " (restart to apply)"
+        changes.append(f"[{section}] {'; '.join(parts)}{note}")
+    return changes
+
 
-        BLOCK_LIST.set_url(config["SPAM"]["block"])
-        SUS_LIST.set_url(config["SPAM"]["suspicious"])
+def create_bot(args: argparse.Namespace) -> Optional[Bot]:
+    """
+    Load the config and create the bot.
+
+    This does not make any network requests, GitHub and the spam lists are
+    only contacted once the client is running.
+    """
+
+    # Load config
+    config = configparser.ConfigParser()
+    config.read(args.config)
+
+    # Sharding, processes running shard 0 download the spam lists for all the others
+    sharding = "SHARDING" in config
+    shard_ids: Optional[List[int]] = None
+    shared_dir: Optional[str] = None
+    if sharding:
+        if getattr(args, "shards", None):
+            shard_ids = [int(i) for i in args.shards.split(",")]
+        shared_dir = config["SHARDING"].get("shared_dir", None)
+    # Without sharding the same files keep the spam lists and toggle across restarts
+    if shared_dir is None and "STATE" in config:
+        shared_dir = config["STATE"].get("snapshot_dir", None)
+    if shared_dir is not None:
+        os.makedirs(shared_dir, exist_ok=True)
+
+    # Block regexes, image only channels, log channels, spam lists and duplicates can be reloaded
+    rules = read_rules(config)
+
+    # Spam lists
+    if rules.spam_urls is not None:
+        BLOCK_LIST.set_url(rules.spam_urls[0],
+                           os.path.join(shared_dir, "block.idx") if shared_dir is not None else None)
+        SUS_LIST.set_url(rules.spam_urls[1],
+                         os.path.join(shared_dir, "suspicious.idx") if shared_dir is not None else None)
 
-        update_interval = float(config["SPAM"]["update"])
-        scheduler = sched.scheduler()
-        BLOCK_LIST.update_and_schedule(scheduler, update_interval)
-        SUS_LIST.update_and_schedule(scheduler, update_interval)
+        for name, spam_list in (("block", BLOCK_LIST,), ("suspicious", SUS_LIST,),):
+            SPAM_LIST_AGE.set_function(
+                lambda l=spam_list: None if l.updated is None else time.time() - l.updated, name)
+            SPAM_LIST_SIZE.set_function(lambda l=spam_list: len(l), name)
 
-        scheduler_thread = threading.Thread(target=scheduler.run)
-        scheduler_thread.start()
+    # The spam toggle is shared by all processes and kept across restarts, the config only sets it
+    # when its value changed since the last start or reload
+    if shared_dir is not None:
+        DELETE_BLOCKED_MESSAGES.attach(os.path.join(shared_dir, "spam_enabled"))
+    if rules.spam_enabled is not None:
+        DELETE_BLOCKED_MESSAGES.set_from_config(rules.spam_enabled)
 
     # Logging channels
-    if "LOGGING" in config:
-        c = []
-        for channel, _ in config["LOGGING"].items():
-            c.append(int(channel))
-        BOT_LOG.set_channels(c)
+    if rules.log_channels is not None:
+        BOT_LOG.set_channels(rules.log_channels)
 
     # Setup GitHub
     if "GITHUB" not in config:
         print("Config must have [GITHUB] section.")
-        return
+        return None
     if "repository" not in config["GITHUB"]:
         print("Config must have \"repository\" under [GITHUB] section.")
-        return
+        return None
     if "organization" not in config["GITHUB"]:
         print("Config must have \"organization\" under [GITHUB] section.")
-        return
-    gh = github.Github(login_or_token=args.github)
-    repo = gh.get_repo(f"{config['GITHUB']['organization']}/{config['GITHUB']['repository']}")
+        return None
+    burst = int(config["GITHUB"].get("rate_burst", "10"))
+    reserve = int(config["GITHUB"].get("rate_reserve", "100"))
+    api_url = config["GITHUB"].get("api_url", "https://api.github.com")
+    # REST lookups and index syncs share the token's budget
+    rest_limiter = issues.RateLimiter(burst, reserve)
 
-    # Image only channels
-    image_only: List[Tuple[int, str]] = []
-    if "IMAGE_ONLY" in config:
-        for key, value in config["IMAGE_ONLY"].items():
-            try:
-                image_only.append((int(key), value,))
-            except ValueError:
-                logging.getLogger("bot").error(f"Invalid [IMAGE_ONLY] channel {key}.")
-    else:
-        logging.getLogger("bot").warning("Config does not contain an [IMAGE_ONLY] "
-                                         "section. Bot will not filter any channels.")
+    # Local index of the default repository's issues, for lookups and /gh autocomplete
+    issue_index = None
+    if config["GITHUB"].getboolean("index", False):
+        index_path = None
+        if shared_dir is not None:
+            index_path = os.path.join(shared_dir, f"issues.{min(shard_ids)}.json" if shard_ids else "issues.json")
+        issue_index = issues.IssueIndex(
+            config["GITHUB"]["organization"], config["GITHUB"]["repository"], args.github, api_url,
+            path=index_path, limiter=rest_limiter,
+            interval=float(config["GITHUB"].get("index_interval", "300"))
+        )
+        issues.GITHUB_INDEX_SIZE.set_function(lambda: len(issue_index))
+
+    issue_fetcher = issues.IssueFetcher(
+        issues.IssueCache(
+            github.Github(login_or_token=args.github, base_url=api_url),
+            ttl=float(config["GITHUB"].get("cache_ttl", "300")),
+            size=int(config["GITHUB"].get("cache_size", "256")),
+            limiter=rest_limiter
+        ),
+        workers=int(config["GITHUB"].get("workers", "4")),
+        graphql=issues.GraphQLResolver(
+            args.github,
+            config["GITHUB"].get("graphql_url", "https://api.github.com/graphql"),
+            limiter=issues.RateLimiter(burst, reserve)
+        ) if args.github and config["GITHUB"].getboolean("graphql", True) else None,
+        index=issue_index
+    )
+
+    # Client options
+    client_options = {}
+    if "CLIENT" in config:
+        client_options["guild_ready_timeout"] = float(config["CLIENT"].get("guild_ready_timeout", "2"))
+        try:
+            if "intents" in config["CLIENT"]:
+                client_options["intents"] = _parse_flags(discord.Intents, config["CLIENT"]["intents"], {
+                    "all": discord.Intents.all(),
+                    "default": discord.Intents.default(),
+                })
+            if "member_cache" in config["CLIENT"]:
+                client_options["member_cache_flags"] = _parse_flags(
+                    discord.MemberCacheFlags, config["CLIENT"]["member_cache"], {
+                        "all": discord.MemberCacheFlags.all(),
+                        "none": discord.MemberCacheFlags.none(),
+                        "intents": discord.MemberCacheFlags.from_intents(
+                            client_options.get("intents", discord.Intents.default())),
+                    })
+        except ValueError as e:
+            print(f"Invalid [CLIENT] option: {e}")
+            return None
+        # discord.py treats max_messages <= 0 as the default size, None disables the cache
+        max_messages = int(config["CLIENT"].get("max_messages", "1000"))
+        client_options["max_messages"] = max_messages if max_messages > 0 else None
+        client_options["chunk_guilds_at_startup"] = config["CLIENT"].getboolean("chunk_guilds_at_startup", False)
+
+    if sharding:
+        shard_count = config["SHARDING"].get("shard_count", None)
+        client_options["shard_count"] = int(shard_count) if shard_count else None
+        client_options["shard_ids"] = shard_ids
+        client_options["spam_leader"] = shard_ids is None or 0 in shard_ids
+    # Processes of a sharded deployment are told apart by their first shard
+    group = min(shard_ids) if shard_ids else 0
+
+    # Metrics endpoint
+    if "METRICS" in config:
+        client_options["metrics_server"] = metrics.MetricsServer(
+            config["METRICS"].get("host", "127.0.0.1"),
+            int(config["METRICS"].get("port", "9100")) + group
+        )
+
+    # Embed owners for react-removal, each process only sees the messages of its own guilds
+    embed_owners = utils.EmbedOwnerIndex()
+    if "STATE" in config:
+        path = config["STATE"].get("embed_owners", None)
+        if path is not None and shard_ids is not None:
+            root, ext = os.path.splitext(path)
+            path = f"{root}.{group}{ext}"
+        embed_owners = utils.EmbedOwnerIndex(
+            size=int(config["STATE"].get("embed_owners_size", "10000")),
+            path=path
+        )
+
+    # Skip GitHub references embedded in the same channel recently
+    dedup_window = float(config["GITHUB"].get("dedup_window", "0"))
+    recent_embeds = utils.RecentEmbeds(dedup_window) if dedup_window > 0 else None
+
+    # Check the content type of links in image only channels
+    image_verifier = None
+    if "IMAGES" in config and config["IMAGES"].getboolean("verify", False):
+        image_verifier = utils.ImageVerifier(
+            timeout=float(config["IMAGES"].get("timeout", "2")),
+            size=int(config["IMAGES"].get("cache_size", "4096")),
+            max_urls=int(config["IMAGES"].get("max_urls", "3"))
+        )
+
+    bot = (ShardedBot if sharding else Bot)(
+        issue_fetcher, config["GITHUB"]["organization"], config["GITHUB"]["repository"], rules.image_only,
+        rules.block_regex, rules.spam_update, embed_owners=embed_owners, recent_embeds=recent_embeds,
+        dedup_pointer=config["GITHUB"].getboolean("dedup_pointer", False), image_verifier=image_verifier,
+        duplicates=rules.duplicates, delete_duplicates=rules.delete_duplicates,
+        config_path=args.config, rules=rules, **client_options
+    )
+    slash = Slash(issue_fetcher, config["GITHUB"]["organization"], config["GITHUB"]["repository"],
+                  rules.image_only, embed_owners, client=bot, debug_guild=args.debug_guild, sync_commands=True)
+    bot.add_reload_listener(slash.set_rules)
+    return bot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunky Discord Bot")
+    parser.add_argument("discord", help="Discord API key.")
+    parser.add_argument("--github", help="Github API key.", default=None)
+    parser.add_argument("--log-level", help="Log level (default INFO).", default="INFO")
+    parser.add_argument("--log-format", help="Log format, json or text (default json).", default="json",
+                        choices=["json", "text"])
+    parser.add_argument("--config", help="Path to the config file.",
+                        default="config.ini")
+    parser.add_argument("--debug-guild", help="Debug guild id.", default=None)
+    parser.add_argument("--shards", help="Comma separated shard ids run by this process, "
+                                         "with a [SHARDING] section (default all).", default=None)
+    args = parser.parse_args()
 
-    bot = Bot(gh, config["GITHUB"]["organization"], config["GITHUB"]["repository"], image_only, block_regex)
-    _slash = Slash(gh, config["GITHUB"]["organization"], config["GITHUB"]["repository"],
-                   image_only, client=bot, debug_guild=args.debug_guild, sync_commands=True)
+    # Setup logging
+    if args.log_level not in LOG_LEVEL_MAP.keys():
+        print("Log level must be one of: ALL, DEBUG, INFO, WARN, ERROR, FATAL")
+        return
+    listener = log.setup_logging(LOG_LEVEL_MAP.get(args.log_level), args.log_format == "json")
+
+    try:
+        bot = create_bot(args)
+        if bot is None:
+            return
 
-    # OAUTH2 must have `bot` and `applications.commands` scopes
-    # Bot permissions: 274877982784
-    bot.run(args.discord)
+        # OAUTH2 must have `bot` and `applications.commands` scopes
+        # Bot permissions: 274877982784
+        bot.run(args.discord)
+    finally:
+        listener.stop()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,200 @@
+import bisect
+import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import aiohttp.web
+
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+
+class _Metric:
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _label_string(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [f"{name}=\"{_escape(str(value))}\"" for name, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """ Monotonically increasing count, optionally split by label values. """
+
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{self._label_string(labels)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """ Value that can go up and down, either set directly or read from a callback when scraped. """
+
+    TYPE = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], Optional[float]]] = {}
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def set_function(self, function: Callable[[], Optional[float]], *labels: str):
+        self._functions[labels] = function
+
+    def samples(self) -> Iterator[str]:
+        values = dict(self._values)
+        for labels, function in list(self._functions.items()):
+            try:
+                value = function()
+            except Exception as e:
+                logging.getLogger("metrics").warning(f"Failed to read gauge {self.name}: {e!r}")
+                continue
+            if value is not None:
+                values[labels] = value
+        for labels, value in values.items():
+            yield f"{self.name}{self._label_string(labels)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """ Distribution of observed values in cumulative buckets. """
+
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self._buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        bucket = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                values = self._values[labels] = ([0] * len(self._buckets), [0.0])
+            values[0][bucket] += 1
+            values[1][0] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        """ Observe the time spent in a `with` block. """
+        return _Timer(self, labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(labels, list(counts), total[0]) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self._buckets, counts):
+                cumulative += count
+                le = f"le=\"{_format_value(bound)}\""
+                yield f"{self.name}_bucket{self._label_string(labels, le)} {cumulative}"
+            yield f"{self.name}_sum{self._label_string(labels)} {_format_value(total)}"
+            yield f"{self.name}_count{self._label_string(labels)} {cumulative}"
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *_exc):
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """ Render all metrics in the Prometheus text exposition format. """
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class MetricsServer:
+    """ Serves `REGISTRY` at `/metrics` on a local port. """
+
+    _LOGGER = logging.getLogger("metrics")
+
+    def __init__(self, host: str, port: int):
+        self._host = host
+        self._port = port
+        self._runner: Optional[aiohttp.web.AppRunner] = None
+
+    async def _metrics(self, _request: aiohttp.web.Request) -> aiohttp.web.Response:
+        return aiohttp.web.Response(
+            body=REGISTRY.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    async def start(self):
+        app = aiohttp.web.Application()
+        app.router.add_get("/metrics", self._metrics)
+        self._runner = aiohttp.web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await aiohttp.web.TCPSite(self._runner, self._host, self._port).start()
+        self._LOGGER.info(f"Serving metrics on http://{self._host}:{self._port}/metrics")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
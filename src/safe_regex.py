@@ -0,0 +1,261 @@
+"""
+Guards against [BLOCK] regexes that backtrack catastrophically.
+
+`risk` finds the regex shapes that make Python's backtracking engine take
+exponential or high polynomial time. `RegexWorker` matches such rules in a
+separate process that is killed when a message takes longer than its time
+budget, so one crafted message cannot stall the event loop. Run as a script,
+this module is that worker.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+from typing import List, Optional, Set, Tuple
+
+try:
+    import re._parser as _parser
+    import re._constants as _constants
+except ImportError:  # Python < 3.11
+    import sre_parse as _parser
+    import sre_constants as _constants
+
+_REPEATS = {_constants.MAX_REPEAT, _constants.MIN_REPEAT}
+_SMALL_REPEAT = 10
+# Unbounded repeats in a row that can match the same characters, `.*a.*b.*c` is O(n^3)
+_MAX_OVERLAPPING_REPEATS = 2
+
+# First characters of a pattern: a set of code points, or None for "could be anything"
+_First = Optional[Set[int]]
+
+# ASCII approximations of the classes that don't match almost everything
+_CATEGORIES = {
+    _constants.CATEGORY_DIGIT: set(range(ord("0"), ord("9") + 1)),
+    _constants.CATEGORY_SPACE: {ord(c) for c in " \t\n\r\f\v"},
+    _constants.CATEGORY_WORD: {ord(c) for c in "_0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"},
+}
+
+
+def _is_large(hi: int) -> bool:
+    return hi == _constants.MAXREPEAT or hi > _SMALL_REPEAT
+
+
+def _first(items) -> _First:
+    """ Code points the pattern can start with, None if it can start with (nearly) any character. """
+    for i, (op, av) in enumerate(items):
+        if op is _constants.LITERAL:
+            return {av}
+        if op is _constants.IN:
+            chars = set()
+            for in_op, in_av in av:
+                if in_op is _constants.LITERAL:
+                    chars.add(in_av)
+                elif in_op is _constants.RANGE and in_av[1] - in_av[0] < 256:
+                    chars.update(range(in_av[0], in_av[1] + 1))
+                elif in_op is _constants.CATEGORY and in_av in _CATEGORIES:
+                    chars |= _CATEGORIES[in_av]
+                else:
+                    return None
+            return chars
+        if op is _constants.SUBPATTERN:
+            return _first(av[-1])
+        if op is _constants.BRANCH:
+            chars = set()
+            for branch in av[1]:
+                first = _first(branch)
+                if first is None:
+                    return None
+                chars |= first
+            return chars
+        if op in _REPEATS:
+            first = _first(av[2])
+            if av[0] > 0 or first is None:
+                return first
+            # Optional, the pattern may start with what follows as well
+            rest = _first(items[i + 1:])
+            return None if rest is None else first | rest
+        if op is _constants.AT:
+            continue
+        return None
+    return set()
+
+
+def _overlap(a: _First, b: _First) -> bool:
+    return a is None or b is None or len(a & b) > 0
+
+
+def _branches(items):
+    """ The alternations a pattern starts with, looking through groups but not repeats. """
+    for op, av in items:
+        if op is _constants.BRANCH:
+            yield av[1]
+        elif op is _constants.SUBPATTERN:
+            yield from _branches(av[-1])
+
+
+def _check(items, outer: int) -> Optional[str]:
+    """ Check a parsed pattern, `outer` is the product of the bounds of the enclosing repeats (1 outside any). """
+    # First characters of the unbounded repeats since the last item none of them can match
+    overlapping: List[_First] = []
+    for i, (op, av) in enumerate(items):
+        if not (op in _REPEATS and _is_large(av[1])) and op is not _constants.AT:
+            first = _first(items[i:i + 1])
+            if not any(_overlap(first, other) for other in overlapping):
+                overlapping = []
+        if op in _REPEATS:
+            lo, hi, sub = av
+            # A variable repeat inside another repeat can split the text in as many ways as the
+            # bounds multiply to, `(.{1,10}){1,10}` tries billions of splits of 60 characters
+            if lo != hi and outer > 1 and _is_large(outer * hi):
+                return "nested quantifier"
+            if _is_large(hi):
+                for alternatives in _branches(sub):
+                    firsts = [_first(branch) for branch in alternatives]
+                    for i, a in enumerate(firsts):
+                        if any(_overlap(a, b) for b in firsts[i + 1:]):
+                            return "overlapping alternatives under a quantifier"
+                first = _first(sub)
+                if any(_overlap(first, other) for other in overlapping):
+                    overlapping.append(first)
+                    if len(overlapping) > _MAX_OVERLAPPING_REPEATS:
+                        return "several unbounded quantifiers over the same characters"
+                else:
+                    overlapping = [first]
+            reason = _check(sub, outer * hi)
+            if reason is not None:
+                return reason
+        elif op is _constants.SUBPATTERN:
+            reason = _check(av[-1], outer)
+            if reason is not None:
+                return reason
+        elif op is _constants.BRANCH:
+            for branch in av[1]:
+                reason = _check(branch, outer)
+                if reason is not None:
+                    return reason
+        elif op in (_constants.ASSERT, _constants.ASSERT_NOT):
+            reason = _check(av[1], outer)
+            if reason is not None:
+                return reason
+        elif op is _constants.GROUPREF and _is_large(outer):
+            return "backreference under a quantifier"
+        elif op is _constants.GROUPREF_EXISTS:
+            for branch in av[1:]:
+                if branch is not None:
+                    reason = _check(branch, outer)
+                    if reason is not None:
+                        return reason
+    return None
+
+
+def risk(regex: str) -> Optional[str]:
+    """
+    Why `regex` may backtrack catastrophically, or None if it looks safe.
+    Raises `re.error` if it does not compile. The check is conservative, a
+    flagged rule is not necessarily slow but an unflagged one is bounded.
+    """
+    re.compile(regex)
+    return _check(_parser.parse(regex), 1)
+
+
+class RegexWorker:
+    """
+    Matches rules in a child process with a time budget per message.
+
+    A message that takes longer than `timeout` seconds kills the worker,
+    which is started again for the next message. Requests are sent one at a
+    time, like `BlockMatcher.match` the first matching rule wins.
+    """
+
+    _LOGGER = logging.getLogger("safe_regex")
+
+    # Starting the interpreter is not part of any message's budget
+    STARTUP_TIMEOUT = 10.0
+
+    def __init__(self, rules: List[Tuple[str, str]], timeout: float = 0.05):
+        self._rules = rules
+        self._timeout = timeout
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.timeouts = 0
+
+    async def _start(self) -> asyncio.subprocess.Process:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__),
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE
+        )
+        process.stdin.write(json.dumps(self._rules).encode("utf-8") + b"\n")
+        try:
+            await process.stdin.drain()
+            ready = await asyncio.wait_for(process.stdout.readline(), self.STARTUP_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            ready = b""
+        if ready != b"ready\n":
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            raise RuntimeError("The regex worker failed to start")
+        return process
+
+    async def match(self, text: str) -> Optional[str]:
+        """
+        Get the name of the first rule matching the start of the text. Raises
+        `asyncio.TimeoutError` if it takes too long, and `RuntimeError` if
+        the worker could not be started or exited.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._process is None or self._process.returncode is not None:
+                self._process = await self._start()
+            process = self._process
+            process.stdin.write(json.dumps(text).encode("utf-8") + b"\n")
+            try:
+                await process.stdin.drain()
+                line = await asyncio.wait_for(process.stdout.readline(), self._timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self._LOGGER.warning("A message took over %ss against the isolated [BLOCK] rules, "
+                                     "restarting the worker.", self._timeout)
+                await self._kill()
+                raise
+            except ConnectionError:
+                line = b""
+            if len(line) == 0:
+                await self._kill()
+                raise RuntimeError("The regex worker exited")
+            return json.loads(line)
+
+    async def _kill(self):
+        process, self._process = self._process, None
+        if process is not None and process.returncode is None:
+            process.kill()
+            await process.wait()
+
+    async def close(self):
+        if self._lock is None:
+            await self._kill()
+            return
+        async with self._lock:
+            await self._kill()
+
+
+def _serve():
+    rules = [(name, re.compile(regex)) for name, regex in json.loads(sys.stdin.readline())]
+    sys.stdout.write("ready\n")
+    sys.stdout.flush()
+    for line in sys.stdin:
+        text = json.loads(line)
+        result = None
+        for name, pattern in rules:
+            if pattern.match(text) is not None:
+                result = name
+                break
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    _serve()
@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import mmap
+import os
+import struct
+from typing import Iterable, Optional
+
+
+def _hash(domain: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(domain, digest_size=8).digest(), "little")
+
+
+class DomainIndex:
+    """
+    Read-only set of domains in a memory-mapped file, so every process of a
+    sharded deployment shares one copy of a spam list through the page cache.
+
+    The file is an open addressing hash table: a header, then `slots` entries
+    of (hash, offset, length) and the domain bytes they point at. Writers
+    replace the file atomically, readers keep the mapping they opened until
+    they reopen it.
+    """
+
+    MAGIC = b"DOMIDX01"
+    _HEADER = struct.Struct("<8sII")
+    _SLOT = struct.Struct("<QII")
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(f.fileno())
+        self.path = path
+        self.version = (stat.st_ino, stat.st_mtime_ns)
+        magic, self._slots, self._count = self._HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a domain index")
+        self._mask = self._slots - 1
+
+    @staticmethod
+    def write(path: str, domains: Iterable[str]):
+        """ Write an index of `domains` to `path`, replacing any previous index atomically. """
+        encoded = sorted({d.strip().lower().encode("utf-8") for d in domains} - {b""})
+        slots = 1
+        while slots < len(encoded) * 2:
+            slots *= 2
+        mask = slots - 1
+
+        table = bytearray(slots * DomainIndex._SLOT.size)
+        blob = bytearray()
+        start = DomainIndex._HEADER.size + len(table)
+        for domain in encoded:
+            h = _hash(domain)
+            slot = h & mask
+            while DomainIndex._SLOT.unpack_from(table, slot * DomainIndex._SLOT.size)[2] != 0:
+                slot = (slot + 1) & mask
+            DomainIndex._SLOT.pack_into(table, slot * DomainIndex._SLOT.size, h, start + len(blob), len(domain))
+            blob += domain
+
+        # Write to a temporary file first so readers never map a partial index
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(DomainIndex._HEADER.pack(DomainIndex.MAGIC, slots, len(encoded)))
+            f.write(table)
+            f.write(blob)
+        os.replace(tmp, path)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, domain: str) -> bool:
+        encoded = domain.encode("utf-8")
+        h = _hash(encoded)
+        slot = h & self._mask
+        while True:
+            stored, offset, length = self._SLOT.unpack_from(self._map, self._HEADER.size + slot * self._SLOT.size)
+            if length == 0:
+                return False
+            if stored == h and self._map[offset:offset + length] == encoded:
+                return True
+            slot = (slot + 1) & self._mask
+
+    def changed(self) -> bool:
+        """ Whether the file has been replaced since this index was opened. """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns) != self.version
+
+    def close(self):
+        self._map.close()
+
+
+class SharedFlag:
+    """
+    A boolean setting, optionally backed by a one byte memory-mapped file so
+    that a change made by any process is seen by all of them immediately.
+    """
+
+    _LOGGER = logging.getLogger("shared")
+
+    def __init__(self, value: bool = False):
+        self._value = value
+        self._map: Optional[mmap.mmap] = None
+        self._config_path: Optional[str] = None
+
+    def attach(self, path: str):
+        """ Share the flag through `path`. An existing file keeps its value, a new one takes ours. """
+        if not os.path.exists(path):
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(b"\x01" if self._value else b"\x00")
+            try:
+                # Only the first process to get here creates the file
+                os.link(tmp, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp)
+        with open(path, "r+b") as f:
+            self._map = mmap.mmap(f.fileno(), 1)
+        self._config_path = f"{path}.config"
+        self._LOGGER.info(f"Sharing flag through {path}, currently {self.get()}.")
+
+    def set_from_config(self, value: bool):
+        """
+        Set the flag to a value from the config. Once attached, only a value that differs from the
+        config value seen last is applied, so a `set` made since is kept across restarts.
+        """
+        if self._config_path is None:
+            self.set(value)
+            return
+        recorded = b"\x01" if value else b"\x00"
+        try:
+            with open(self._config_path, "rb") as f:
+                if f.read(1) == recorded:
+                    return
+        except FileNotFoundError:
+            pass
+        self.set(value)
+        tmp = f"{self._config_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(recorded)
+        os.replace(tmp, self._config_path)
+        self._LOGGER.info(f"Flag set to {value} by the changed config.")
+
+    def get(self) -> bool:
+        if self._map is not None:
+            return self._map[0] != 0
+        return self._value
+
+    def set(self, value: bool):
+        self._value = value
+        if self._map is not None:
+            self._map[0] = 1 if value else 0
+
+    def __bool__(self):
+        return self.get()
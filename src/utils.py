@@ -1,28 +1,41 @@
-import sched
-from typing import Optional, Iterator, Tuple
+import asyncio
+import collections
+import ipaddress
+import json
+import os
+import random
+import time
+from typing import Callable, Collection, Dict, Optional, Iterator, List, Tuple
 import logging
 import re
 import urllib.parse
 
-import requests
+import aiohttp
+import aiohttp.abc
 import discord
 import github
-import github.Repository
+import yarl
+
+import issues
+import safe_regex
+import shared
 
 IMAGE_SUFFIXES = [
     ".jpg", ".jpeg", ".png", ".tif", ".tiff", ".webp", ".gif", ".gifv", ".mp4", ".webm", ".mov"
 ]
 
+_IMAGE_SUFFIXES = tuple(IMAGE_SUFFIXES)
+
 URL_REGEX = re.compile(r"http\S*")
+# Names are bounded like GitHub's (39 characters for owners, 100 for repositories) and only start a
+# match at the start of a word, so a long word before a '#' is scanned once instead of once per character.
+# A bare '#' may follow a word, so "#12#13" still has two references.
+GH_REGEX = re.compile(r"(\\)?(?:(?<![-\w])|(?=#))(([a-zA-Z\d][-a-zA-Z\d]{1,38})/)?([-\w]{1,100})?#(\d+)")
 
 
 def _match_fname(filename: str) -> bool:
     """ Match a filename against the allowable image suffixes. """
-    fname = filename.lower()
-    for suffix in IMAGE_SUFFIXES:
-        if fname.endswith(suffix):
-            return True
-    return False
+    return filename.lower().endswith(_IMAGE_SUFFIXES)
 
 
 def get_urls(text: str) -> Iterator[urllib.parse.ParseResult]:
@@ -34,8 +47,60 @@ def get_urls(text: str) -> Iterator[urllib.parse.ParseResult]:
             pass
 
 
-def is_image(message: discord.Message) -> bool:
-    """ Check if a message contains an image either through an attachment or link. """
+class MessageAnalysis:
+    """
+    Parse-once view of a message's content, shared by every check in
+    `on_message`. Each field is computed the first time it is used.
+    """
+
+    __slots__ = ("content", "_urls", "_hosts", "_paths", "_gh_refs", "_everyone")
+
+    def __init__(self, content: str):
+        self.content = content
+        self._urls: Optional[List[urllib.parse.ParseResult]] = None
+        self._hosts: Optional[List[str]] = None
+        self._paths: Optional[List[str]] = None
+        self._gh_refs: Optional[List[Tuple[str, ...]]] = None
+        self._everyone: Optional[bool] = None
+
+    @property
+    def urls(self) -> List[urllib.parse.ParseResult]:
+        if self._urls is None:
+            self._urls = list(get_urls(self.content)) if "http" in self.content else []
+        return self._urls
+
+    @property
+    def hosts(self) -> List[str]:
+        """ Lowercased host name of each URL that has one, without user info or port. """
+        if self._hosts is None:
+            self._hosts = [url.hostname for url in self.urls if url.hostname]
+        return self._hosts
+
+    @property
+    def paths(self) -> List[str]:
+        """ Lowercased path of each URL. """
+        if self._paths is None:
+            self._paths = [url.path.lower() for url in self.urls]
+        return self._paths
+
+    @property
+    def gh_refs(self) -> List[Tuple[str, ...]]:
+        """ `GH_REGEX` matches, references need a `#` so most messages skip the scan. """
+        if self._gh_refs is None:
+            self._gh_refs = GH_REGEX.findall(self.content) if "#" in self.content else []
+        return self._gh_refs
+
+    @property
+    def mentions_everyone(self) -> bool:
+        """ Whether the text contains @everyone or @here, whether or not it pinged anyone. """
+        if self._everyone is None:
+            self._everyone = "@" in self.content and \
+                ("@everyone" in self.content or "@here" in self.content)
+        return self._everyone
+
+
+def _has_image_media(message: discord.Message) -> bool:
+    """ Check for an uploaded image or an image embed. """
     # Image(s) were uploaded
     if len(message.attachments) > 0:
         for attachment in message.attachments:
@@ -43,11 +108,6 @@ def is_image(message: discord.Message) -> bool:
                     _match_fname(attachment.filename):
                 return True
 
-    # Check for an image URL
-    for url in get_urls(message.content):
-        if _match_fname(url.path):
-            return True
-
     # Check for an image embed
     for embed in message.embeds:
         if embed.image.url != discord.Embed.Empty:
@@ -61,6 +121,175 @@ def is_image(message: discord.Message) -> bool:
     return False
 
 
+def is_image(message: discord.Message, analysis: Optional[MessageAnalysis] = None) -> bool:
+    """ Check if a message contains an image either through an attachment or link. """
+    if _has_image_media(message):
+        return True
+
+    # Check for an image URL
+    if analysis is None:
+        analysis = MessageAnalysis(message.content)
+    for path in analysis.paths:
+        if path.endswith(_IMAGE_SUFFIXES):
+            return True
+    return False
+
+
+def _is_public(address: str) -> bool:
+    """ Whether an IP address is globally reachable, so fine to send requests to. """
+    try:
+        return ipaddress.ip_address(address.split("%", 1)[0]).is_global
+    except ValueError:
+        return False
+
+
+class _PublicResolver(aiohttp.abc.AbstractResolver):
+    """
+    Resolves names like aiohttp's default resolver, but only returns global
+    addresses, so names pointing at the host or the internal network are
+    never connected to.
+    """
+
+    def __init__(self):
+        self._resolver = aiohttp.DefaultResolver()
+
+    async def resolve(self, host: str, port: int = 0, family: int = 0) -> List[Dict]:
+        hosts = [h for h in await self._resolver.resolve(host, port, family) if _is_public(h["host"])]
+        if len(hosts) == 0:
+            raise OSError(f"{host} has no public address")
+        return hosts
+
+    async def close(self):
+        await self._resolver.close()
+
+
+class ImageVerifier:
+    """
+    Checks whether links in image only channels really serve images, by the
+    `Content-Type` of a HEAD request, or of a one byte ranged GET for servers
+    that refuse HEAD. This allows extensionless image links and catches
+    `foo.png` links to HTML pages.
+
+    Only successful answers and clear 404 / 410 answers give a verdict.
+    Verdicts are kept in a bounded LRU cache keyed by URL, so reposts cost
+    nothing. Links that cannot be checked in time, or whose host refuses,
+    rate limits or fails, fall back to the filename suffix and are asked
+    again next time. Only public addresses are ever requested: names are resolved
+    and their private addresses dropped, and redirects are followed one by
+    one so each target is checked the same way.
+    """
+
+    _LOGGER = logging.getLogger("image_verifier")
+
+    CONTENT_TYPES = ("image/", "video/")
+    REDIRECTS = (301, 302, 303, 307, 308)
+    MAX_REDIRECTS = 3
+    MISSING = (404, 410)
+
+    def __init__(self, timeout: float = 2.0, size: int = 4096, max_urls: int = 3, allow_private: bool = False):
+        self._timeout = timeout
+        self._size = size
+        self._max_urls = max_urls
+        self._allow_private = allow_private
+        self._verdicts: "collections.OrderedDict[str, bool]" = collections.OrderedDict()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.requests = 0
+
+    def __len__(self):
+        return len(self._verdicts)
+
+    def _checkable(self, url: urllib.parse.ParseResult) -> bool:
+        if url.scheme not in ("http", "https") or not url.hostname:
+            return False
+        if self._allow_private:
+            return True
+        try:
+            ipaddress.ip_address(url.hostname)
+        except ValueError:
+            return True  # A name, its addresses are checked when it is resolved
+        return _is_public(url.hostname)
+
+    def _content_type(self, res: aiohttp.ClientResponse) -> Optional[str]:
+        content_type = res.headers.get("Content-Type")
+        if content_type is None:
+            return None
+        return content_type.split(";", 1)[0].strip().lower()
+
+    async def _request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None) \
+            -> Tuple[int, Optional[str]]:
+        """ Status and content type of a URL, following redirects only to links that may be checked. """
+        for _ in range(self.MAX_REDIRECTS + 1):
+            self.requests += 1
+            async with self._session.request(method, url, headers=headers, allow_redirects=False) as res:
+                location = res.headers.get("Location")
+                if res.status not in self.REDIRECTS or location is None:
+                    return res.status, self._content_type(res)
+                url = str(res.url.join(yarl.URL(location)))
+            if not self._checkable(urllib.parse.urlparse(url)):
+                raise ValueError(f"Redirect to {url} is not checked")
+        raise ValueError("Too many redirects")
+
+    async def _fetch(self, url: str) -> Optional[bool]:
+        if self._session is None:
+            connector = None if self._allow_private else aiohttp.TCPConnector(resolver=_PublicResolver())
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self._timeout))
+        status, content_type = await self._request("HEAD", url)
+        if status in (405, 501) or (status < 400 and content_type is None):
+            # Some servers don't answer HEAD, ask for the first byte instead
+            status, content_type = await self._request("GET", url, {"Range": "bytes=0-0"})
+        if status in self.MISSING:
+            return False
+        if status >= 300 or content_type is None:
+            return None  # Refused, rate limited or failed, that says nothing about the link
+        return content_type.startswith(self.CONTENT_TYPES)
+
+    async def verify(self, url: urllib.parse.ParseResult) -> Optional[bool]:
+        """ Whether a link serves an image, or None if that could not be found out. """
+        if not self._checkable(url):
+            return None
+        key = url.geturl()
+        verdict = self._verdicts.get(key)
+        if verdict is not None:
+            self._verdicts.move_to_end(key)
+            return verdict
+
+        try:
+            # The whole check is bounded, not each of its requests and redirects
+            verdict = await asyncio.wait_for(self._fetch(key), self._timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self._LOGGER.info("Could not verify %s: %r", key, e)
+            return None
+        if verdict is None:
+            return None
+        self._verdicts[key] = verdict
+        if len(self._verdicts) > self._size:
+            self._verdicts.popitem(last=False)
+        return verdict
+
+    async def is_image(self, message: discord.Message, analysis: Optional[MessageAnalysis] = None) -> bool:
+        """ `is_image` that verifies links instead of trusting their suffix. """
+        # Attachments and embeds need no requests
+        if _has_image_media(message):
+            return True
+
+        if analysis is None:
+            analysis = MessageAnalysis(message.content)
+        urls = analysis.urls[:self._max_urls]
+        verdicts = await asyncio.gather(*[self.verify(url) for url in urls])
+        for url, verdict in zip(urls, verdicts):
+            if verdict is None:
+                verdict = _match_fname(url.path)
+            if verdict:
+                return True
+        return False
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
 def clip_string_length(string: Optional[str], length: int) -> str:
     """ Clip a string to some amount of characters. """
     if string is None:
@@ -79,104 +308,546 @@ def ensure_embeddable(string: Optional[str]) -> str:
     return string
 
 
-def generate_gh_embed(issue: Tuple[str, str, int], gh: github.Github) -> \
+async def _fetch_issue(issue: Tuple[str, str, int], fetcher: issues.IssueFetcher) -> \
+        Optional[issues.IssueInfo]:
+    try:
+        return await fetcher.get(*issue)
+    except github.GithubException as e:
+        logging.getLogger("github").warning("Failed to fetch object number %s/%s. %s", issue[0], issue[1], e)
+        return None
+
+
+async def generate_gh_embed(issue: Tuple[str, str, int], fetcher: issues.IssueFetcher) -> \
         Optional[discord.Embed]:
     """ Generate a single discord embed from a GitHub issue / pull request number. """
-    try:
-        repo = gh.get_repo(f"{issue[0]}/{issue[1]}")
-        issue = repo.get_issue(int(issue[2]))
-        embed = discord.Embed(
-            title=issue.html_url,
-            url=issue.html_url,
+    info = await _fetch_issue(issue, fetcher)
+    if info is None:
+        return None
+    if info.is_link:
+        return discord.Embed(
+            title=info.html_url,
+            url=info.html_url,
             type="rich",
-            description=ensure_embeddable(issue.title),
+            description="GitHub rate limit reached, details are unavailable.",
         )
-        embed.add_field(
-            name="By",
-            value=ensure_embeddable(issue.user.login),
-            inline=True
-        )
-        embed.add_field(
-            name="Status",
-            value=issue.state,
-            inline=True
-        )
-        embed.add_field(
-            name="Description",
-            value=ensure_embeddable(clip_string_length(issue.body, 200)),
-            inline=False
-        )
-        return embed
-    except github.GithubException as e:
-        logging.getLogger("github").warning(
-            f"Failed to fetch object number {issue[0]}/{issue[1]}. "
-            f"{e}")
+
+    embed = discord.Embed(
+        title=info.html_url,
+        url=info.html_url,
+        type="rich",
+        description=ensure_embeddable(info.title),
+    )
+    embed.add_field(
+        name="By",
+        value=ensure_embeddable(info.author),
+        inline=True
+    )
+    embed.add_field(
+        name="Status",
+        value=info.state,
+        inline=True
+    )
+    embed.add_field(
+        name="Description",
+        value=ensure_embeddable(clip_string_length(info.body, 200)),
+        inline=False
+    )
+    return embed
+
+
+def generate_gh_embed_snippet(embed: discord.Embed, info: issues.IssueInfo):
+    """ Generate a partial discord embed from a GitHub issue / pull request. """
+    embed.add_field(
+        name="Link",
+        value=info.html_url,
+        inline=False
+    )
+    if info.is_link:
+        return
+    embed.add_field(
+        name="Title",
+        value=ensure_embeddable(info.title),
+        inline=True
+    )
+    embed.add_field(
+        name="By",
+        value=ensure_embeddable(info.author),
+        inline=True
+    )
+    embed.add_field(
+        name="Status",
+        value=info.state,
+        inline=True
+    )
+
+
+async def generate_gh_embed_multiple(issue_list: List[Tuple[str, str, int]],
+                                     fetcher: issues.IssueFetcher) -> discord.Embed:
+    """ Generate a discord embed from several GitHub issue / pull request numbers, fetched together. """
+    infos = await fetcher.get_many(issue_list)
+    embed = discord.Embed(title="Issues / pull requests")
+    for info in infos:
+        if info is not None:
+            generate_gh_embed_snippet(embed, info)
+    return embed
+
+
+class EmbedOwnerIndex:
+    """
+    Bounded map from the ids of embed messages the bot posted to the id of
+    the user who asked for them, so react-removal needs no requests.
+
+    The least recently added entries are dropped first. If a path is given
+    the index is loaded from and periodically saved to that JSON file.
+    """
+
+    _LOGGER = logging.getLogger("embed_owners")
+
+    def __init__(self, size: int = 10000, path: Optional[str] = None):
+        self._size = size
+        self._path = path
+        self._owners: "collections.OrderedDict[int, int]" = collections.OrderedDict()
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._owners)
+
+    def add(self, message_id: int, user_id: int):
+        self._owners[message_id] = user_id
+        if len(self._owners) > self._size:
+            self._owners.popitem(last=False)
+        self._dirty = True
+
+    def get(self, message_id: int) -> Optional[int]:
+        return self._owners.get(message_id)
+
+    def remove(self, message_id: int):
+        if self._owners.pop(message_id, None) is not None:
+            self._dirty = True
+
+    def load(self):
+        if self._path is None or not os.path.exists(self._path):
+            return
+        try:
+            with open(self._path, "r") as f:
+                for message_id, user_id in json.load(f):
+                    self._owners[int(message_id)] = int(user_id)
+        except (OSError, ValueError, TypeError) as e:
+            self._LOGGER.warning(f"Failed to load embed owners from {self._path}: {e!r}")
+            return
+        while len(self._owners) > self._size:
+            self._owners.popitem(last=False)
+        self._LOGGER.info(f"Loaded {len(self._owners)} embed owners.")
+
+    def save(self):
+        if self._path is None or not self._dirty:
+            return
+        # Write to a temporary file first so a crash never leaves a partial index
+        tmp = f"{self._path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(list(self._owners.items()), f)
+        os.replace(tmp, self._path)
+        self._dirty = False
+
+    async def run(self, interval: float):
+        """ Save the index every `interval` seconds until cancelled. """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.save()
+            except OSError as e:
+                self._LOGGER.warning(f"Failed to save embed owners to {self._path}: {e!r}")
+
+
+class RecentEmbeds:
+    """
+    Issues / pull requests embedded per channel in the last `window` seconds,
+    with the id of the embed message, so repeated references can be skipped.
+
+    Entries are kept in the order they were posted, which is also the order
+    they expire in, so expiring is popping from the front. At most `size`
+    entries are kept.
+    """
+
+    def __init__(self, window: float, size: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self._window = window
+        self._size = size
+        self._clock = clock
+        self._posted: "collections.OrderedDict[Tuple[int, issues.IssueKey], Tuple[float, int]]" = \
+            collections.OrderedDict()
+        self._messages: Dict[int, List[Tuple[int, issues.IssueKey]]] = {}
+
+    def __len__(self):
+        return len(self._posted)
+
+    def _remove(self, key: Tuple[int, issues.IssueKey]):
+        _, message_id = self._posted.pop(key)
+        keys = self._messages[message_id]
+        keys.remove(key)
+        if len(keys) == 0:
+            del self._messages[message_id]
+
+    def _expire(self, now: float):
+        while len(self._posted) > 0:
+            key, (posted, _) = next(iter(self._posted.items()))
+            if now - posted < self._window:
+                break
+            self._remove(key)
+
+    def get(self, channel_id: int, ref: Tuple[str, str, int]) -> Optional[int]:
+        """ Id of the embed message if `ref` was embedded in the channel within the window. """
+        self._expire(self._clock())
+        entry = self._posted.get((channel_id, issues.issue_key(*ref)))
+        return entry[1] if entry is not None else None
+
+    def add(self, channel_id: int, refs: List[Tuple[str, str, int]], message_id: int):
+        now = self._clock()
+        self._expire(now)
+        for ref in refs:
+            key = (channel_id, issues.issue_key(*ref))
+            if key in self._posted:
+                self._remove(key)
+            self._posted[key] = (now, message_id)
+            self._messages.setdefault(message_id, []).append(key)
+            if len(self._posted) > self._size:
+                self._remove(next(iter(self._posted)))
+
+    def forget(self, message_id: int):
+        """ Forget the references of a deleted embed message, so they are embedded again. """
+        for key in self._messages.pop(message_id, ()):
+            del self._posted[key]
+
+
+class DuplicateDetector:
+    """
+    Spots one author posting the same text to several channels within a
+    sliding window of `window` seconds, the way raids do.
+
+    Content is normalized (case, punctuation and whitespace are ignored) and
+    fingerprinted. Each (author, fingerprint) entry holds the channels the
+    text was posted to with the message ids. Entries are kept in the order
+    they were last seen, so expiring is popping from the front and each
+    message costs O(1) amortized. At most `size` entries are kept and at
+    most `channels` channels per entry.
+    """
+
+    _NORMALIZE = re.compile(r"[\W_]+")
+
+    def __init__(self, channels: int = 3, window: float = 30.0, size: int = 10000, min_length: int = 8,
+                 clock: Callable[[], float] = time.monotonic):
+        self._channels = channels
+        self._window = window
+        self._size = size
+        self._min_length = min_length
+        self._clock = clock
+        # (author, fingerprint) -> [last seen, {channel id: (posted, message id)}]
+        self._entries: "collections.OrderedDict[Tuple[int, int], list]" = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def fingerprint(self, content: str) -> Optional[int]:
+        """ Fingerprint of the normalized content, None if it is too short to judge. """
+        text = self._NORMALIZE.sub(" ", content.casefold()).strip()
+        if len(text) < self._min_length:
+            return None
+        return hash(text)
+
+    def add(self, author_id: int, channel_id: int, message_id: int, content: str) -> List[Tuple[int, int]]:
+        """
+        Record a message. Once its text has been posted to `channels` channels
+        within the window, returns the (channel id, message id) of each copy
+        still in the window, this one included. Otherwise returns an empty list.
+        """
+        fingerprint = self.fingerprint(content)
+        if fingerprint is None:
+            return []
+        now = self._clock()
+        cutoff = now - self._window
+        while len(self._entries) > 0 and next(iter(self._entries.values()))[0] < cutoff:
+            self._entries.popitem(last=False)
+
+        key = (author_id, fingerprint)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [now, {}]
+            if len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+            entry[0] = now
+
+        copies = entry[1]
+        for channel in [c for c, (posted, _) in copies.items() if posted < cutoff]:
+            del copies[channel]
+        copies.pop(channel_id, None)
+        copies[channel_id] = (now, message_id)
+        if len(copies) > self._channels:
+            del copies[next(iter(copies))]
+
+        if len(copies) < self._channels:
+            return []
+        return [(channel, copy_id) for channel, (_, copy_id) in copies.items()]
+
+
+class BlockMatcher:
+    """
+    Matches a message against all [BLOCK] regexes in a single pass.
+
+    Rules are combined into one non-capturing alternation, which lets `re`
+    reject most messages with a single scan. Only when the combined pattern
+    matches are the rules tried one by one, in config order, to report which
+    rule fired. Rules that cannot be combined safely (global inline flags or
+    numbered backreferences) are matched on their own, keeping their place in
+    the order.
+
+    Rules that may backtrack catastrophically (see `safe_regex.risk`) are
+    handled as `pathological` says: "allow" matches them like the others,
+    "reject" drops them, and "isolate" leaves them to `match_isolated`, which
+    runs them in a worker process with a `timeout` per message.
+    """
+
+    _LOGGER = logging.getLogger("block_matcher")
+    _BACKREF_REGEX = re.compile(r"\\[1-9]|\(\?\([1-9]")
+    _DEFAULT_FLAGS = re.compile("").flags
+    PATHOLOGICAL = ("allow", "reject", "isolate",)
+
+    def __init__(self, rules: List[Tuple[str, str]], pathological: str = "allow", timeout: float = 0.05):
+        if pathological not in self.PATHOLOGICAL:
+            raise ValueError(f"Unknown pathological rule handling {pathological!r}, "
+                             f"must be one of: {', '.join(self.PATHOLOGICAL)}")
+        self._rules = rules
+        self._segments: List[Tuple[re.Pattern, List[Tuple[str, re.Pattern]]]] = []
+        self.pathological = pathological
+        self.flagged: List[Tuple[str, str]] = []
+        isolated: List[Tuple[str, str]] = []
+
+        chunk: List[Tuple[str, re.Pattern]] = []
+        for name, regex in rules:
+            reason = safe_regex.risk(regex)
+            if reason is not None:
+                self.flagged.append((name, reason,))
+                self._LOGGER.warning(f"[BLOCK] rule {name} may backtrack catastrophically ({reason}), "
+                                     f"handled with {pathological}.")
+                if pathological == "reject":
+                    continue
+                if pathological == "isolate":
+                    isolated.append((name, regex,))
+                    continue
+            pattern = re.compile(regex)
+            if pattern.flags != self._DEFAULT_FLAGS or \
+                    (pattern.groups > 0 and self._BACKREF_REGEX.search(regex)):
+                self._add_chunk(chunk)
+                chunk = []
+                self._segments.append((pattern, [(name, pattern,)],))
+            else:
+                chunk.append((name, pattern,))
+        self._add_chunk(chunk)
+        self._worker = safe_regex.RegexWorker(isolated, timeout) if len(isolated) > 0 else None
+
+    def _add_chunk(self, chunk: List[Tuple[str, re.Pattern]]):
+        if len(chunk) == 0:
+            return
+        if len(chunk) == 1:
+            self._segments.append((chunk[0][1], chunk,))
+            return
+
+        try:
+            combined = re.compile("|".join(f"(?:{pattern.pattern})" for _, pattern in chunk))
+        except re.error:
+            # Conflicting group names between rules
+            for rule in chunk:
+                self._segments.append((rule[1], [rule],))
+            return
+        self._segments.append((combined, chunk,))
+
+    def __len__(self):
+        return len(self._rules)
+
+    def rules(self) -> List[Tuple[str, str]]:
+        return self._rules
+
+    def match(self, text: str) -> Optional[str]:
+        """ Get the name of the first rule matching the start of the text, isolated rules excepted. """
+        for combined, chunk in self._segments:
+            if combined.match(text) is not None:
+                for name, pattern in chunk:
+                    if pattern.match(text) is not None:
+                        return name
         return None
 
+    @property
+    def isolated(self) -> bool:
+        return self._worker is not None
 
-def generate_gh_embed_snippet(embed: discord.Embed, issue: Tuple[str, str, int],
-                              gh: github.Github):
-    """ Generate a partial discord embed from a GitHub issue / pull request number. """
-    try:
-        repo = gh.get_repo(f"{issue[0]}/{issue[1]}")
-        issue = repo.get_issue(int(issue[2]))
-        embed.add_field(
-            name="Link",
-            value=issue.html_url,
-            inline=False
-        )
-        embed.add_field(
-            name="Title",
-            value=ensure_embeddable(issue.title),
-            inline=True
-        )
-        embed.add_field(
-            name="By",
-            value=ensure_embeddable(issue.user.login),
-            inline=True
-        )
-        embed.add_field(
-            name="Status",
-            value=issue.state,
-            inline=True
-        )
-    except github.GithubException as e:
-        logging.getLogger("github").warning(
-            f"Failed to fetch object number {issue[0]}/{issue[1]}. "
-            f"{e}")
+    async def match_isolated(self, text: str) -> Optional[str]:
+        """
+        Like `match` for the isolated rules. Raises `asyncio.TimeoutError`
+        when over the time budget, and `RuntimeError` if the worker failed.
+        """
+        if self._worker is None:
+            return None
+        return await self._worker.match(text)
+
+    async def close(self):
+        if self._worker is not None:
+            await self._worker.close()
 
 
 class UrlListKeeper:
+    """
+    Keeps a domain list up to date.
+
+    Refreshes use conditional requests, so an unchanged list costs a 304 and
+    no rebuild. A new list is built off to the side and swapped in with a
+    single assignment, readers always see either the old or the new set.
+
+    With an `index_path`, the list is kept in a `shared.DomainIndex` file
+    instead of in memory. One process downloads and writes it (`run`), the
+    others map it and reopen it when it is replaced (`follow`). The file
+    also outlives restarts: next to it the URL and validators of the list
+    are saved, so a restarted process maps the last list at once and only
+    revalidates it.
+    """
+
     _LOGGER = logging.getLogger("url_list_keeper")
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, index_path: Optional[str] = None):
         self._url = url
-        self._lists = set()
+        self._index_path = index_path
+        self._lists: Collection[str] = frozenset()
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self.updated: Optional[float] = None
+
+    @property
+    def url(self) -> str:
+        return self._url
+
+    @property
+    def index_path(self) -> Optional[str]:
+        return self._index_path
 
-    def set_url(self, url: str):
+    def set_url(self, url: str, index_path: Optional[str] = None):
         self._url = url
-        self._lists = set()
+        self._index_path = index_path
+        self._swap(frozenset())
+        self._etag = None
+        self._last_modified = None
+        self.updated = None
+
+    def _swap(self, domains: Collection[str]):
+        old, self._lists = self._lists, domains
+        if isinstance(old, shared.DomainIndex):
+            old.close()
+
+    def _meta_path(self) -> str:
+        return f"{self._index_path}.json"
+
+    def _save_meta(self):
+        tmp = f"{self._meta_path()}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"url": self._url, "etag": self._etag, "last_modified": self._last_modified}, f)
+        os.replace(tmp, self._meta_path())
+
+    def load_shared(self) -> bool:
+        """ Map the shared index if it exists and is not mapped yet. Returns whether it was (re)opened. """
+        if self._index_path is None or not os.path.exists(self._index_path):
+            return False
+        current = self._lists
+        if isinstance(current, shared.DomainIndex) and not current.changed():
+            return False
+        try:
+            with open(self._meta_path(), "r") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            meta = {"url": self._url}
+        if meta.get("url") != self._url:
+            # Left by a previous config, the list for the new URL is downloaded instead
+            return False
+        index = shared.DomainIndex(self._index_path)
+        if self._etag is None and self._last_modified is None:
+            self._etag = meta.get("etag")
+            self._last_modified = meta.get("last_modified")
+        self._swap(index)
+        self.updated = os.path.getmtime(self._index_path)
+        self._LOGGER.info(f"Mapped shared block list ({len(index)} domains): {self._index_path}")
+        return True
+
+    def __len__(self):
+        return len(self._lists)
 
     def match(self, url: urllib.parse.ParseResult):
-        loc = url.netloc.strip()
+        return self.match_host(url.hostname or "")
+
+    def match_host(self, loc: str) -> bool:
         if len(loc) > 0:
-            if loc in self._lists:
-                return True
-            for url in self._lists:
-                if loc.endswith("." + url):
+            # Check the host and each of its parent domains, so the cost
+            # depends on the number of labels and not the size of the list
+            domains = self._lists
+            while True:
+                if loc in domains:
                     return True
+                dot = loc.find(".")
+                if dot < 0:
+                    break
+                loc = loc[dot + 1:]
         return False
 
-    def update(self):
-        self._LOGGER.info("Updating block list...")
-        with requests.get(self._url) as res:
-            links = res.json()
-            links = links["domains"]
-            links = {i.strip() for i in links}
-            self._lists = links
-        self._LOGGER.info(f"Updated block list: {self._url}")
-
-    def update_and_schedule(self, scheduler: sched.scheduler, interval: float):
-        self.update()
-        scheduler.enter(interval, 0, self.update_and_schedule,
-                        argument=(scheduler, interval))
+    async def update(self, session: aiohttp.ClientSession) -> bool:
+        """ Fetch the list if it changed. Returns whether a new list was loaded. """
+        headers = {}
+        if self._etag is not None:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified is not None:
+            headers["If-Modified-Since"] = self._last_modified
+
+        async with session.get(self._url, headers=headers) as res:
+            if res.status == 304:
+                self.updated = time.time()
+                self._LOGGER.debug(f"Block list not modified: {self._url}")
+                return False
+            res.raise_for_status()
+            links = (await res.json(content_type=None))["domains"]
+            etag = res.headers.get("ETag")
+            last_modified = res.headers.get("Last-Modified")
+
+        if self._index_path is not None:
+            # Building and writing the table of a large list takes about 100 ms, off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, shared.DomainIndex.write, self._index_path, links)
+            self._swap(shared.DomainIndex(self._index_path))
+        else:
+            self._swap(frozenset(i.strip().lower() for i in links))
+        # Only remembered once the list is in use, so a failed write is downloaded again instead of revalidated
+        self._etag = etag
+        self._last_modified = last_modified
+        if self._index_path is not None:
+            self._save_meta()
+        self.updated = time.time()
+        self._LOGGER.info(f"Updated block list ({len(self._lists)} domains): {self._url}")
+        return True
+
+    async def run(self, session: aiohttp.ClientSession, interval: float, retry: float = 30.0):
+        """ Keep the list updated every `interval` seconds until cancelled. """
+        failures = 0
+        while True:
+            try:
+                await self.update(session)
+                failures = 0
+                delay = interval
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError, KeyError, TypeError) as e:
+                failures += 1
+                # Jittered exponential backoff, so failing lists do not retry in lock step
+                delay = min(interval, retry * 2 ** (failures - 1)) * random.uniform(0.5, 1.0)
+                self._LOGGER.warning(f"Failed to update block list {self._url} "
+                                     f"(attempt {failures}, retrying in {delay:.0f}s): {e!r}")
+            await asyncio.sleep(delay)
+
+    async def follow(self, interval: float):
+        """ Reopen the shared index whenever another process replaces it, until cancelled. """
+        while True:
+            try:
+                self.load_shared()
+            except (OSError, ValueError) as e:
+                self._LOGGER.warning(f"Failed to map shared block list {self._index_path}: {e!r}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,429 @@
+"""
+Local stand-ins for the services the bot talks to, used by tests and benchmarks.
+
+`FakeDiscord` answers the REST calls made while logging in and runs a
+minimal gateway (HELLO, READY, heartbeat ACKs), optionally with latency and
+rate limits on the other REST calls. `FakeSpamList` serves a domain list
+with a configurable delay. `FakeGitHub` serves and lists issues over REST and
+GraphQL.
+`FakeImageHost` serves links with chosen content types. The `*_payload`
+helpers build gateway objects to send with `FakeDiscord.dispatch`.
+"""
+import asyncio
+import collections
+import json
+import re
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp.web
+import discord.http
+import discord_slash.http
+
+BOT_USER = {
+    "id": "1000",
+    "username": "bot",
+    "discriminator": "0001",
+    "avatar": None,
+    "bot": True,
+}
+
+
+def user_payload(user_id: int) -> dict:
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": f"{user_id % 10000:04d}", "avatar": None}
+
+
+def member_payload(user: Optional[dict] = None) -> dict:
+    member = {"roles": [], "joined_at": "2020-01-01T00:00:00+00:00", "deaf": False, "mute": False}
+    if user is not None:
+        member["user"] = user
+        member["permissions"] = "0"
+    return member
+
+
+def guild_payload(guild_id: int, channel_ids: Sequence[int], member_ids: Sequence[int] = ()) -> dict:
+    """ A GUILD_CREATE for a guild with text channels and members, a third of them online. """
+    return {
+        "id": str(guild_id),
+        "name": f"guild {guild_id}",
+        "owner_id": "2",
+        "large": len(member_ids) > 250,
+        "member_count": len(member_ids),
+        "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "104324673", "position": 0,
+                   "color": 0, "hoist": False, "managed": False, "mentionable": False}],
+        "channels": [{"id": str(channel_id), "type": 0, "name": f"channel-{channel_id}", "position": i,
+                      "permission_overwrites": []} for i, channel_id in enumerate(channel_ids)],
+        "members": [{"user": user_payload(member_id), **member_payload()} for member_id in member_ids],
+        "presences": [{"user": {"id": str(member_id)}, "status": "online", "activities": [],
+                       "client_status": {"desktop": "online"}} for member_id in member_ids[::3]],
+        "emojis": [],
+        "features": [],
+        "voice_states": [],
+    }
+
+
+def message_payload(message_id: int, channel_id: int, author: dict, content: str,
+                    guild_id: Optional[int] = None, **extra) -> dict:
+    """ A MESSAGE_CREATE, also what the REST API returns for a created message. """
+    message = {
+        "id": str(message_id),
+        "channel_id": str(channel_id),
+        "author": author,
+        "content": content,
+        "timestamp": "2022-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+        "components": [],
+        **extra
+    }
+    if guild_id is not None:
+        message["guild_id"] = str(guild_id)
+        message.setdefault("member", member_payload())
+    return message
+
+
+def interaction_payload(interaction_id: int, guild_id: int, channel_id: int, user: dict, command: str,
+                        options: Dict[str, object]) -> dict:
+    """ An INTERACTION_CREATE for a slash command. """
+    return {
+        "id": str(interaction_id),
+        "application_id": BOT_USER["id"],
+        "type": 2,
+        "token": f"token{interaction_id}",
+        "version": 1,
+        "guild_id": str(guild_id),
+        "channel_id": str(channel_id),
+        "member": member_payload(user),
+        "data": {
+            "id": "1",
+            "name": command,
+            "type": 1,
+            "options": [{"name": name, "type": 4 if isinstance(value, int) else 3, "value": value}
+                        for name, value in options.items()],
+        },
+    }
+
+
+def json_response(data, status: int = 200, headers: Optional[dict] = None) -> aiohttp.web.Response:
+    """ discord.py only decodes bodies whose content type is exactly `application/json`. """
+    return aiohttp.web.Response(
+        body=json.dumps(data).encode("utf-8"),
+        status=status,
+        headers={"Content-Type": "application/json", **(headers or {})}
+    )
+
+
+def install_routes(url: str):
+    """ Point discord.py and the slash command routes at a `FakeDiscord`, which may run in another process. """
+    discord.http.Route.BASE = f"{url}/api/v7"
+    discord_slash.http.CustomRoute.BASE = f"{url}/api/v8"
+
+
+class _Server:
+    def __init__(self):
+        self.app = aiohttp.web.Application()
+        self._runner: Optional[aiohttp.web.AppRunner] = None
+        self.port = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self._runner = aiohttp.web.AppRunner(self.app)
+        await self._runner.setup()
+        site = aiohttp.web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class FakeDiscord(_Server):
+    """
+    Discord REST API and gateway. Point the discord.py and slash command routes at it with `install`.
+
+    REST calls other than logging in wait `latency` seconds, and every
+    `rate_limit_every`th one is answered with a 429 asking to retry after
+    `retry_after` seconds. Calls are counted per method in `requests`.
+    `on_interaction_response` is called with the interaction id when a slash
+    command is answered.
+    """
+
+    def __init__(self, guilds: Optional[List[dict]] = None, latency: float = 0.0, rate_limit_every: int = 0,
+                 retry_after: float = 0.1):
+        super().__init__()
+        self.guilds = guilds or []
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.requests: Dict[str, int] = collections.Counter()
+        self.rate_limited = 0
+        self.on_interaction_response: Optional[Callable[[str], None]] = None
+        self.sockets: List[aiohttp.web.WebSocketResponse] = []
+        self._next_id = int(time.time() * 1000) << 22
+        self.app.router.add_get("/api/v7/users/@me", self._me)
+        self.app.router.add_get("/api/v7/gateway", self._gateway)
+        self.app.router.add_get("/api/v7/gateway/bot", self._gateway)
+        self.app.router.add_get("/gateway", self._websocket)
+        self.app.router.add_post("/api/v7/channels/{channel_id}/messages", self._create_message)
+        self.app.router.add_post("/api/v8/interactions/{interaction_id}/{token}/callback", self._interaction_callback)
+        self.app.router.add_patch("/api/v8/webhooks/{application_id}/{token}/messages/@original", self._edit_original)
+        self.app.router.add_route("*", "/api/{version}/{tail:.*}", self._catch_all)
+
+    def install(self):
+        install_routes(self.url)
+
+    async def _me(self, _request):
+        return json_response(BOT_USER)
+
+    async def _gateway(self, _request):
+        return json_response({
+            "url": f"ws://127.0.0.1:{self.port}/gateway",
+            "shards": 1,
+            "session_start_limit": {"total": 1000, "remaining": 1000, "reset_after": 0, "max_concurrency": 1},
+        })
+
+    async def _throttle(self, request: aiohttp.web.Request) -> Optional[aiohttp.web.Response]:
+        """ Apply the latency and rate limit, returning a 429 response when the call is rate limited. """
+        self.requests[request.method] += 1
+        await asyncio.sleep(self.latency)
+        if self.rate_limit_every > 0 and sum(self.requests.values()) % self.rate_limit_every == 0:
+            self.rate_limited += 1
+            # discord.py takes a 429 without a Via header for a Cloudflare ban
+            return json_response({"message": "You are being rate limited.", "retry_after": self.retry_after * 1000,
+                                  "global": False}, status=429, headers={"Via": "1.1 google"})
+        return None
+
+    def _message_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    async def _create_message(self, request: aiohttp.web.Request):
+        limited = await self._throttle(request)
+        if limited is not None:
+            return limited
+        body = await request.json()
+        return json_response(message_payload(
+            self._message_id(), int(request.match_info["channel_id"]), BOT_USER, body.get("content") or "",
+            embeds=body.get("embeds") or ([body["embed"]] if body.get("embed") else [])
+        ))
+
+    async def _interaction_callback(self, request: aiohttp.web.Request):
+        limited = await self._throttle(request)
+        if limited is not None:
+            return limited
+        if self.on_interaction_response is not None:
+            self.on_interaction_response(request.match_info["interaction_id"])
+        return aiohttp.web.Response(status=204)
+
+    async def _edit_original(self, request: aiohttp.web.Request):
+        limited = await self._throttle(request)
+        if limited is not None:
+            return limited
+        return json_response(message_payload(self._message_id(), 0, BOT_USER, ""))
+
+    async def _catch_all(self, request: aiohttp.web.Request):
+        if request.method != "GET" and request.match_info["tail"].startswith("channels/"):
+            limited = await self._throttle(request)
+            if limited is not None:
+                return limited
+        if request.method == "DELETE":
+            return aiohttp.web.Response(status=204)
+        if request.method == "GET" or not request.can_read_body:
+            return json_response([])
+
+        # Echo created objects back with ids, like slash command registration expects
+        body = await request.json()
+        if isinstance(body, list):
+            return json_response([{"id": str(i + 1), **item} for i, item in enumerate(body)])
+        return json_response({"id": "1", **body})
+
+    async def dispatch(self, event: str, data: dict, sequence: int = 0):
+        """ Send a dispatch event to every connected client. """
+        payload = json.dumps({"op": 0, "t": event, "s": sequence, "d": data})
+        for ws in self.sockets:
+            await ws.send_str(payload)
+
+    async def _websocket(self, request: aiohttp.web.Request):
+        ws = aiohttp.web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets.append(ws)
+        await ws.send_json({"op": 10, "t": None, "s": None, "d": {"heartbeat_interval": 41250}})
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                if data["op"] == 1:
+                    await ws.send_json({"op": 11, "t": None, "s": None, "d": None})
+                elif data["op"] == 2:
+                    shard = (data["d"].get("shard") or [0, 1])
+                    await ws.send_json({"op": 0, "t": "READY", "s": 1, "d": {
+                        "v": 6,
+                        "user": BOT_USER,
+                        "guilds": [{"id": g["id"], "unavailable": True} for g in self.guilds],
+                        "session_id": "session",
+                        "shard": shard,
+                        "private_channels": [],
+                        "relationships": [],
+                        "application": {"id": BOT_USER["id"], "flags": 0},
+                    }})
+                    for i, guild in enumerate(self.guilds):
+                        await ws.send_json({"op": 0, "t": "GUILD_CREATE", "s": 2 + i, "d": guild})
+        finally:
+            self.sockets.remove(ws)
+        return ws
+
+
+class FakeSpamList(_Server):
+    """ Serves a domain list at `/list.json` after `delay` seconds. """
+
+    def __init__(self, domains: List[str], delay: float = 0.0):
+        super().__init__()
+        self.domains = domains
+        self.delay = delay
+        self.app.router.add_get("/list.json", self._list)
+
+    async def _list(self, _request):
+        await asyncio.sleep(self.delay)
+        return aiohttp.web.json_response({"domains": self.domains})
+
+
+class FakeGitHub(_Server):
+    """
+    GitHub REST issue lookups and listings and GraphQL `issueOrPullRequest`
+    queries, with request counters. Set `graphql_status` to make GraphQL
+    requests fail. Issues are updated one second apart in the order they are
+    added, adding an issue again updates it.
+    """
+
+    _ALIAS = re.compile(r"(i\d+): repository")
+    RATE_LIMIT = {"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "4999", "X-RateLimit-Reset": "4102444800"}
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.issues: Dict[Tuple[str, str, int], dict] = {}
+        self.latency = latency
+        self.rest_requests = 0
+        self.list_requests = 0
+        self.graphql_requests = 0
+        self.graphql_status = 200
+        self._updates = 0
+        self.app.router.add_get("/repos/{org}/{repo}/issues", self._list_issues)
+        self.app.router.add_get("/repos/{org}/{repo}/issues/{number}", self._issue)
+        self.app.router.add_post("/graphql", self._graphql)
+
+    def add_issue(self, org: str, repo: str, number: int, title: str, state: str = "open",
+                  author: str = "octocat", body: str = "body"):
+        self.issues[(org.lower(), repo.lower(), number)] = {
+            "number": number,
+            "html_url": f"https://github.com/{org}/{repo}/issues/{number}",
+            "title": title,
+            "state": state,
+            "body": body,
+            "user": {"login": author},
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1_700_000_000 + self._updates)),
+        }
+        self._updates += 1
+
+    async def _issue(self, request: aiohttp.web.Request):
+        self.rest_requests += 1
+        await asyncio.sleep(self.latency)
+        org, repo, number = request.match_info["org"], request.match_info["repo"], request.match_info["number"]
+        issue = self.issues.get((org.lower(), repo.lower(), int(number)))
+        if issue is None:
+            return json_response({"message": "Not Found"}, status=404, headers=self.RATE_LIMIT)
+        return json_response({"url": f"{self.url}/repos/{org}/{repo}/issues/{number}", **issue},
+                             headers={"ETag": f"\"{hash(issue['title'])}\"", **self.RATE_LIMIT})
+
+    async def _list_issues(self, request: aiohttp.web.Request):
+        self.list_requests += 1
+        await asyncio.sleep(self.latency)
+        key = (request.match_info["org"].lower(), request.match_info["repo"].lower())
+        since = request.query.get("since", "")
+        per_page = int(request.query.get("per_page", "30"))
+        page = int(request.query.get("page", "1"))
+        listed = sorted((issue for (org, repo, _), issue in self.issues.items()
+                         if (org, repo) == key and issue["updated_at"] >= since), key=lambda i: i["updated_at"])
+        items = listed[(page - 1) * per_page:page * per_page]
+
+        etag = f"\"{hash(json.dumps(items, sort_keys=True))}\""
+        if request.headers.get("If-None-Match") == etag:
+            return aiohttp.web.Response(status=304, headers={"ETag": etag, **self.RATE_LIMIT})
+        headers = {"ETag": etag, **self.RATE_LIMIT}
+        if page * per_page < len(listed):
+            headers["Link"] = f"<{self.url}{request.rel_url.update_query(page=str(page + 1))}>; rel=\"next\""
+        return json_response(items, headers=headers)
+
+    async def _graphql(self, request: aiohttp.web.Request):
+        self.graphql_requests += 1
+        await asyncio.sleep(self.latency)
+        if self.graphql_status != 200:
+            return json_response({"message": "Server Error"}, status=self.graphql_status)
+
+        body = await request.json()
+        variables = body["variables"]
+        data = {}
+        errors = []
+        for alias in self._ALIAS.findall(body["query"]):
+            i = alias[1:]
+            issue = self.issues.get((variables[f"o{i}"].lower(), variables[f"r{i}"].lower(), variables[f"n{i}"]))
+            if issue is None:
+                data[alias] = {"issueOrPullRequest": None}
+                errors.append({"type": "NOT_FOUND", "path": [alias, "issueOrPullRequest"]})
+            else:
+                data[alias] = {"issueOrPullRequest": {
+                    "url": issue["html_url"],
+                    "title": issue["title"],
+                    "state": issue["state"].upper(),
+                    "body": issue["body"],
+                    "author": {"login": issue["user"]["login"]},
+                }}
+        return json_response({"data": data, **({"errors": errors} if errors else {})})
+
+
+class FakeImageHost(_Server):
+    """
+    Serves `/{name}` with the content type given for the name, counting
+    requests. Names in `no_head` refuse HEAD requests, names in `slow` answer
+    after `delay` seconds, names in `redirects` redirect to the given URL and
+    names in `statuses` answer with the given status.
+    """
+
+    def __init__(self, content_types: Dict[str, str], no_head: List[str] = (), slow: List[str] = (),
+                 delay: float = 5.0, redirects: Optional[Dict[str, str]] = None,
+                 statuses: Optional[Dict[str, int]] = None):
+        super().__init__()
+        self.redirects = redirects or {}
+        self.statuses = statuses or {}
+        self.content_types = content_types
+        self.no_head = set(no_head)
+        self.slow = set(slow)
+        self.delay = delay
+        self.requests: List[Tuple[str, str]] = []
+        self.app.router.add_route("*", "/{name}", self._serve)
+
+    async def _serve(self, request: aiohttp.web.Request):
+        name = request.match_info["name"]
+        self.requests.append((request.method, name))
+        if name in self.slow:
+            await asyncio.sleep(self.delay)
+        if name in self.redirects:
+            return aiohttp.web.Response(status=302, headers={"Location": self.redirects[name]})
+        if name in self.statuses:
+            return aiohttp.web.Response(status=self.statuses[name], headers={"Content-Type": "text/html"})
+        if name not in self.content_types:
+            return aiohttp.web.Response(status=404)
+        if request.method == "HEAD" and name in self.no_head:
+            return aiohttp.web.Response(status=405)
+        return aiohttp.web.Response(body=b"x", headers={"Content-Type": self.content_types[name]})
@@ -1,10 +1,126 @@
+import asyncio
+import time
+
+import discord
+
+
+class ImposterUser:
+    def __init__(self, user_id: int, name: str = "user"):
+        self.id = user_id
+        self.name = name
+        self.discriminator = "0001"
+        self.mention = f"<@{user_id}>"
+
+
 class ImposterMessage:
-    def __init__(self):
+    def __init__(self, content: str = "", author: "ImposterUser" = None,
+                 channel: "ImposterChannel" = None, message_id: int = 0):
+        self.id = message_id
         self.attachments = []
-        self.content = ""
+        self.content = content
         self.embeds = []
+        self.author = author or ImposterUser(1)
+        self.channel = channel or ImposterChannel(1)
+        self.guild = None
+        self.mention_everyone = False
+        self.created_at = None
+        self.deleted = False
+        self.replies = []
+
+    def is_system(self) -> bool:
+        return False
+
+    async def delete(self, delay=None):
+        self.deleted = True
+
+    async def reply(self, content=None, embed=None, mention_author=None):
+        reply = ImposterMessage(content, channel=self.channel)
+        reply.embeds = [embed] if embed is not None else []
+        self.replies.append(reply)
+        return reply
+
+    async def add_reaction(self, emoji):
+        pass
 
 
 class ImposterAttachment:
     def __init__(self, filename: str):
         self.filename = filename
+
+
+class ImposterGithubUser:
+    def __init__(self, login: str):
+        self.login = login
+
+
+class ImposterIssue:
+    def __init__(self, number: int, title: str):
+        self.number = number
+        self.html_url = f"https://github.com/test/test/issues/{number}"
+        self.title = title
+        self.user = ImposterGithubUser("test")
+        self.state = "open"
+        self.body = "body"
+        self.modified = False
+        self.updates = 0
+
+    def update(self) -> bool:
+        self.updates += 1
+        return self.modified
+
+
+class ImposterRepository:
+    def __init__(self):
+        self.issues = {}
+        self.requests = 0
+        self.delay = 0.0
+
+    def get_issue(self, number: int) -> ImposterIssue:
+        self.requests += 1
+        time.sleep(self.delay)
+        return self.issues.setdefault(number, ImposterIssue(number, f"Issue {number}"))
+
+
+class ImposterGithub:
+    def __init__(self):
+        self.repos = {}
+        self.rate_limiting = (5000, 5000)
+        self.rate_limiting_resettime = 0
+
+    def get_repo(self, name: str, lazy: bool = False) -> ImposterRepository:
+        return self.repos.setdefault(name, ImposterRepository())
+
+
+class ImposterChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent = []
+
+    async def send(self, content=None, embed=None):
+        self.sent.append([embed] if embed is not None else content)
+        return ImposterMessage(content, channel=self)
+
+
+class ImposterHttp:
+    def __init__(self, channels):
+        self._channels = channels
+        self.deleted = []
+
+    async def delete_message(self, channel_id, message_id):
+        self.deleted.append((channel_id, message_id))
+
+    async def request(self, route, json=None):
+        if "embeds" in json:
+            self._channels[route.channel_id].sent.append([discord.Embed.from_dict(e) for e in json["embeds"]])
+        else:
+            self._channels[route.channel_id].sent.append(json["content"])
+
+
+class ImposterClient:
+    def __init__(self, channels):
+        self.channels = {channel.id: channel for channel in channels}
+        self.http = ImposterHttp(self.channels)
+        self.loop = asyncio.get_event_loop()
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
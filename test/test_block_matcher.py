@@ -0,0 +1,50 @@
+import sys
+import os
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import utils
+
+
+def test_match_name():
+    matcher = utils.BlockMatcher([
+        ("nitro", r".*free nitro"),
+        ("gift", r".*discord\.gift/\w+"),
+        ("steam", r"(steam|stearn)community"),
+    ])
+    assert len(matcher) == 3
+    assert matcher.match("get free nitro here") == "nitro"
+    assert matcher.match("https://discord.gift/abc") == "gift"
+    assert matcher.match("stearncommunity.com") == "steam"
+    assert matcher.match("hello world") is None
+    assert matcher.match("hello steamcommunity") is None  # Anchored like re.match
+
+
+def test_match_order():
+    # The first matching rule in config order wins
+    matcher = utils.BlockMatcher([
+        ("first", r"spam"),
+        ("second", r"spam and eggs"),
+    ])
+    assert matcher.match("spam and eggs") == "first"
+
+
+def test_match_uncombinable():
+    matcher = utils.BlockMatcher([
+        ("a", r"aaa"),
+        ("flags", r"(?i)shouting"),
+        ("backref", r"(\w+) \1"),
+        ("named", r"(?P<word>x)y"),
+        ("named_again", r"(?P<word>z)y"),
+        ("b", r"bbb"),
+    ])
+    assert matcher.match("SHOUTING") == "flags"
+    assert matcher.match("hello hello") == "backref"
+    assert matcher.match("hello world") is None
+    assert matcher.match("xy") == "named"
+    assert matcher.match("zy") == "named_again"
+    assert matcher.match("aaa") == "a"
+    assert matcher.match("bbb") == "b"
+
+
+def test_match_empty():
+    assert utils.BlockMatcher([]).match("anything") is None
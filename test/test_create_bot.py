@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import sys
+import os
+
+import discord
+import pytest
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import main
+
+GITHUB = "[GITHUB]\norganization = chunky-dev\nrepository = chunky\n"
+
+
+def _create(tmp_path, config: str, github: str = ""):
+    path = tmp_path / "config.ini"
+    path.write_text(config + GITHUB + github)
+
+    async def create():
+        bot = main.create_bot(argparse.Namespace(config=str(path), github=None, debug_guild=None))
+        if bot is not None:
+            await bot._gh.close()
+        return bot
+    return asyncio.run(create())
+
+
+def test_client_options(tmp_path):
+    bot = _create(tmp_path, "[CLIENT]\nintents = guilds, guild_messages, guild_reactions\n"
+                            "member_cache = none\nmax_messages = 0\n")
+    assert bot.intents.value == discord.Intents(guilds=True, guild_messages=True, guild_reactions=True).value
+    assert bot._connection.member_cache_flags.value == 0
+    assert bot._connection.max_messages is None
+
+    bot = _create(tmp_path, "[CLIENT]\nintents = default\nmember_cache = intents\nmax_messages = 50\n")
+    assert bot.intents.value == discord.Intents.default().value
+    assert bot._connection.max_messages == 50
+
+
+def test_invalid_intents(tmp_path):
+    assert _create(tmp_path, "[CLIENT]\nintents = guilds, everything\n") is None
+
+
+def test_reload(tmp_path):
+    bot = _create(tmp_path, "[IMAGE_ONLY]\n1 = images only\n\n[CLIENT]\nmax_messages = 0\n\n"
+                            "[BLOCK]\nnitro = free nitro\ninvite = discord\\.gg/\\w+\n")
+    slash = bot._reload_listeners[0].__self__
+    assert bot._blocks.match("discord.gg/abc") == "invite"
+    path = tmp_path / "config.ini"
+
+    path.write_text("[IMAGE_ONLY]\n2 = images only\n\n[CLIENT]\nmax_messages = 50\n\n"
+                    "[BLOCK]\nnitro = free nitro!\nsteam = steamcommunity\\.ru\n" + GITHUB)
+    assert bot.reload() == [
+        "[IMAGE_ONLY] added 2; removed 1",
+        "[CLIENT] changed max_messages (restart to apply)",
+        "[BLOCK] added steam; removed invite; changed nitro",
+    ]
+    assert bot._image_only == [(2, "images only")]
+    assert slash._image_only_channels == {2}
+    assert bot._blocks.match("discord.gg/abc") is None
+    assert bot._blocks.match("steamcommunity.ru") == "steam"
+    assert bot.reload() == []
+
+    # An invalid config keeps the current rules
+    path.write_text("[BLOCK]\nbroken = (unclosed\n" + GITHUB)
+    with pytest.raises(main.RELOAD_ERRORS):
+        bot.reload()
+    assert bot._blocks.match("steamcommunity.ru") == "steam"
+    assert slash._image_only_channels == {2}
+
+
+def test_reload_on_signal_failure(tmp_path):
+    bot = _create(tmp_path, "[BLOCK]\nnitro = free nitro\n")
+    (tmp_path / "config.ini").write_text("[BLOCK]\nbroken = (unclosed\n" + GITHUB)
+    try:
+        bot._reload_on_signal()
+        assert main.BOT_LOG.queue_depth() == 1
+        # The embed is built later, on the logging task
+        embed = main.BOT_LOG._queue.get_nowait()()
+    finally:
+        while main.BOT_LOG.queue_depth() > 0:
+            main.BOT_LOG._queue.get_nowait()
+    assert embed.description.startswith("Reload failed, the current config is kept: ")
+    assert "unterminated subpattern" in embed.description
+    assert bot._blocks.match("free nitro") == "nitro"
+
+
+def test_autocomplete(tmp_path):
+    bot = _create(tmp_path, "", "index = true\n")
+    slash = bot._reload_listeners[0].__self__
+    assert slash.commands["gh"].options[0]["autocomplete"]
+
+    index = bot._gh.index
+    for number, title in ((12, "Sky model"), (34, "Crash on startup")):
+        index._add({"number": number, "html_url": f"https://github.com/chunky-dev/chunky/issues/{number}",
+                    "title": title, "state": "open", "user": None, "body": None,
+                    "updated_at": "2024-01-01T00:00:00Z"})
+    index._rebuild()
+
+    assert slash.autocomplete("sky") == [{"name": "#12 Sky model", "value": "12"}]
+    assert slash.autocomplete("sky", repo="other") == []
+    assert slash._resolve_number("#34", "", "") == 34
+    assert slash._resolve_number("sky mod", "", "") == 12
+    assert slash._resolve_number("nothing like it", "", "") is None
+
+    # Without an index only numbers are accepted
+    slash = _create(tmp_path, "")._reload_listeners[0].__self__
+    assert not slash.commands["gh"].options[0]["autocomplete"]
+    assert slash.autocomplete("sky") == []
@@ -0,0 +1,48 @@
+import asyncio
+import sys
+import os
+
+import discord
+
+from imposter import *
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import log
+
+
+def _embed(description: str) -> discord.Embed:
+    return discord.Embed(description=description)
+
+
+def test_batches():
+    async def run():
+        channels = [ImposterChannel(1), ImposterChannel(2)]
+        logger = log.DiscordLogger([1, 2, 3])
+        for i in range(12):
+            logger.log(lambda i=i: _embed(f"{i}"))
+
+        await logger.register(ImposterClient(channels))
+        while logger.queue_depth() > 0:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        await logger.close()
+        return channels
+
+    for channel in asyncio.run(run()):
+        # Batches of up to 10 embeds per message, in order
+        assert [len(m) for m in channel.sent] == [10, 2]
+        assert [e.description for m in channel.sent for e in m] == [f"{i}" for i in range(12)]
+
+
+def test_split_size():
+    logger = log.DiscordLogger([])
+    embeds = [_embed("a" * 2500) for _ in range(5)]
+    assert [len(m) for m in logger._split(embeds)] == [2, 2, 1]
+
+
+def test_drop():
+    logger = log.DiscordLogger([], queue_size=2)
+    for i in range(5):
+        logger.log(lambda: _embed("x"))
+    assert logger.queue_depth() == 2
+    assert logger.dropped == 3
@@ -0,0 +1,72 @@
+import asyncio
+import sys
+import os
+
+from imposter import *
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import issues
+import main
+import utils
+
+RAID = "FREE NITRO for everyone, claim it now!"
+
+
+def test_window():
+    now = [0.0]
+    detector = utils.DuplicateDetector(channels=3, window=30, clock=lambda: now[0])
+    assert detector.add(1, 10, 100, RAID) == []
+    now[0] = 10
+    assert detector.add(1, 11, 101, "free nitro FOR everyone... claim it now") == []
+    # Another author, and the same channel again, do not count
+    assert detector.add(2, 12, 102, RAID) == []
+    assert detector.add(1, 11, 103, RAID) == []
+    now[0] = 20
+    assert detector.add(1, 12, 104, RAID) == [(10, 100), (11, 103), (12, 104)]
+
+    # The first copy has left the window
+    now[0] = 35
+    assert detector.add(1, 13, 105, RAID) == [(11, 103), (12, 104), (13, 105)]
+    now[0] = 100
+    assert detector.add(1, 14, 106, RAID) == []
+    assert len(detector) == 1
+
+
+def test_bounded():
+    detector = utils.DuplicateDetector(channels=2, size=2)
+    assert detector.add(1, 10, 100, "short") == []
+    assert len(detector) == 0
+    for author in range(5):
+        detector.add(author, 10, author, RAID)
+    assert len(detector) == 2
+    assert detector.add(0, 11, 200, RAID) == []
+    assert detector.add(4, 11, 201, RAID) == [(10, 4), (11, 201)]
+
+
+def test_on_message_duplicates():
+    main.DELETE_BLOCKED_MESSAGES.set(True)
+
+    async def run():
+        fetcher = issues.IssueFetcher(issues.IssueCache(ImposterGithub()))
+        bot = main.Bot(fetcher, "test", "test", [], utils.BlockMatcher([]), None,
+                       duplicates=utils.DuplicateDetector(channels=3))
+        bot._connection.user = ImposterUser(1000, "bot")
+        channels = [ImposterChannel(10 + i) for i in range(4)]
+        bot.http = ImposterHttp({c.id: c for c in channels})
+        author = ImposterUser(5)
+        messages = [ImposterMessage(RAID, author, channel, 100 + i) for i, channel in enumerate(channels)]
+        try:
+            for message in messages:
+                await bot.on_message(message)
+        finally:
+            await fetcher.close()
+            while main.BOT_LOG.queue_depth() > 0:
+                main.BOT_LOG._queue.get_nowait()
+        return messages, bot.http.deleted
+
+    try:
+        messages, deleted = asyncio.run(run())
+    finally:
+        main.DELETE_BLOCKED_MESSAGES.set(False)
+    assert [m.deleted for m in messages] == [False, False, True, True]
+    assert sorted(deleted) == [(10, 100), (11, 101), (11, 101), (12, 102)]
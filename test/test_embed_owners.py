@@ -0,0 +1,39 @@
+import sys
+import os
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import utils
+
+
+def test_bounded():
+    owners = utils.EmbedOwnerIndex(size=2)
+    owners.add(1, 10)
+    owners.add(2, 20)
+    owners.add(3, 30)
+    assert owners.get(1) is None
+    assert owners.get(2) == 20
+    assert owners.get(3) == 30
+    owners.remove(2)
+    assert owners.get(2) is None
+    assert len(owners) == 1
+
+
+def test_persist(tmp_path):
+    path = str(tmp_path / "owners.json")
+    owners = utils.EmbedOwnerIndex(path=path)
+    owners.add(1, 10)
+    owners.add(2, 20)
+    owners.save()
+
+    loaded = utils.EmbedOwnerIndex(size=1, path=path)
+    loaded.load()
+    assert loaded.get(1) is None
+    assert loaded.get(2) == 20
+
+    # Missing or corrupt files leave the index empty
+    utils.EmbedOwnerIndex(path=str(tmp_path / "missing.json")).load()
+    with open(path, "w") as f:
+        f.write("{")
+    corrupt = utils.EmbedOwnerIndex(path=path)
+    corrupt.load()
+    assert len(corrupt) == 0
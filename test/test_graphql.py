@@ -0,0 +1,92 @@
+import asyncio
+import sys
+import os
+
+import github
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import issues
+
+from fake_servers import FakeGitHub
+
+
+def _fetch(fake: FakeGitHub, refs, rounds: int = 1):
+    async def run():
+        await fake.start()
+        gh = github.Github(login_or_token="token", base_url=fake.url)
+        fetcher = issues.IssueFetcher(
+            issues.IssueCache(gh, ttl=60, size=8),
+            graphql=issues.GraphQLResolver("token", f"{fake.url}/graphql")
+        )
+        try:
+            return [await fetcher.get_many(refs) for _ in range(rounds)]
+        finally:
+            await fetcher.close()
+            await fake.stop()
+    return asyncio.run(run())
+
+
+def _fake() -> FakeGitHub:
+    fake = FakeGitHub()
+    fake.add_issue("test", "test", 1, "Issue 1")
+    fake.add_issue("test", "test", 2, "Merged", state="closed")
+    fake.add_issue("test", "other", 3, "Issue 3", author="someone")
+    return fake
+
+
+def test_graphql_batch():
+    fake = _fake()
+    refs = [("test", "test", 1), ("test", "test", 2), ("test", "other", 3), ("test", "test", 4)]
+    first, second = _fetch(fake, refs, rounds=2)
+
+    assert [info.title if info else None for info in first] == ["Issue 1", "Merged", "Issue 3", None]
+    assert first[1].state == "closed"
+    assert first[2].author == "someone"
+    assert first[0].html_url == "https://github.com/test/test/issues/1"
+    # One query for the whole message, then only the missing issue is asked for again
+    assert fake.graphql_requests == 1
+    assert fake.rest_requests == 1
+    assert [info.title if info else None for info in second] == ["Issue 1", "Merged", "Issue 3", None]
+
+
+def test_graphql_fallback():
+    fake = _fake()
+    fake.graphql_status = 502
+    refs = [("test", "test", 1), ("test", "other", 3), ("test", "test", 4)]
+    infos, = _fetch(fake, refs)
+
+    assert [info.title if info else None for info in infos] == ["Issue 1", "Issue 3", None]
+    assert fake.graphql_requests == 1
+    assert fake.rest_requests == 3
+
+
+def test_graphql_coalesced():
+    fake = FakeGitHub(latency=0.1)
+    fake.add_issue("test", "test", 1, "Issue 1")
+    fake.add_issue("test", "test", 2, "Issue 2")
+    refs = [("test", "test", 1), ("test", "test", 2), ("test", "test", 3)]
+
+    async def run():
+        await fake.start()
+        gh = github.Github(login_or_token="token", base_url=fake.url)
+        fetcher = issues.IssueFetcher(
+            issues.IssueCache(gh, ttl=60, size=8),
+            graphql=issues.GraphQLResolver("token", f"{fake.url}/graphql")
+        )
+        try:
+            # A burst of messages about the same issues, the first one's query answers them all
+            first = asyncio.create_task(fetcher.get_many(refs))
+            await asyncio.sleep(0)
+            return await asyncio.gather(first, fetcher.get_many(refs), fetcher.get_many(refs[:2]),
+                                        fetcher.get("test", "test", 2))
+        finally:
+            await fetcher.close()
+            await fake.stop()
+
+    first, second, third, single = asyncio.run(run())
+    assert [info.title if info else None for info in first] == ["Issue 1", "Issue 2", None]
+    assert second == first
+    assert third == first[:2]
+    assert single.title == "Issue 2"
+    assert fake.graphql_requests == 1
+    assert fake.rest_requests == 0
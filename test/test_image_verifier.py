@@ -0,0 +1,112 @@
+import asyncio
+import sys
+import os
+
+from imposter import *
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import utils
+
+from fake_servers import FakeImageHost
+
+
+def _check(host: FakeImageHost, verifier: utils.ImageVerifier, contents):
+    async def run():
+        await host.start()
+        try:
+            return [await verifier.is_image(ImposterMessage(content.format(url=host.url, port=host.port))) for content in contents]
+        finally:
+            await verifier.close()
+            await host.stop()
+    return asyncio.run(run())
+
+
+def test_content_type():
+    host = FakeImageHost({
+        "render": "image/png",
+        "page.png": "text/html; charset=utf-8",
+        "clip": "video/mp4",
+        "nohead": "image/jpeg",
+    }, no_head=["nohead"])
+    verifier = utils.ImageVerifier(allow_private=True)
+    results = _check(host, verifier, [
+        "{url}/render",
+        "{url}/page.png",
+        "look {url}/clip",
+        "{url}/nohead",
+        "{url}/missing.png",
+        "{url}/render again",
+    ])
+
+    assert results == [True, False, True, True, False, True]
+    # HEAD is retried as a ranged GET, the repost is served from the cache
+    assert host.requests == [("HEAD", "render"), ("HEAD", "page.png"), ("HEAD", "clip"),
+                             ("HEAD", "nohead"), ("GET", "nohead"), ("HEAD", "missing.png")]
+    assert len(verifier) == 5
+
+
+def test_timeout_falls_back():
+    host = FakeImageHost({"slow.png": "text/html", "slow": "image/png"}, slow=["slow.png", "slow"], delay=1.0)
+    verifier = utils.ImageVerifier(timeout=0.1, allow_private=True)
+    assert _check(host, verifier, ["{url}/slow.png", "{url}/slow"]) == [True, False]
+    # Unknown verdicts are not cached
+    assert len(verifier) == 0
+
+
+def test_private_addresses():
+    host = FakeImageHost({"page.png": "text/html"})
+    verifier = utils.ImageVerifier()
+    assert _check(host, verifier, ["{url}/page.png"]) == [True]
+    assert host.requests == []
+
+
+def test_private_names():
+    host = FakeImageHost({"page.png": "text/html", "render": "image/png"})
+    verifier = utils.ImageVerifier()
+    # Names are only connected to at their public addresses, none here
+    results = _check(host, verifier, [
+        "http://localhost:{port}/page.png",
+        "http://127.1:{port}/render",
+    ])
+    assert results == [True, False]
+    assert host.requests == []
+
+
+def test_redirect_to_private_address(monkeypatch):
+    host = FakeImageHost({"render": "image/png", "page.png": "text/html"}, redirects={
+        "metadata.png": "http://169.254.169.254/latest/meta-data",
+        "local": "http://[::1]/admin",
+        "moved": "/render",
+    })
+    # Let the stand-in host pass for a public one
+    monkeypatch.setattr(utils, "_is_public", lambda address: address == "127.0.0.1")
+    verifier = utils.ImageVerifier()
+    results = _check(host, verifier, ["{url}/metadata.png", "{url}/local", "{url}/moved"])
+    assert results == [True, False, True]
+    # Redirects to private addresses are not followed
+    assert host.requests == [("HEAD", "metadata.png"), ("HEAD", "local"), ("HEAD", "moved"), ("HEAD", "render")]
+
+
+def test_unanswered_falls_back():
+    host = FakeImageHost({}, statuses={
+        "limited.png": 429, "forbidden.png": 403, "broken.png": 503, "gone.png": 410, "missing.png": 404,
+    })
+    verifier = utils.ImageVerifier(allow_private=True)
+    results = _check(host, verifier, [
+        "{url}/limited.png", "{url}/forbidden.png", "{url}/broken.png", "{url}/gone.png", "{url}/missing.png",
+        "{url}/limited.png",
+    ])
+    # Only missing links are a verdict, the host refusing or failing says nothing about the link
+    assert results == [True, True, True, False, False, True]
+    assert len(verifier) == 2
+    assert host.requests.count(("HEAD", "limited.png")) == 2
+
+
+def test_timeout_bounds_redirects():
+    host = FakeImageHost({"page": "text/html"}, slow=["first.png", "second", "third"], delay=0.2,
+                         redirects={"first.png": "/second", "second": "/third", "third": "/page"})
+    # Each request is quicker than the timeout, all of them together are not
+    verifier = utils.ImageVerifier(timeout=0.3, allow_private=True)
+    assert _check(host, verifier, ["{url}/first.png"]) == [True]
+    assert len(verifier) == 0
+    assert ("HEAD", "page") not in host.requests
@@ -0,0 +1,137 @@
+import asyncio
+import sys
+import os
+import time
+
+import discord
+
+from imposter import *
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import issues
+import utils
+
+
+def test_cache_hit():
+    gh = ImposterGithub()
+    cache = issues.IssueCache(gh, ttl=60, size=8)
+
+    assert cache.get("test", "test", 1).title == "Issue 1"
+    assert cache.get("test", "test", 1).title == "Issue 1"
+    assert cache.get("Test", "Test", 1).title == "Issue 1"
+    assert gh.repos["test/test"].requests == 1
+    assert cache.hits == 2
+    assert cache.misses == 1
+
+
+def test_cache_eviction():
+    gh = ImposterGithub()
+    cache = issues.IssueCache(gh, ttl=60, size=2)
+
+    cache.get("test", "test", 1)
+    cache.get("test", "test", 2)
+    cache.get("test", "test", 1)
+    cache.get("test", "test", 3)  # Evicts 2, the least recently used
+    cache.get("test", "test", 1)
+    assert gh.repos["test/test"].requests == 3
+    cache.get("test", "test", 2)
+    assert gh.repos["test/test"].requests == 4
+
+
+def test_cache_revalidate():
+    gh = ImposterGithub()
+    cache = issues.IssueCache(gh, ttl=0, size=8)
+
+    cache.get("test", "test", 1)
+    issue = gh.repos["test/test"].issues[1]
+
+    # Not modified
+    assert cache.get("test", "test", 1).title == "Issue 1"
+    assert issue.updates == 1
+
+    # Modified
+    issue.title = "Renamed"
+    issue.modified = True
+    assert cache.get("test", "test", 1).title == "Renamed"
+    assert issue.updates == 2
+    assert cache.revalidations == 2
+    assert gh.repos["test/test"].requests == 1
+
+
+def test_fetcher_multiple():
+    gh = ImposterGithub()
+    fetcher = issues.IssueFetcher(issues.IssueCache(gh, ttl=60, size=8), workers=2)
+
+    refs = [("test", "test", i) for i in range(5)]
+
+    async def run():
+        try:
+            return await utils.generate_gh_embed_multiple(refs, fetcher)
+        finally:
+            await fetcher.close()
+    embed = asyncio.run(run())
+
+    # Four fields per issue, in the order they were referenced
+    assert len(embed.fields) == 20
+    assert [f.value for f in embed.fields[1::4]] == [f"Issue {i}" for i in range(5)]
+    assert gh.repos["test/test"].requests == 5
+
+
+def test_fetcher_coalesce():
+    gh = ImposterGithub()
+    gh.get_repo("test/test").delay = 0.05
+    fetcher = issues.IssueFetcher(issues.IssueCache(gh, ttl=60, size=8), workers=4)
+
+    async def run():
+        try:
+            return await asyncio.gather(*[fetcher.get("test", "test", 1) for _ in range(20)])
+        finally:
+            await fetcher.close()
+    infos = asyncio.run(run())
+
+    assert all(info.title == "Issue 1" for info in infos)
+    assert gh.repos["test/test"].requests == 1
+
+
+def test_rate_limiter():
+    now = [1000.0]
+    limiter = issues.RateLimiter(burst=2, reserve=10, clock=lambda: now[0])
+    assert all(limiter.acquire() for _ in range(5))  # Nothing known yet
+
+    # 110 remaining, 10 kept back, over 100 seconds: one request per second
+    limiter.update(110, 5000, 1100.0)
+    assert limiter.acquire()
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    now[0] += 1.5
+    assert limiter.acquire()
+    assert not limiter.acquire()
+
+    # Only the reserve is left
+    limiter.update(10, 5000, 1100.0)
+    now[0] += 50
+    assert not limiter.acquire()
+
+    # The window reset
+    now[0] = 1100.0
+    assert limiter.acquire()
+
+
+def test_rate_limited_link():
+    gh = ImposterGithub()
+    gh.rate_limiting_resettime = time.time() + 3600
+    limiter = issues.RateLimiter(burst=1, reserve=0)
+    cache = issues.IssueCache(gh, ttl=0, size=8, limiter=limiter)
+
+    assert cache.get("test", "test", 1).title == "Issue 1"
+    limiter.exhaust()
+    info = cache.get("test", "test", 2)
+    assert info.is_link
+    assert info.html_url == "https://github.com/test/test/issues/2"
+    # Stale entries are still revalidated, 304s do not count against the limit
+    assert cache.get("test", "test", 1).title == "Issue 1"
+    assert gh.repos["test/test"].requests == 1
+
+    embed = discord.Embed()
+    utils.generate_gh_embed_snippet(embed, info)
+    assert [f.name for f in embed.fields] == ["Link"]
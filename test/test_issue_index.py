@@ -0,0 +1,128 @@
+import asyncio
+import sys
+import os
+import tempfile
+
+import aiohttp
+import github
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import issues
+
+from fake_servers import FakeGitHub
+
+
+def _fake(count: int) -> FakeGitHub:
+    fake = FakeGitHub()
+    for i in range(1, count + 1):
+        fake.add_issue("test", "test", i, f"Issue {i}")
+    fake.add_issue("test", "other", 1, "Another repository")
+    return fake
+
+
+def test_index_sync():
+    fake = _fake(250)
+
+    async def run():
+        await fake.start()
+        index = issues.IssueIndex("test", "test", "token", fake.url)
+        try:
+            async with aiohttp.ClientSession() as session:
+                # The first sync pages through everything
+                assert await index.sync(session) == 250
+                assert fake.list_requests == 3
+                assert len(index) == 250
+                assert index.get("Test", "Test", 42).title == "Issue 42"
+                assert index.get("test", "other", 1) is None
+
+                # Nothing changed, the newest issue is listed again once, then the page is not modified
+                assert await index.sync(session) == 0
+                assert await index.sync(session) == 0
+                assert fake.list_requests == 5
+
+                # Only the updated issues are listed
+                fake.add_issue("test", "test", 7, "Renamed", state="closed")
+                fake.add_issue("test", "test", 251, "New issue")
+                assert await index.sync(session) == 2
+                assert fake.list_requests == 6
+                assert index.get("test", "test", 7).title == "Renamed"
+                assert index.get("test", "test", 7).state == "closed"
+                assert index.get("test", "test", 251).title == "New issue"
+        finally:
+            await fake.stop()
+    asyncio.run(run())
+
+
+def test_index_search():
+    index = issues.IssueIndex("test", "test")
+    titles = ["Crash when rendering", "Render crashes on startup", "Add sky model", "Sky is black", "Prerender sky"]
+    for number, title in enumerate(titles, 1):
+        index._add({"number": number, "html_url": f"https://github.com/test/test/issues/{number}", "title": title,
+                    "state": "open", "user": {"login": "octocat"}, "body": None,
+                    "updated_at": f"2024-01-01T00:00:0{number}Z"})
+    index._rebuild()
+
+    # Titles starting with the query, then word starts, then anywhere, newer first within each
+    assert [n for n, _ in index.search("render")] == [2, 1, 5]
+    assert [n for n, _ in index.search("sky")] == [4, 5, 3]
+    assert [n for n, _ in index.search("crash render")] == [2, 1]
+    assert [n for n, _ in index.search("#3")] == [3]
+    assert [n for n, _ in index.search("", limit=2)] == [5, 4]
+    assert index.search("nothing like it") == []
+    assert index.search("sky", limit=1) == [(4, "Sky is black")]
+
+
+def test_index_fetcher():
+    fake = _fake(5)
+
+    async def run():
+        await fake.start()
+        index = issues.IssueIndex("test", "test", "token", fake.url)
+        gh = github.Github(login_or_token="token", base_url=fake.url)
+        fetcher = issues.IssueFetcher(issues.IssueCache(gh, ttl=60, size=8), index=index)
+        try:
+            # Before the first sync lookups go to GitHub
+            assert (await fetcher.get("test", "test", 1)).title == "Issue 1"
+            assert fake.rest_requests == 1
+            await index.sync(fetcher._get_session())
+            infos = await fetcher.get_many([("test", "test", i) for i in range(2, 6)])
+            assert [info.title for info in infos] == [f"Issue {i}" for i in range(2, 6)]
+            assert (await fetcher.get("test", "other", 1)).title == "Another repository"
+            assert fake.rest_requests == 2
+        finally:
+            await fetcher.close()
+            await fake.stop()
+    asyncio.run(run())
+
+
+def test_index_snapshot():
+    fake = _fake(150)
+
+    async def run():
+        await fake.start()
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "issues.json")
+                async with aiohttp.ClientSession() as session:
+                    index = issues.IssueIndex("test", "test", "token", fake.url, path=path)
+                    await index.sync(session)
+                    index.save()
+                    assert fake.list_requests == 2
+
+                    # A restarted index searches the snapshot before syncing, then only asks what changed
+                    restarted = issues.IssueIndex("test", "test", "token", fake.url, path=path)
+                    restarted.load()
+                    assert len(restarted) == 150
+                    assert restarted.search("Issue 149")[0] == (149, "Issue 149")
+                    assert restarted.get("test", "test", 149) is None
+                    assert await restarted.sync(session) == 0
+                    assert fake.list_requests == 3
+                    assert restarted.get("test", "test", 149).title == "Issue 149"
+
+                    # Another repository's snapshot is ignored
+                    other = issues.IssueIndex("test", "other", "token", fake.url, path=path)
+                    other.load()
+                    assert len(other) == 0
+        finally:
+            await fake.stop()
+    asyncio.run(run())
@@ -0,0 +1,67 @@
+import io
+import json
+import logging
+import sys
+import os
+import threading
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import log
+
+
+class _Formatted:
+    """ Records the threads it was formatted on. """
+
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread())
+        return "formatted"
+
+
+def _log(level: int, json_format: bool, function) -> str:
+    root = logging.getLogger()
+    handlers, root_level = root.handlers[:], root.level
+    stream = io.StringIO()
+    listener = log.setup_logging(level, json_format, stream)
+    try:
+        function(logging.getLogger("test"))
+    finally:
+        listener.stop()
+        root.handlers[:] = handlers
+        root.setLevel(root_level)
+    return stream.getvalue()
+
+
+def test_json_lines():
+    def function(logger):
+        logger.info("Removing message %s: %s", 1, "free \"nitro\"", extra={"message_id": 1, "rule": "nitro"})
+        try:
+            raise ValueError("bad")
+        except ValueError:
+            logger.exception("Failed")
+
+    first, second = [json.loads(line) for line in _log(logging.INFO, True, function).splitlines()]
+    assert first["level"] == "INFO"
+    assert first["logger"] == "test"
+    assert first["message"] == "Removing message 1: free \"nitro\""
+    assert first["message_id"] == 1
+    assert first["rule"] == "nitro"
+    assert first["time"].endswith("+00:00")
+    assert second["level"] == "ERROR"
+    assert "ValueError: bad" in second["exception"]
+
+
+def test_lazy_formatting():
+    argument = _Formatted()
+
+    def function(logger):
+        logger.debug("Message %s", argument)
+        logger.info("Message %s", argument)
+
+    output = _log(logging.INFO, False, function)
+    # The disabled level never formats, the enabled one formats on the listener thread
+    assert output.count("Message formatted") == 1
+    assert len(argument.threads) == 1
+    assert argument.threads[0] is not threading.current_thread()
@@ -0,0 +1,34 @@
+import sys
+import os
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import utils
+
+
+def test_urls():
+    analysis = utils.MessageAnalysis("look https://Example.ORG/Pic.PNG and http:///nohost")
+    assert analysis.hosts == ["example.org"]
+    assert utils.MessageAnalysis("https://user:pw@Evil.COM:8080/x").hosts == ["evil.com"]
+    assert analysis.paths == ["/pic.png", "/nohost"]
+    # Memoized
+    assert analysis.urls is analysis.urls
+
+    assert utils.MessageAnalysis("no links here").urls == []
+
+
+def test_gh_refs():
+    refs = utils.MessageAnalysis("see #12, chunky-dev/chunky#3 and \\#4").gh_refs
+    assert [(r[0], r[2], r[3], r[4]) for r in refs] == \
+        [("", "", "", "12"), ("", "chunky-dev", "chunky", "3"), ("\\", "", "", "4")]
+    assert utils.MessageAnalysis("nothing").gh_refs == []
+
+    # References straight after another one are kept, but a name only starts at the start of a word,
+    # so the "a" in "Issue#5a#6" is not a repository and #6 goes to the default one
+    refs = utils.MessageAnalysis("#12#13 Issue#5a#6").gh_refs
+    assert [(r[3], r[4]) for r in refs] == [("", "12"), ("", "13"), ("Issue", "5"), ("", "6")]
+
+
+def test_mentions_everyone():
+    assert utils.MessageAnalysis("hey @everyone").mentions_everyone
+    assert utils.MessageAnalysis("@here look").mentions_everyone
+    assert not utils.MessageAnalysis("user@example.org").mentions_everyone
@@ -0,0 +1,44 @@
+import sys
+import os
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import metrics
+
+
+def test_counter():
+    counter = metrics.Counter("test_counter_total", "Test counter.", ["reason"])
+    counter.inc("a")
+    counter.inc("a")
+    counter.inc("b\"", amount=3)
+    assert counter.render() == "\n".join([
+        "# HELP test_counter_total Test counter.",
+        "# TYPE test_counter_total counter",
+        "test_counter_total{reason=\"a\"} 2",
+        "test_counter_total{reason=\"b\\\"\"} 3",
+    ])
+
+
+def test_gauge():
+    gauge = metrics.Gauge("test_gauge", "Test gauge.", ["list"])
+    gauge.set(1.5, "set")
+    gauge.set_function(lambda: 7, "function")
+    gauge.set_function(lambda: None, "unknown")
+    assert gauge.render().splitlines()[2:] == [
+        "test_gauge{list=\"set\"} 1.5",
+        "test_gauge{list=\"function\"} 7",
+    ]
+
+
+def test_histogram():
+    histogram = metrics.Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    assert histogram.render().splitlines()[2:] == [
+        "test_seconds_bucket{le=\"0.1\"} 1",
+        "test_seconds_bucket{le=\"1\"} 2",
+        "test_seconds_bucket{le=\"+Inf\"} 3",
+        "test_seconds_sum 5.55",
+        "test_seconds_count 3",
+    ]
+    assert "# TYPE test_seconds histogram" in metrics.REGISTRY.render()
@@ -0,0 +1,69 @@
+import asyncio
+import sys
+import os
+
+from imposter import *
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import issues
+import main
+import utils
+
+RENDERS = 10
+COMMANDS = 99
+
+
+class _OrderedMessage(ImposterMessage):
+    """ Records how many log embeds were queued when it was deleted. """
+
+    queued_at_delete = None
+
+    async def delete(self, delay=None):
+        self.queued_at_delete = main.BOT_LOG.queue_depth()
+        await super().delete(delay)
+
+
+def test_image_only_moderation():
+    async def run():
+        fetcher = issues.IssueFetcher(issues.IssueCache(ImposterGithub()))
+        bot = main.Bot(fetcher, "test", "test", [(RENDERS, "Only images here!")], utils.BlockMatcher([]), None)
+        bot._connection.user = ImposterUser(1000, "bot")
+        renders = ImposterChannel(RENDERS)
+        commands = ImposterChannel(COMMANDS)
+        bot.http = ImposterHttp({c.id: c for c in (renders, commands)})
+        author = ImposterUser(5)
+        messages = [_OrderedMessage(f"no image {i}", author, renders, 100 + i) for i in range(2)]
+        command = ImposterMessage("!bot timings", ImposterUser(6), commands, 200)
+        try:
+            for message in messages:
+                await bot.on_message(message)
+            depth = main.BOT_LOG.queue_depth()
+            await bot.on_message(command)
+        finally:
+            await fetcher.close()
+            while main.BOT_LOG.queue_depth() > 0:
+                main.BOT_LOG._queue.get_nowait()
+        return messages, renders, command, depth
+
+    main.DELETE_BLOCKED_MESSAGES.set(True)
+    main.BOT_LOG.set_channels([COMMANDS])
+    try:
+        messages, renders, command, depth = asyncio.run(run())
+    finally:
+        main.DELETE_BLOCKED_MESSAGES.set(False)
+        main.BOT_LOG.set_channels([])
+
+    # Each message is deleted before its log embed is queued
+    assert [m.deleted for m in messages] == [True, True]
+    assert [m.queued_at_delete for m in messages] == [0, 1]
+    assert depth == 2
+
+    # The warning is sent to the channel, a reply would point at a deleted message
+    assert renders.sent == ["<@5> Only images here!"] * 2
+    assert [m.replies for m in messages] == [[], []]
+
+    # Both deletes and warnings were timed
+    timings = command.replies[0].content
+    assert timings.startswith("Time after receiving the message")
+    assert "delete:" in timings and "warn:" in timings
+    assert timings.count("(2 samples)") == 2
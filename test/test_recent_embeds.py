@@ -0,0 +1,62 @@
+import asyncio
+import sys
+import os
+
+from imposter import *
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import issues
+import main
+import utils
+
+
+def test_window():
+    now = [0.0]
+    recent = utils.RecentEmbeds(60, clock=lambda: now[0])
+    recent.add(1, [("test", "test", 1), ("test", "test", 2)], 100)
+    assert recent.get(1, ("Test", "test", "1")) == 100
+    assert recent.get(2, ("test", "test", 1)) is None
+
+    now[0] = 30
+    recent.add(1, [("test", "test", 1)], 101)
+    now[0] = 70
+    assert recent.get(1, ("test", "test", 1)) == 101
+    assert recent.get(1, ("test", "test", 2)) is None
+    assert len(recent) == 1
+
+    recent.forget(101)
+    assert recent.get(1, ("test", "test", 1)) is None
+    assert len(recent) == 0
+
+
+def test_bounded():
+    recent = utils.RecentEmbeds(60, size=2)
+    recent.add(1, [("test", "test", 1), ("test", "test", 2), ("test", "test", 3)], 100)
+    assert recent.get(1, ("test", "test", 1)) is None
+    assert recent.get(1, ("test", "test", 3)) == 100
+    recent.forget(100)
+    assert len(recent) == 0
+
+
+def test_on_message_dedup():
+    async def run():
+        fetcher = issues.IssueFetcher(issues.IssueCache(ImposterGithub()))
+        bot = main.Bot(fetcher, "test", "test", [], utils.BlockMatcher([]), None,
+                       recent_embeds=utils.RecentEmbeds(60), dedup_pointer=True)
+        bot._connection.user = ImposterUser(1000, "bot")
+        channel = ImposterChannel(10)
+        try:
+            messages = [ImposterMessage(content, channel=channel, message_id=i)
+                        for i, content in enumerate(["see #1", "#1 again", "#1 and #2"])]
+            for message in messages:
+                await bot.on_message(message)
+        finally:
+            await fetcher.close()
+        return messages
+
+    first, repeated, partial = asyncio.run(run())
+    assert len(first.replies[0].embeds) == 1
+    assert repeated.replies[0].embeds == []
+    assert repeated.replies[0].content.startswith("Linked above: https://discord.com/channels/@me/10/")
+    # Only the new reference is embedded
+    assert partial.replies[0].embeds[0].title.endswith("/issues/2")
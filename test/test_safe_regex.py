@@ -0,0 +1,122 @@
+import asyncio
+import random
+import sys
+import os
+import time
+
+import pytest
+
+from imposter import *
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import issues
+import main
+import safe_regex
+import utils
+
+SAFE = [
+    r".*free nitro",
+    r"(steam|stearn)community",
+    r"https?://(www\.)?\w+\.(com|gift|ru)",
+    r".*discord\.gift/\w+",
+    r"\d+-\d+-\d+",
+    r"(?i)free\s+nitro",
+    r"(\d{1,3}\.){3}\d{1,3}",
+]
+PATHOLOGICAL = [
+    r"(a+)+$",
+    r"(\w+\s?)*$",
+    r"(x+x+)+y",
+    r"(.*,){5}x",
+    r".*a.*b.*c",
+    r"((\w+) \2)*",
+    r"(a|a?)+!",
+    r"(?:.{1,10}){1,10}x",
+]
+
+
+def _adversarial(rng: random.Random, length: int) -> str:
+    """ Long runs of few characters, the inputs backtracking engines are slowest on. """
+    alphabet = rng.choice(["a", "a-", "ab", "a/", "a#", "1,", " a", "x"]) + rng.choice(["", "#", "!", "/", "\\\\"])
+    text = "".join(rng.choice(alphabet) for _ in range(length))
+    return text + rng.choice(["", "!", "#", "#x", "#1"])
+
+
+def test_risk():
+    for regex in SAFE:
+        assert safe_regex.risk(regex) is None, regex
+    for regex in PATHOLOGICAL:
+        assert safe_regex.risk(regex) is not None, regex
+
+
+def test_fuzz_linear():
+    # Unflagged rules and GH_REGEX stay fast on the inputs that take the old GH_REGEX over 100 ms
+    rng = random.Random(0)
+    matcher = utils.BlockMatcher([(str(i), regex) for i, regex in enumerate(SAFE)])
+    worst = 0.0
+    for _ in range(200):
+        text = _adversarial(rng, rng.randint(1000, 4000))
+        start = time.perf_counter()
+        utils.GH_REGEX.findall(text)
+        matcher.match(text)
+        worst = max(worst, time.perf_counter() - start)
+    assert worst < 0.05
+
+
+def test_isolated():
+    rules = [("safe", r"spam"), ("evil", r"(a+)+$")]
+    assert [name for name, _ in utils.BlockMatcher(rules, "reject").flagged] == ["evil"]
+    assert utils.BlockMatcher(rules, "allow").match("aaa") == "evil"
+    with pytest.raises(ValueError):
+        utils.BlockMatcher(rules, "ignore")
+
+    async def run():
+        matcher = utils.BlockMatcher(rules, "isolate", timeout=0.5)
+        try:
+            assert matcher.isolated
+            assert matcher.match("aaa") is None
+            assert matcher.match("spam") == "safe"
+            assert await matcher.match_isolated("aaa") == "evil"
+            assert await matcher.match_isolated("b") is None
+
+            start = time.perf_counter()
+            with pytest.raises(asyncio.TimeoutError):
+                await matcher.match_isolated("a" * 40 + "!")
+            assert time.perf_counter() - start < 2
+
+            # The worker is started again
+            assert await matcher.match_isolated("aaaa") == "evil"
+        finally:
+            await matcher.close()
+
+    asyncio.run(run())
+
+
+def test_on_message_worker_failure():
+    async def failed(text):
+        raise RuntimeError("The regex worker exited")
+
+    async def run():
+        matcher = utils.BlockMatcher([("evil", r"(a+)+$")], "isolate")
+        matcher._worker.match = failed
+        fetcher = issues.IssueFetcher(issues.IssueCache(ImposterGithub()))
+        bot = main.Bot(fetcher, "test", "test", [], matcher, None)
+        bot._connection.user = ImposterUser(1000, "bot")
+        message = ImposterMessage("aaaa", message_id=100)
+        try:
+            # Flagged like a timeout instead of escaping on_message
+            await bot.on_message(message)
+            depth = main.BOT_LOG.queue_depth()
+        finally:
+            await fetcher.close()
+            while main.BOT_LOG.queue_depth() > 0:
+                main.BOT_LOG._queue.get_nowait()
+        return message, depth
+
+    main.DELETE_BLOCKED_MESSAGES.set(True)
+    try:
+        message, depth = asyncio.run(run())
+    finally:
+        main.DELETE_BLOCKED_MESSAGES.set(False)
+    assert not message.deleted
+    assert depth == 1
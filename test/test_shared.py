@@ -0,0 +1,84 @@
+import os
+import sys
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import shared
+import utils
+
+
+def test_domain_index(tmp_path):
+    path = str(tmp_path / "block.idx")
+    domains = [f"spam{i}.com" for i in range(1000)] + ["Evil.Gift ", ""]
+    shared.DomainIndex.write(path, domains)
+
+    index = shared.DomainIndex(path)
+    assert len(index) == 1001
+    assert all(f"spam{i}.com" in index for i in range(1000))
+    assert "evil.gift" in index
+    assert "spam1000.com" not in index
+    assert "" not in index
+    assert not index.changed()
+
+    shared.DomainIndex.write(path, ["other.com"])
+    assert index.changed()
+    # The old mapping stays readable until it is closed
+    assert "spam1.com" in index
+    index.close()
+
+    empty = str(tmp_path / "empty.idx")
+    shared.DomainIndex.write(empty, [])
+    assert "spam1.com" not in shared.DomainIndex(empty)
+
+
+def test_follow_shared_list(tmp_path):
+    path = str(tmp_path / "block.idx")
+    follower = utils.UrlListKeeper("", path)
+    assert not follower.load_shared()
+
+    shared.DomainIndex.write(path, ["evil.com"])
+    assert follower.load_shared()
+    assert follower.match_host("www.evil.com")
+    assert not follower.load_shared()
+
+    # Replaced by the process that downloads the lists
+    shared.DomainIndex.write(path, ["bad.co.uk"])
+    os.utime(path, ns=(0, 0))
+    assert follower.load_shared()
+    assert follower.match_host("login.bad.co.uk")
+    assert not follower.match_host("evil.com")
+
+
+def test_shared_flag(tmp_path):
+    path = str(tmp_path / "spam_enabled")
+    first = shared.SharedFlag(True)
+    first.attach(path)
+    # A process started later keeps the current value, not its own default
+    second = shared.SharedFlag(False)
+    second.attach(path)
+    assert second.get()
+
+    second.set(False)
+    assert not first.get()
+    first.set(True)
+    assert second
+
+
+def test_shared_flag_config(tmp_path):
+    path = str(tmp_path / "spam_enabled")
+
+    def start(config: bool) -> shared.SharedFlag:
+        flag = shared.SharedFlag(False)
+        flag.attach(path)
+        flag.set_from_config(config)
+        return flag
+
+    assert start(True).get()
+    # `!bot spam off` outlives a restart with the same config
+    start(True).set(False)
+    assert not start(True).get()
+    # A changed config applies once, then the toggle is kept again
+    assert not start(False).get()
+    start(False).set(True)
+    assert start(False).get()
+    assert start(True).get()
+    assert not start(False).get()
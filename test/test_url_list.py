@@ -0,0 +1,153 @@
+import asyncio
+import sys
+import os
+import urllib.parse
+from typing import Tuple
+
+import aiohttp
+import aiohttp.web
+
+sys.path.insert(1, os.path.join(sys.path[0], '../src'))
+import utils
+
+
+def _create_keeper(domains) -> utils.UrlListKeeper:
+    keeper = utils.UrlListKeeper("")
+    keeper._lists = frozenset(domains)
+    return keeper
+
+
+def test_match():
+    keeper = _create_keeper(["evil.com", "bad.co.uk"])
+
+    assert keeper.match(urllib.parse.urlparse("https://evil.com/free-nitro"))
+    assert keeper.match(urllib.parse.urlparse("https://www.evil.com"))
+    assert keeper.match(urllib.parse.urlparse("https://a.b.c.evil.com/"))
+    assert keeper.match(urllib.parse.urlparse("http://login.bad.co.uk"))
+    # Ports, user info and case don't hide the host
+    assert keeper.match(urllib.parse.urlparse("https://evil.com:8080"))
+    assert keeper.match(urllib.parse.urlparse("https://x@evil.com"))
+    assert keeper.match(urllib.parse.urlparse("https://user:pw@WWW.Evil.com:443/nitro"))
+
+    assert not keeper.match(urllib.parse.urlparse("https://notevil.com"))
+    assert not keeper.match(urllib.parse.urlparse("https://evil.com.example.org"))
+    assert not keeper.match(urllib.parse.urlparse("https://co.uk"))
+    assert not keeper.match(urllib.parse.urlparse("https://com"))
+    assert not keeper.match(urllib.parse.urlparse("not a url"))
+
+
+async def _serve_list(handler) -> Tuple[aiohttp.web.AppRunner, str]:
+    app = aiohttp.web.Application()
+    app.router.add_get("/list.json", handler)
+    runner = aiohttp.web.AppRunner(app)
+    await runner.setup()
+    site = aiohttp.web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/list.json"
+
+
+def test_update_conditional():
+    requests = []
+
+    async def handler(request: aiohttp.web.Request):
+        requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return aiohttp.web.Response(status=304)
+        return aiohttp.web.json_response({"domains": [" evil.com ", "Bad.NET"]}, headers={"ETag": '"v1"'})
+
+    async def run():
+        runner, url = await _serve_list(handler)
+        keeper = utils.UrlListKeeper(url)
+        try:
+            async with aiohttp.ClientSession() as session:
+                assert await keeper.update(session)
+                lists = keeper._lists
+                assert not await keeper.update(session)
+                assert keeper._lists is lists
+        finally:
+            await runner.cleanup()
+        return keeper
+
+    keeper = asyncio.run(run())
+    assert requests == [None, '"v1"']
+    assert len(keeper) == 2
+    assert keeper.updated is not None
+    assert keeper.match(urllib.parse.urlparse("https://www.evil.com"))
+    # Entries are lowercased like hosts, as they are in the shared index
+    assert keeper.match(urllib.parse.urlparse("https://login.bad.net"))
+
+
+def test_snapshot_restart(tmp_path):
+    requests = []
+
+    async def handler(request: aiohttp.web.Request):
+        requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return aiohttp.web.Response(status=304)
+        return aiohttp.web.json_response({"domains": ["evil.com"]}, headers={"ETag": '"v1"'})
+
+    path = str(tmp_path / "block.idx")
+
+    async def run():
+        runner, url = await _serve_list(handler)
+        try:
+            async with aiohttp.ClientSession() as session:
+                assert await utils.UrlListKeeper(url, path).update(session)
+
+                # After a restart the snapshot is mapped before any request and only revalidated
+                restarted = utils.UrlListKeeper(url, path)
+                assert restarted.load_shared()
+                assert restarted.match_host("www.evil.com")
+                assert not await restarted.update(session)
+                assert restarted.match_host("www.evil.com")
+
+                # A snapshot of another list is not used
+                other = utils.UrlListKeeper(url + "?other", path)
+                assert not other.load_shared()
+                assert len(other) == 0
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+    assert requests == [None, '"v1"']
+
+
+def test_snapshot_write_fails(tmp_path):
+    requests = []
+
+    async def handler(request: aiohttp.web.Request):
+        requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return aiohttp.web.Response(status=304)
+        return aiohttp.web.json_response({"domains": ["evil.com"]}, headers={"ETag": '"v1"'})
+
+    # The snapshot directory is missing, so every write fails until it is created
+    directory = tmp_path / "state"
+    path = str(directory / "block.idx")
+
+    async def run():
+        runner, url = await _serve_list(handler)
+        keeper = utils.UrlListKeeper(url, path)
+        try:
+            async with aiohttp.ClientSession() as session:
+                task = asyncio.create_task(keeper.run(session, interval=60.0, retry=0.01))
+                while len(requests) < 3:
+                    await asyncio.sleep(0.01)
+                assert not task.done()
+                assert len(keeper) == 0
+
+                directory.mkdir()
+                while len(keeper) == 0:
+                    await asyncio.sleep(0.01)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        finally:
+            await runner.cleanup()
+        return keeper
+
+    keeper = asyncio.run(asyncio.wait_for(run(), 10))
+    assert keeper.match_host("www.evil.com")
+    assert os.path.exists(path)
+    # Failed writes are downloaded again, not revalidated
+    assert set(requests) == {None}